@@ -0,0 +1,146 @@
+"""
+文档分块基准测试
+
+对比 FileProcessor.split_text（固定1000字符窗口、200字符重叠）与 TokenChunker
+（按token计数、按段落/句子/章节边界切分）的分块数量、向量化耗时与检索命中率。
+命中率的查询为从文档中随机抽取的句子，检索结果的前k个分块中包含该完整句子即记为命中。
+不指定 --model 且 models/embedded 不存在时使用哈希词袋向量，无需下载模型即可运行：
+
+    python benchmarks/bench_chunker.py
+    python benchmarks/bench_chunker.py --file database/paper.pdf --model models/embedded --top-k 4
+"""
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from utils.chunker import TokenChunker, SENTENCE_BREAK, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+TOPICS = ["attention", "convolution", "retrieval", "tokenization", "quantization", "distillation"]
+TOKEN_PATTERN = re.compile(r"[一-鿿]|\w+|[^\w\s]")
+
+class HashingEmbeddings:
+    """哈希词袋向量，仅用于无模型时的对比测试"""
+
+    def __init__(self, size: int = 512):
+        self.size = size
+
+    def embed_documents(self, texts):
+        vectors = np.zeros((len(texts), self.size), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                digest = hashlib.md5(token.encode("utf-8")).digest()
+                vectors[row, int.from_bytes(digest[:4], "little") % self.size] += 1.0
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def build_synthetic_pages(num_pages: int):
+    """生成带章节标题、中英文混排句子的多页文档，每个句子内容唯一"""
+    rng = random.Random(0)
+    pages = []
+    fact = 0
+    for page in range(num_pages):
+        lines = [f"{page + 1} Section on {TOPICS[page % len(TOPICS)].title()}", ""]
+        for _ in range(4):
+            sentences = []
+            for _ in range(rng.randint(3, 6)):
+                fact += 1
+                topic = rng.choice(TOPICS)
+                if rng.random() < 0.3:
+                    sentences.append(f"实验{fact}表明{topic}方法在数据集{rng.randint(1, 99)}上提升了{rng.randint(1, 30)}个百分点。")
+                else:
+                    sentences.append(
+                        f"Experiment {fact} shows that {topic} with setting {rng.randint(1, 999)} "
+                        f"improves accuracy by {rng.randint(1, 30)} points on benchmark {rng.randint(1, 99)}."
+                    )
+            lines.append(" ".join(sentences))
+            lines.append("")
+        pages.append("\n".join(lines))
+    return pages
+
+def sample_queries(pages, count: int):
+    rng = random.Random(1)
+    sentences = []
+    for text in pages:
+        for paragraph in text.split("\n\n"):
+            sentences.extend(s.strip() for s in SENTENCE_BREAK.split(paragraph) if len(s.strip()) > 20)
+    return rng.sample(sentences, min(count, len(sentences)))
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def evaluate(name, chunks, embeddings, queries, top_k):
+    start = time.monotonic()
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    embed_time = time.monotonic() - start
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    normalized_chunks = [normalize(chunk) for chunk in chunks]
+    hits = 0
+    for query in queries:
+        query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) + 1e-12
+        top = np.argsort(-(vectors @ query_vector))[:top_k]
+        target = normalize(query)
+        hits += any(target in normalized_chunks[i] for i in top)
+
+    total_chars = sum(len(chunk) for chunk in chunks)
+    print(
+        f"{name:<12} chunks={len(chunks):<5} chars={total_chars:<8} "
+        f"embed={embed_time:.2f}s hit@{top_k}={hits / len(queries):.3f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document chunking")
+    parser.add_argument("--file", help="待测试的文档（.pdf/.txt/.docx），不指定时生成合成文档")
+    parser.add_argument("--model", default="models/embedded", help="embedding模型目录")
+    parser.add_argument("--pages", type=int, default=20, help="合成文档页数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    if args.file:
+        from utils.file_processor import FileProcessor
+        pages = FileProcessor.load_document(args.file)
+    else:
+        pages = build_synthetic_pages(args.pages)
+
+    if os.path.isdir(args.model):
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=args.model)
+        chunker = TokenChunker.from_tokenizer(
+            embeddings.client.tokenizer,
+            chunk_tokens=min(args.chunk_tokens, embeddings.client.max_seq_length - 2),
+            overlap_tokens=args.overlap_tokens
+        )
+    else:
+        print(f"{args.model} not found, using hashing embeddings")
+        embeddings = HashingEmbeddings()
+        chunker = TokenChunker(
+            lambda text: len(TOKEN_PATTERN.findall(text)),
+            chunk_tokens=args.chunk_tokens,
+            overlap_tokens=args.overlap_tokens
+        )
+
+    queries = sample_queries(pages, args.queries)
+    print(f"{len(pages)} pages, {len(queries)} queries")
+
+    # 与FileProcessor.split_text(text, 1000, 200)相同，避免测试依赖langchain文档加载器
+    char_chunks = [text[i:i + 1000] for text in pages for i in range(0, len(text), 800)]
+    token_chunks = [chunk["text"] for chunk in chunker.iter_chunks(pages)]
+
+    evaluate("split_text", char_chunks, embeddings, queries, args.top_k)
+    evaluate("TokenChunker", token_chunks, embeddings, queries, args.top_k)
+
+if __name__ == "__main__":
+    main()
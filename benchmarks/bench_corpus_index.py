@@ -0,0 +1,93 @@
+"""
+全文库索引基准测试
+
+生成聚类分布的合成向量（每个文档若干分块），按规模写入 CorpusIndex，
+以精确检索（IndexFlatIP）的结果为基准，测量IVF检索的 recall@k 与延迟，
+以及限定单个文档时的过滤检索延迟：
+
+    python benchmarks/bench_corpus_index.py
+    python benchmarks/bench_corpus_index.py --sizes 10000 100000 1000000 --nprobe 8 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+from utils.corpus_index import CorpusIndex
+
+def synthetic_vectors(count: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=count)] + 0.6 * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def percentile(latencies, q):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def timed(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark corpus index search latency and recall")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000], help="分块总数")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunks-per-doc", type=int, default=40)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'index':>10} {'build_s':>8} {'mean_ms':>8} {'p95_ms':>7} {'recall@' + str(args.k):>10}")
+    for size in args.sizes:
+        rng = np.random.default_rng(size)
+        vectors = synthetic_vectors(size, args.dim, max(16, size // 500), rng)
+        queries = vectors[rng.integers(0, size, size=args.queries)] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+        flat = faiss.IndexFlatIP(args.dim)
+        flat.add(vectors)
+        _, latencies = timed(lambda q: flat.search(q.reshape(1, -1), args.k), queries)
+        truth = flat.search(queries / np.linalg.norm(queries, axis=1, keepdims=True), args.k)[1]
+        print(f"{size:>8} {'flat':>10} {'-':>8} {statistics.mean(latencies):>8.2f} {percentile(latencies, 0.95):>7.2f} {1.0:>10.3f}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index = CorpusIndex(tmp, embeddings=object(), nlist=args.nlist)
+            start = time.perf_counter()
+            # 不输出逐个文档的写入日志
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                for doc, offset in enumerate(range(0, size, args.chunks_per_doc)):
+                    batch = vectors[offset:offset + args.chunks_per_doc]
+                    index.add_chunks(f"doc{doc}", [f"{doc}:{i}" for i in range(len(batch))], [{}] * len(batch), batch)
+            build_time = time.perf_counter() - start
+
+            for nprobe in args.nprobe:
+                index.nprobe = nprobe
+                results, latencies = timed(lambda q: index.search_by_vector(q, args.k), queries)
+                hits = 0
+                for row, docs in enumerate(results):
+                    # 分块文本为 "文档序号:文档内序号"，换算回向量在合成数据中的位置
+                    found = {int(d.page_content.split(":")[0]) * args.chunks_per_doc + int(d.page_content.split(":")[1]) for d in docs}
+                    hits += len(found & set(truth[row].tolist()))
+                label = f"{index.stats()['index_type']}/{nprobe}"
+                print(f"{size:>8} {label:>10} {build_time:>8.1f} {statistics.mean(latencies):>8.2f} "
+                      f"{percentile(latencies, 0.95):>7.2f} {hits / (args.k * len(queries)):>10.3f}")
+
+            doc_ids = [[f"doc{int(rng.integers(0, size // args.chunks_per_doc))}"] for _ in queries]
+            _, latencies = timed(lambda q: index.search_by_vector(q, args.k, doc_ids.pop()), queries)
+            print(f"{size:>8} {'1 doc':>10} {'-':>8} {statistics.mean(latencies):>8.2f} {percentile(latencies, 0.95):>7.2f} {'-':>10}")
+            index.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+CrossRef检索缓存基准测试
+
+启动本地桩服务（benchmarks/crossref_stub.py），对比不带连接池与超时的逐次 requests.get
+和 CrossRefClient 的冷缓存、热缓存与近似查询延迟，并验证服务端间歇性503时的重试：
+
+    python benchmarks/bench_crossref.py
+    python benchmarks/bench_crossref.py --queries 50 --delay 0.05 --fail-every 7
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from crossref_stub import serve
+from utils.crossref import CrossRefClient, SELECT_FIELDS
+
+def timed(fn, items):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def report(name, latencies):
+    print(f"{name:<24} mean={statistics.mean(latencies):8.2f}ms  p95={sorted(latencies)[int(len(latencies) * 0.95) - 1]:8.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CrossRef lookups against a local stub")
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.02, help="桩服务的响应延迟（秒）")
+    parser.add_argument("--fail-every", type=int, default=0, help="每N个请求返回一次503")
+    args = parser.parse_args()
+
+    server, state = serve(delay=args.delay, fail_every=args.fail_every)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/works"
+    queries = [f'"topic {i}" AND "method {i % 5}"' for i in range(args.queries)]
+
+    def bare(query):
+        params = {"query": query, "rows": args.rows, "sort": "relevance", "select": SELECT_FIELDS}
+        response = requests.get(api_url, params=params)
+        response.raise_for_status()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = CrossRefClient(api_url=api_url, db_path=os.path.join(tmp, "crossref.db"))
+        search = lambda q: client.search_works(q, rows=args.rows)
+
+        print(f"queries={args.queries} rows={args.rows} delay={args.delay}s fail_every={args.fail_every}")
+        if not args.fail_every:
+            report("requests.get", timed(bare, queries))
+        report("client cold", timed(search, queries))
+        report("client warm", timed(search, queries))
+        # 大小写与空白不同的近似查询命中同一缓存
+        report("client near-duplicate", timed(search, ["  " + q.upper() + " " for q in queries]))
+        stats = client.stats()
+        client.close()
+
+    print(f"stub requests={state.requests}")
+    print(f"client stats={stats}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+embedding吞吐基准测试
+
+在参考语料上对比不同批大小、精度与进程数下 BatchedEmbeddings 的编码吞吐（chunks/s）。
+参考语料为 TokenChunker 对合成文档（或 --file 指定文档）的分块结果。
+另外以分块的首句为查询，多线程并发编码，对比逐条编码与经 QueryEmbeddingCache 合并编码（不缓存/缓存）的吞吐。
+--model 指定的目录不存在时在CPU上构建一个随机初始化的小型BERT，无需下载模型即可运行：
+
+    python benchmarks/bench_embedding.py
+    python benchmarks/bench_embedding.py --model models/embedded --device cuda --precisions fp32 fp16
+    python benchmarks/bench_embedding.py --precisions fp32 int8 --batch-sizes 16 64 --processes 1 4
+    python benchmarks/bench_embedding.py --queries 1024 --query-pool 128 --concurrency 32
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_chunker import build_synthetic_pages
+from utils.chunker import TokenChunker
+from utils.embeddings import BatchedEmbeddings, resolve_device, resolve_precision
+from utils.query_embeddings import QueryEmbeddingCache
+
+def build_tiny_model(path: str) -> str:
+    """构建随机初始化的小型BERT句向量模型"""
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, trainers
+    from transformers import BertConfig, BertModel, PreTrainedTokenizerFast # type: ignore
+    from sentence_transformers import SentenceTransformer, models as st_models
+
+    corpus = build_synthetic_pages(5)
+    tokenizer = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer()
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.train_from_iterator(corpus, trainers.WordPieceTrainer(
+        vocab_size=2000,
+        special_tokens=["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    ))
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="[UNK]", pad_token="[PAD]", cls_token="[CLS]", sep_token="[SEP]", mask_token="[MASK]"
+    )
+    config = BertConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=256,
+        intermediate_size=1024,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        max_position_embeddings=512
+    )
+    transformer_dir = os.path.join(path, "transformer")
+    BertModel(config).save_pretrained(transformer_dir)
+    tokenizer.save_pretrained(transformer_dir)
+
+    transformer = st_models.Transformer(transformer_dir, max_seq_length=256)
+    pooling = st_models.Pooling(transformer.get_word_embedding_dimension())
+    SentenceTransformer(modules=[transformer, pooling]).save(path)
+    return path
+
+def load_corpus(args, tokenizer):
+    if args.file:
+        from utils.file_processor import FileProcessor
+        pages = FileProcessor.iter_pages(args.file)
+    else:
+        pages = build_synthetic_pages(args.pages)
+    chunker = TokenChunker.from_tokenizer(tokenizer, chunk_tokens=args.chunk_tokens)
+    return [chunk["text"] for chunk in chunker.iter_chunks(pages)]
+
+def bench_queries(embeddings: BatchedEmbeddings, queries, concurrency: int) -> None:
+    """并发编码查询：逐条调用encode，与经QueryEmbeddingCache合并编码（不缓存/缓存）对比"""
+    runs = [
+        ("per-query", None),
+        ("batched", QueryEmbeddingCache(max_entries=0)),
+        ("batched+cache", QueryEmbeddingCache()),
+    ]
+    for name, cache in runs:
+        if cache is None:
+            encode = lambda query: embeddings.embed_documents([query])
+        else:
+            encode = lambda query, cache=cache: cache.embed(embeddings, query, "bench")
+        start = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(encode, queries))
+        elapsed = time.monotonic() - start
+        line = f"queries={len(queries)} concurrency={concurrency} {name:<14} {len(queries) / elapsed:.1f} queries/s"
+        if cache is not None:
+            stats = cache.stats()
+            line += (f"  hit_rate={stats['hit_rate']:.2f} avg_batch={stats['avg_batch_size']:.1f} "
+                     f"avg_encode_ms={stats['avg_encode_ms']:.1f}")
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput")
+    parser.add_argument("--model", default="models/embedded", help="embedding模型目录，不存在时使用随机初始化的小模型")
+    parser.add_argument("--file", help="参考文档，不指定时使用合成文档")
+    parser.add_argument("--pages", type=int, default=100, help="合成文档页数")
+    parser.add_argument("--chunk-tokens", type=int, default=254)
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--precisions", nargs="+", default=["fp32"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8, 32, 64])
+    parser.add_argument("--processes", nargs="+", type=int, default=[1])
+    parser.add_argument("--queries", type=int, default=512, help="并发查询数，0表示跳过查询测试")
+    parser.add_argument("--query-pool", type=int, default=128, help="查询从中抽取的不同问题数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    model_path = args.model
+    if not os.path.isdir(model_path):
+        print(f"{model_path} not found, using a random tiny BERT")
+        model_path = build_tiny_model(tempfile.mkdtemp(prefix="bench_embedding_"))
+
+    device = resolve_device(args.device)
+    corpus = None
+    for precision in args.precisions:
+        precision = resolve_precision(device, precision)
+        for processes in args.processes:
+            for batch_size in args.batch_sizes:
+                embeddings = BatchedEmbeddings(
+                    model_path,
+                    device=device,
+                    precision=precision,
+                    batch_size=batch_size,
+                    processes=processes
+                )
+                if corpus is None:
+                    corpus = load_corpus(args, embeddings.client.tokenizer)
+                    print(f"reference corpus: {len(corpus)} chunks, device={device}")
+                # 预热，排除首次调用的初始化开销
+                embeddings.embed_documents(corpus[:batch_size])
+                start = time.monotonic()
+                embeddings.embed_documents(corpus)
+                elapsed = time.monotonic() - start
+                stats = embeddings.stats()
+                embeddings.close()
+                print(
+                    f"precision={precision:<5} processes={stats['processes']:<3} batch={batch_size:<4} "
+                    f"{elapsed:.2f}s -> {len(corpus) / elapsed:.1f} chunks/s"
+                )
+
+    if args.queries > 0:
+        embeddings = BatchedEmbeddings(model_path, device=device, precision=resolve_precision(device, args.precisions[0]))
+        pool = [chunk.split(". ")[0] for chunk in corpus[:args.query_pool]]
+        rng = random.Random(0)
+        queries = [rng.choice(pool) for _ in range(args.queries)]
+        embeddings.embed_documents(pool[:8])
+        bench_queries(embeddings, queries, args.concurrency)
+        embeddings.close()
+
+if __name__ == "__main__":
+    main()
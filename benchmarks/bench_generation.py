@@ -0,0 +1,171 @@
+"""
+批处理生成调度器基准测试
+
+对比逐个调用 model.generate 与 GenerationScheduler 合并并发请求时的吞吐量。
+不指定 --model 时在CPU上构建一个随机初始化的小模型，无需GPU即可运行：
+
+    python benchmarks/bench_generation.py --requests 16 --batch-size 4
+    python benchmarks/bench_generation.py --model models/chat --device cuda
+
+指定 --prefix-repeat 时在每个prompt前加上相同的长系统提示，对比关闭与开启前缀KV缓存时
+每个请求的预填充耗时，并检查两种方式的贪心解码结果一致：
+
+    python benchmarks/bench_generation.py --prefix-repeat 40 --max-new-tokens 8
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer # type: ignore
+from utils.generation_scheduler import GenerationScheduler
+
+PROMPTS = [
+    "请用一句话概括这篇论文的主要贡献。",
+    "What is the main contribution of this paper?",
+    "解释一下注意力机制的基本原理。",
+    "List three datasets commonly used for text classification.",
+]
+
+def build_tiny_model():
+    """构建随机初始化的小型Llama模型和字节级tokenizer"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast # type: ignore
+
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=512,
+        special_tokens=["<unk>", "<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator(PROMPTS * 20, trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        model_input_names=["input_ids", "attention_mask"]
+    )
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=128,
+        intermediate_size=256,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    return LlamaForCausalLM(config).eval(), tokenizer
+
+def run_sequential(model, tokenizer, prompts, params):
+    tokens = 0
+    start = time.monotonic()
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        with torch.inference_mode():
+            output = model.generate(
+                **inputs,
+                **params,
+                pad_token_id=tokenizer.eos_token_id,
+                eos_token_id=tokenizer.eos_token_id
+            )
+        tokens += output.shape[1] - inputs["input_ids"].shape[1]
+    return tokens, time.monotonic() - start
+
+def run_scheduler(scheduler, prompts, concurrency):
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(scheduler.generate, prompts))
+    return time.monotonic() - start
+
+SYSTEM_PROMPT = "你是一个智能论文处理助手，请根据用户的问题提供专业、准确、客观的回答。"
+
+def run_prefix(model, tokenizer, prompts, args):
+    """同一批带长前缀的prompt分别在关闭与开启前缀缓存时生成，返回输出与预填充指标"""
+    prefix = SYSTEM_PROMPT * args.prefix_repeat + "\n\n用户问题:\n"
+    results = {}
+    for enabled in (False, True):
+        scheduler = GenerationScheduler(
+            model,
+            tokenizer,
+            default_params={"do_sample": False, "max_new_tokens": args.max_new_tokens},
+            max_batch_size=args.batch_size,
+            batch_window_ms=args.window_ms
+        )
+        scheduler.eos_token_ids = set()
+        scheduler.prefix_cache_enabled = enabled
+        scheduler.register_prefix("system", prefix)
+        # 逐个提交，使每次预填充只包含一个请求，便于比较单个请求的预填充耗时
+        outputs = [scheduler.generate(prefix + prompt) for prompt in prompts]
+        stats = scheduler.stats()
+        scheduler.shutdown()
+        results[enabled] = (outputs, stats)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched generation")
+    parser.add_argument("--model", help="模型目录，不指定时使用随机初始化的小模型")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--prefix-repeat", type=int, default=0, help="系统提示重复次数，大于0时测试前缀KV缓存")
+    args = parser.parse_args()
+
+    if args.model:
+        tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(args.model, trust_remote_code=True).to(args.device).eval()
+    else:
+        model, tokenizer = build_tiny_model()
+        model = model.to(args.device)
+
+    # 关闭采样并禁止提前结束，使两种方式生成相同数量的token
+    params = {"do_sample": False, "max_new_tokens": args.max_new_tokens, "min_new_tokens": args.max_new_tokens}
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.requests)]
+
+    if args.prefix_repeat > 0:
+        results = run_prefix(model, tokenizer, prompts, args)
+        for enabled, (_, stats) in results.items():
+            prefill = stats["prefill"]["system"]
+            print(
+                f"prefix cache {'on ' if enabled else 'off'}: avg prefill {prefill['avg_prefill_ms']}ms, "
+                f"prefilled {prefill['avg_prefill_tokens']} tokens, reused {prefill['avg_reused_tokens']} tokens, "
+                f"cache {stats['prefix_cache']}"
+            )
+        print(f"outputs identical: {results[False][0] == results[True][0]}")
+        return
+
+    tokens, elapsed = run_sequential(model, tokenizer, prompts, params)
+    print(f"sequential generate : {tokens} tokens in {elapsed:.2f}s -> {tokens / elapsed:.1f} tokens/s")
+
+    scheduler = GenerationScheduler(
+        model,
+        tokenizer,
+        default_params={"do_sample": False, "max_new_tokens": args.max_new_tokens},
+        max_batch_size=args.batch_size,
+        batch_window_ms=args.window_ms
+    )
+    # 基准测试中忽略EOS，保证生成长度一致
+    scheduler.eos_token_ids = set()
+    elapsed = run_scheduler(scheduler, prompts, args.requests)
+    stats = scheduler.stats()
+    scheduler.shutdown()
+    print(
+        f"scheduler (batch={args.batch_size}): {stats['tokens_generated']} tokens in {elapsed:.2f}s "
+        f"-> {stats['tokens_generated'] / elapsed:.1f} tokens/s, "
+        f"avg batch {stats['avg_batch_size']}, max batch {stats['max_batch_size_seen']}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+本地论文索引基准测试
+
+生成不同规模的合成论文库，测量导入耗时以及 BM25、HNSW 语义检索与混合检索的查询延迟。
+不指定 --model 且 models/embedded 不存在时使用哈希词袋向量，无需下载模型即可运行：
+
+    python benchmarks/bench_paper_index.py
+    python benchmarks/bench_paper_index.py --sizes 1000 10000 100000 --queries 200 --model models/embedded
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chunker import HashingEmbeddings
+from utils.paper_index import PaperIndex
+
+VOCABULARY = [
+    "attention", "transformer", "graph", "neural", "network", "retrieval", "augmented", "generation",
+    "contrastive", "learning", "diffusion", "model", "quantization", "pruning", "distillation", "federated",
+    "privacy", "reinforcement", "policy", "reward", "segmentation", "detection", "multimodal", "vision",
+    "language", "speech", "recognition", "summarization", "translation", "benchmark", "robustness",
+    "adversarial", "efficient", "sparse", "mixture", "experts", "long", "context", "memory", "reasoning",
+]
+
+def synthetic_papers(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(count):
+        title = " ".join(rng.sample(VOCABULARY, 6)).title()
+        abstract = " ".join(
+            f"We study {' '.join(rng.sample(VOCABULARY, 4))} and report {rng.randint(1, 40)}% gains."
+            for _ in range(4)
+        )
+        yield {
+            "doi": f"10.9999/bench.{seed}.{i}",
+            "title": title,
+            "authors": [f"Author {rng.randint(1, 5000)}"],
+            "year": rng.randint(2000, 2025),
+            "abstract": abstract,
+            "url": "",
+        }
+
+def percentile(latencies, q):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local paper index query latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--model", default=None, help="embedding模型路径，默认使用哈希词袋向量")
+    args = parser.parse_args()
+
+    if args.model:
+        from utils.embeddings import BatchedEmbeddings
+        embeddings = BatchedEmbeddings(args.model)
+    else:
+        embeddings = HashingEmbeddings(size=384)
+
+    rng = random.Random(1)
+    queries = [" AND ".join(f'"{w}"' for w in rng.sample(VOCABULARY, 3)) for _ in range(args.queries)]
+
+    print(f"{'papers':>8} {'import_s':>9} {'mode':>7} {'mean_ms':>8} {'p50_ms':>7} {'p95_ms':>7}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = PaperIndex(tmp, embeddings=embeddings)
+            start = time.perf_counter()
+            batch = []
+            for paper in synthetic_papers(size):
+                batch.append(paper)
+                if len(batch) == 1000:
+                    index.add_papers(batch)
+                    batch = []
+            if batch:
+                index.add_papers(batch)
+            import_time = time.perf_counter() - start
+
+            for mode in ("bm25", "dense", "hybrid"):
+                index.search(queries[0], 10, mode)
+                latencies = []
+                for query in queries:
+                    start = time.perf_counter()
+                    index.search(query, 10, mode)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                print(f"{size:>8} {import_time:>9.1f} {mode:>7} {statistics.mean(latencies):>8.2f} "
+                      f"{percentile(latencies, 0.5):>7.2f} {percentile(latencies, 0.95):>7.2f}")
+            index.cleanup()
+
+if __name__ == "__main__":
+    main()
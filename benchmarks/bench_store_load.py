@@ -0,0 +1,95 @@
+"""
+向量存储加载基准测试
+
+生成聚类分布的合成向量与分块文本，分别保存为旧版 index.faiss/index.pkl 与各压缩方式的内存映射格式，
+在子进程中测量冷加载耗时、加载后进程RSS增量以及首次检索耗时，并列出向量文件大小与构建时报告的recall@10：
+
+    python benchmarks/bench_store_load.py
+    python benchmarks/bench_store_load.py --chunks 20000 100000 --dim 768 --compression none sq8 pq
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+LOADER = """
+import sys, json, time, resource
+import numpy as np
+sys.path.insert(0, {root!r})
+from langchain_community.vectorstores import FAISS
+from utils.mmap_store import load_store
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+
+before = rss_mb()
+start = time.perf_counter()
+if {mmap!r}:
+    store = load_store({path!r}, None)
+else:
+    store = FAISS.load_local({path!r}, None, allow_dangerous_deserialization=True)
+load_ms = (time.perf_counter() - start) * 1000
+loaded = rss_mb()
+query = np.random.default_rng(0).normal(size=(1, store.index.d)).astype(np.float32)
+start = time.perf_counter()
+_, labels = store.index.search(query, 5)
+docs = [store.docstore.search(store.index_to_docstore_id[int(i)]) for i in labels[0]]
+search_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"load_ms": load_ms, "rss_mb": loaded - before, "search_ms": search_ms}}))
+"""
+
+def build(path: str, chunks: int, dim: int, chunk_chars: int, compressions) -> dict:
+    """返回各格式的向量字节数与recall"""
+    from langchain_community.vectorstores import FAISS
+    from utils.mmap_store import save_store
+    rng = np.random.default_rng(chunks)
+    centers = rng.normal(size=(max(16, chunks // 100), dim))
+    vectors = (centers[rng.integers(0, len(centers), size=chunks)] + 0.6 * rng.normal(size=(chunks, dim))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = ["".join(rng.choice(list("abcdefghij "), size=chunk_chars)) for _ in range(chunks)]
+    store = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), None,
+        metadatas=[{"page": i // 10, "start": i} for i in range(chunks)]
+    )
+    store.save_local(os.path.join(path, "legacy"))
+    sizes = {"legacy": {"vector_bytes": os.path.getsize(os.path.join(path, "legacy", "index.faiss")), "recall": 1.0}}
+    for compression in compressions:
+        for rescore in ((False, True) if compression != "none" else (False,)):
+            name = compression + ("+fp16" if rescore else "")
+            report = save_store(store, os.path.join(path, name), compression=compression, rescore=rescore)
+            sizes[name] = {"vector_bytes": report["stored_bytes"], "recall": report.get("recall", 1.0)}
+    return sizes
+
+def measure(path: str, mmap: bool) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = LOADER.format(root=root, path=path, mmap=mmap)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store cold-load time")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunk-chars", type=int, default=1500)
+    parser.add_argument("--compression", nargs="+", default=["none", "sq8"], choices=["none", "sq8", "pq"])
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'format':>9} {'vec_mb':>7} {'recall':>7} {'load_ms':>9} {'rss_mb':>8} {'search_ms':>10}")
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as tmp:
+            sizes = build(tmp, chunks, args.dim, args.chunk_chars, args.compression)
+            for name, size in sizes.items():
+                result = measure(os.path.join(tmp, name), name != "legacy")
+                print(f"{chunks:>8} {name:>9} {size['vector_bytes'] / (1024 * 1024):>7.1f} {size['recall']:>7.3f} "
+                      f"{result['load_ms']:>9.1f} {result['rss_mb']:>8.1f} {result['search_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+网络搜索并发基准测试
+
+使用 FakeSearchBackend 模拟网络延迟，对比逐个执行查询与 WebSearcher 并发执行的耗时，
+其中一个查询被设置为慢查询以验证单查询超时；超时查询完成后写入缓存，第二轮相同查询验证缓存命中：
+
+    python benchmarks/bench_web_search.py
+    python benchmarks/bench_web_search.py --delay 0.5 --jitter 0.3 --slow 3 --timeout 1.5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.web_search import WebSearcher, FakeSearchBackend
+
+class SlowQueryBackend(FakeSearchBackend):
+    """以 slow: 开头的查询额外延迟"""
+
+    def __init__(self, slow: float, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+
+    def search(self, query, max_results, timeout=None):
+        if query.startswith("slow:"):
+            if timeout is not None and self.slow > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"query timed out after {timeout}s")
+            time.sleep(self.slow)
+        return super().search(query, max_results, timeout)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs concurrent web search")
+    parser.add_argument("--delay", type=float, default=0.3, help="每个查询的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="随机附加延迟上限（秒）")
+    parser.add_argument("--slow", type=float, default=2.0, help="慢查询的额外延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=1.0, help="单个查询超时（秒）")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    backend = SlowQueryBackend(args.slow, delay=args.delay, jitter=args.jitter)
+    queries = ["transformer attention efficiency", "sparse attention long context", "slow: attention survey"]
+
+    start = time.perf_counter()
+    sequential = []
+    for _ in range(args.rounds):
+        results = []
+        for query in queries:
+            results.extend(backend.search(query, 4))
+        sequential.append(len(results))
+    sequential_time = (time.perf_counter() - start) / args.rounds
+
+    searcher = WebSearcher(backend, query_timeout=args.timeout, deadline=args.timeout, cache_ttl=0)
+    start = time.perf_counter()
+    concurrent = [len(searcher.search(queries)) for _ in range(args.rounds)]
+    concurrent_time = (time.perf_counter() - start) / args.rounds
+
+    # 请求超时大于截止时间：慢查询在本次搜索中被丢弃，但请求继续完成并写入缓存
+    cached = WebSearcher(backend, query_timeout=args.slow + args.delay + args.jitter + 1, deadline=args.timeout)
+    cached.search(queries)
+    # 等待超出截止时间的慢查询完成并写入缓存
+    time.sleep(args.slow + args.delay + args.jitter)
+    start = time.perf_counter()
+    cached.search(queries)
+    cached_time = time.perf_counter() - start
+
+    print(f"queries={len(queries)} delay={args.delay}s jitter={args.jitter}s slow=+{args.slow}s timeout={args.timeout}s")
+    print(f"sequential      {sequential_time * 1000:9.1f}ms/search  results={sequential[0]} (with duplicates)")
+    print(f"concurrent      {concurrent_time * 1000:9.1f}ms/search  results={concurrent[0]} (deduplicated)")
+    print(f"concurrent+hit  {cached_time * 1000:9.1f}ms/search")
+    print(f"stats={searcher.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+本地CrossRef桩服务
+
+按查询生成确定性的论文条目，返回格式与 https://api.crossref.org/works 一致，
+可模拟响应延迟与间歇性503，用于在无网络环境下测试检索链路与缓存：
+
+    python benchmarks/crossref_stub.py --port 8765 --delay 0.3 --fail-every 5
+    CROSSREF_API_URL=http://127.0.0.1:8765/works python main.py
+"""
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+WORDS = ["attention", "graph", "retrieval", "transformer", "diffusion", "contrastive", "federated",
+         "quantization", "reinforcement", "segmentation", "summarization", "benchmark"]
+
+def make_work(seed: str) -> dict:
+    """由种子字符串生成一条确定性的work条目"""
+    digest = hashlib.sha256(seed.encode("utf-8")).hexdigest()
+    words = [WORDS[int(digest[i:i + 2], 16) % len(WORDS)] for i in range(0, 10, 2)]
+    doi = f"10.5555/stub.{digest[:12]}"
+    return {
+        "DOI": doi,
+        "title": [" ".join(words).title()],
+        "author": [{"given": "Author", "family": digest[12 + i:16 + i].upper()} for i in range(2)],
+        "published-print": {"date-parts": [[2015 + int(digest[20], 16) % 11]]},
+        "abstract": f"This paper studies {' and '.join(words)}. " * 4,
+        "URL": f"https://doi.org/{doi}",
+    }
+
+class StubState:
+    def __init__(self, delay: float, fail_every: int):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with state.lock:
+                state.requests += 1
+                count = state.requests
+            if state.delay:
+                time.sleep(state.delay)
+            if state.fail_every and count % state.fail_every == 0:
+                self._send(503, {"status": "error", "message": "stub failure"})
+                return
+
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if len(parts) > 1 and parts[0] == "works":
+                # /works/{doi}
+                doi = unquote("/".join(parts[1:]))
+                work = make_work(doi)
+                work["DOI"] = doi
+                self._send(200, {"status": "ok", "message": work})
+                return
+            params = parse_qs(url.query)
+            query = params.get("query", [""])[0]
+            rows = int(params.get("rows", ["10"])[0])
+            items = [make_work(f"{query}#{i}") for i in range(rows)]
+            self._send(200, {"status": "ok", "message": {"items": items, "total-results": rows}})
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(port: int = 0, delay: float = 0.0, fail_every: int = 0):
+    """在后台线程启动桩服务，返回 (server, state)，port为0时随机分配端口"""
+    state = StubState(delay, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CrossRef stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="每个请求的响应延迟（秒）")
+    parser.add_argument("--fail-every", type=int, default=0, help="每N个请求返回一次503，0表示不失败")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.delay, args.fail_every)
+    print(f"CrossRef stub listening on http://127.0.0.1:{server.server_address[1]}/works")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
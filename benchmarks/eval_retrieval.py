@@ -0,0 +1,161 @@
+"""
+文档内检索离线评测
+
+对比向量检索、BM25、两者融合（RRF）以及融合后再做MMR/重排的 recall@k 与各阶段耗时，
+并报告在token预算内装填的上下文是否包含相关分块。默认生成合成文档：每个分块含一个唯一的
+数据集名或缩写，问题只提到该术语并混入其他分块的常见词，相关分块为包含该术语的分块。
+不指定 --model 且 models/embedded 不存在时使用哈希词袋向量，无需下载模型即可运行：
+
+    python benchmarks/eval_retrieval.py
+    python benchmarks/eval_retrieval.py --file database/paper.pdf --qa qa.jsonl --model models/embedded
+
+--qa 为JSONL文件，每行 {"question": ..., "answer": ...}，包含answer文本的分块视为相关分块。
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from bench_chunker import HashingEmbeddings, TOPICS
+from utils.chunker import TokenChunker
+from utils.model_loader import RERANKER_MODEL_PATH
+from utils.retriever import HybridRetriever, STAGES, estimate_tokens
+
+FILLER = [
+    "The {topic} module is trained with the same optimizer and schedule as the baseline.",
+    "We observe that {topic} is sensitive to the learning rate in early training.",
+    "Compared with prior work, our {topic} variant uses fewer parameters.",
+    "Ablations on {topic} show consistent gains across model sizes.",
+    "The results suggest that {topic} benefits from longer training.",
+]
+QUESTION_TEMPLATES = [
+    "How well does the {topic} model perform on {term}?",
+    "What score is reported on {term} for the proposed {topic} method?",
+    "Which results does the paper give for {term} when training is longer?",
+]
+
+class _HashingEmbeddings(HashingEmbeddings, Embeddings):
+    """FAISS向量存储要求langchain的Embeddings接口"""
+
+def synthetic_corpus(chunks: int, seed: int = 0):
+    """每个分块包含一个唯一术语，问题只通过术语与相关分块关联"""
+    rng = random.Random(seed)
+    texts, questions = [], []
+    for i in range(chunks):
+        term = "".join(rng.choice(string.ascii_uppercase) for _ in range(4)) + f"-{rng.randint(10, 99)}"
+        topic = rng.choice(TOPICS)
+        sentences = [rng.choice(FILLER).format(topic=rng.choice(TOPICS)) for _ in range(5)]
+        sentences.insert(rng.randint(0, 5), f"On the {term} dataset the {topic} model reaches {rng.randint(50, 99)}.{rng.randint(0, 9)} accuracy.")
+        texts.append(" ".join(sentences))
+        questions.append({
+            "question": rng.choice(QUESTION_TEMPLATES).format(term=term, topic=rng.choice(TOPICS)),
+            "relevant": {i},
+        })
+    return texts, [{"page": 1, "start": i} for i in range(chunks)], questions
+
+def file_corpus(path: str, qa_path: str, chunker: TokenChunker):
+    from utils.file_processor import FileProcessor
+    chunks = list(chunker.iter_chunks(FileProcessor.load_document(path)))
+    texts = [chunk["text"] for chunk in chunks]
+    normalized = [re.sub(r"\s+", " ", text) for text in texts]
+    questions = []
+    with open(qa_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            answer = re.sub(r"\s+", " ", item["answer"]).strip()
+            relevant = {i for i, text in enumerate(normalized) if answer in text}
+            if relevant:
+                questions.append({"question": item["question"], "relevant": relevant})
+    return texts, [chunk["metadata"] for chunk in chunks], questions
+
+def evaluate(name, retriever, store, questions, ks, budget):
+    recalls = {k: 0 for k in ks}
+    packed_hits = 0
+    packed_tokens = []
+    stage_ms = {stage: [] for stage in STAGES}
+    documents = retriever._documents(store)
+    position_of = {id(document): position for position, document in enumerate(documents)}
+    for item in questions:
+        timings = {}
+        ranked = [position for position, _ in retriever.rank(store, item["question"], timings)]
+        for k in ks:
+            recalls[k] += bool(item["relevant"] & set(ranked[:k]))
+        started = time.perf_counter()
+        selected, tokens = retriever.pack([documents[p] for p in ranked], estimate_tokens, budget)
+        timings["pack"] = time.perf_counter() - started
+        packed_hits += bool(item["relevant"] & {position_of[id(document)] for document in selected})
+        packed_tokens.append(tokens)
+        for stage, seconds in timings.items():
+            stage_ms[stage].append(seconds * 1000)
+
+    recall_text = " ".join(f"R@{k}={recalls[k] / len(questions):.3f}" for k in ks)
+    stage_text = " ".join(
+        f"{stage}={statistics.mean(values):.2f}" for stage, values in stage_ms.items() if values
+    )
+    print(f"{name:<14} {recall_text}  packed={packed_hits / len(questions):.3f} "
+          f"({statistics.mean(packed_tokens):.0f} tok)  ms: {stage_text}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate hybrid retrieval recall and latency")
+    parser.add_argument("--file", help="待评测的文档，需同时指定 --qa")
+    parser.add_argument("--qa", help="问题与答案片段的JSONL文件")
+    parser.add_argument("--model", default="models/embedded", help="embedding模型目录")
+    parser.add_argument("--chunks", type=int, default=500, help="合成文档的分块数")
+    parser.add_argument("--queries", type=int, default=200, help="合成文档的问题数")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=1024, help="上下文token预算")
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5])
+    args = parser.parse_args()
+    if bool(args.file) != bool(args.qa):
+        parser.error("--file and --qa must be given together")
+
+    if os.path.isdir(args.model):
+        from utils.embeddings import BatchedEmbeddings
+        embeddings = BatchedEmbeddings(args.model)
+        chunker = TokenChunker.from_tokenizer(embeddings.client.tokenizer)
+    else:
+        print(f"{args.model} not found, using hashing embeddings")
+        embeddings = _HashingEmbeddings(size=1024)
+        chunker = TokenChunker(lambda text: len(text.split()))
+
+    if args.file:
+        texts, metadatas, questions = file_corpus(args.file, args.qa, chunker)
+    else:
+        texts, metadatas, questions = synthetic_corpus(args.chunks)
+        questions = random.Random(1).sample(questions, min(args.queries, len(questions)))
+    if not questions:
+        raise SystemExit("no question has a relevant chunk")
+
+    started = time.perf_counter()
+    store = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
+    print(f"{len(texts)} chunks, {len(questions)} questions, embedded in {time.perf_counter() - started:.1f}s")
+
+    configs = [
+        ("dense", dict(mode="dense", rerank=False, mmr_lambda=1.0)),
+        ("bm25", dict(mode="bm25", rerank=False, mmr_lambda=1.0)),
+        ("hybrid", dict(mode="hybrid", rerank=False, mmr_lambda=1.0)),
+        ("hybrid+mmr", dict(mode="hybrid", rerank=False, mmr_lambda=0.7)),
+    ]
+    if os.path.isdir(RERANKER_MODEL_PATH):
+        configs.append(("hybrid+rerank", dict(mode="hybrid", rerank=True, mmr_lambda=1.0)))
+    for name, options in configs:
+        retriever = HybridRetriever(candidates=args.candidates, context_tokens=args.budget, **options)
+        # 首次检索时建立BM25索引，不计入各问题的耗时
+        retriever.rank(store, questions[0]["question"])
+        evaluate(name, retriever, store, questions, args.ks, args.budget)
+        retriever.cleanup()
+
+if __name__ == "__main__":
+    main()
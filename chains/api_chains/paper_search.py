@@ -1,9 +1,21 @@
+import os
 from typing import List, Dict, Any
-import requests
 from datetime import datetime
+import numpy as np
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from utils.model_loader import ModelLoader
+from utils.crossref import crossref_client
+from utils.paper_index import paper_index, clean_abstract
+from utils.executor import QueueFullError, cpu_executor
+
+# 论文排序方式：embedding 按问题与论文的余弦相似度排序，llm 由模型筛选（两次完整生成）
+RERANK_EMBEDDING = "embedding"
+RERANK_LLM = "llm"
+PAPER_RERANK = os.getenv("PAPER_RERANK", RERANK_EMBEDDING)
+# embedding排序时检索的候选数与推荐的论文数
+RERANK_CANDIDATES = int(os.getenv("PAPER_RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("PAPER_RERANK_TOP_K", "5"))
 
 class PaperSearchChain:
     """文献推荐的搜索链"""
@@ -11,10 +23,17 @@ class PaperSearchChain:
     def __init__(self):
         self.model_loader = ModelLoader()
         self.llm = self.model_loader.load_chat_model()
-        self.crossref_api = "https://api.crossref.org/works"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-        }
+        self.embedding_model = self.model_loader.load_embedding_model()
+        # 登记提示模板的静态前缀，生成时复用其KV缓存
+        ModelLoader.register_prompt_prefix("paper_search", self._create_search_prompt().template)
+        ModelLoader.register_prompt_prefix("paper_filter", self._create_filter_prompt().template)
+        ModelLoader.register_prompt_prefix("paper_justify", self._create_justify_prompt().template)
+
+    def cleanup(self):
+        """释放模型引用"""
+        self.model_loader.cleanup()
+        self.llm = None
+        self.embedding_model = None
         
     def _create_search_prompt(self) -> PromptTemplate:
         """创建搜索提示模板"""
@@ -102,43 +121,74 @@ class PaperSearchChain:
             input_variables=["question", "papers"]
         )
     
+    def _create_justify_prompt(self) -> PromptTemplate:
+        """创建推荐理由提示模板，论文已按相关度排好序，模型只需撰写理由"""
+        template = """
+你是一个由Chat-Essay驱动的智能论文处理助手，非常乐意帮助用户回答各种问题（通常是关于论文推荐的）。
+
+以下是具体的要求：
+
+1. **回复方式要求**：下面的论文列表已经按照与**用户的研究问题**的相关度从高到低排好序，你需要按列表顺序为每一篇论文撰写推荐理由，不要调整顺序，不要增删论文。示例如下：
+
+
+    ### 推荐理由
+    1. **论文标题1**：该论文提出了...的观点，主要研究了...，您的研究问题主要与...相关，两者有很强的相关性，所以为您推荐该论文。
+    2. **论文标题2**：... /* 与上面类似 */
+    ... /* 与论文列表的篇数一致 */
+
+
+    ...及其后的内容是你需要填写的内容，/**/中的内容是对...的解释说明，不要输出到推荐内容中。
+
+2. **真实性要求**：不要撒谎或者编造虚假信息，推荐理由只能依据论文列表中给出的标题和摘要。如果摘要缺失，请根据标题谨慎说明，一定不要编造论文内容。
+
+3. **语言要求**：如果用户使用中文提问，你需要用中文回答；如果用户使用英文提问，你需要用英文回答。
+
+4. **格式要求**：使用Markdown格式撰写回复内容，每条推荐理由应该包含论文的观点、研究内容和与用户研究问题的相关性，字数应在 **100-200字之间** 。
+
+如果你已经明晰以上要求，请基于用户的研究问题和论文列表撰写推荐理由。
+
+研究问题:
+{question}
+
+论文列表:
+{papers}
+
+推荐理由:
+"""
+        
+        return PromptTemplate(
+            template=template,
+            input_variables=["question", "papers"]
+        )
+
     def _search_papers(self, query: str, max_results: int = 10) -> List[Dict]:
-        """搜索论文"""
+        """搜索论文：优先检索本地论文索引，未命中时请求CrossRef并将结果写入本地索引"""
         try:
-            params = {
-                "query": query,
-                "rows": max_results,
-                "sort": "relevance",
-                "select": "DOI,title,author,published-print,abstract,URL",
-            }
-            
-            response = requests.get(
-                self.crossref_api,
-                params=params,
-                headers=self.headers
-            )
-            response.raise_for_status()
-            
-            results = []
-            for item in response.json()["message"]["items"]:
-                # 提取所需信息
-                paper = {
-                    "title": item.get("title", [""])[0],
-                    "authors": [
-                        author.get("given", "") + " " + author.get("family", "")
-                        for author in item.get("author", [])
-                    ],
-                    "year": item.get("published-print", {}).get("date-parts", [[0]])[0][0],
-                    "doi": item.get("DOI", ""),
-                    "abstract": item.get("abstract", "No abstract available")
-                }
-                results.append(paper)
-                
-            return results
-            
+            papers = paper_index.lookup(query, k=max_results)
+            if papers is not None:
+                print(f"[PaperSearchChain] Served {len(papers)} papers from local index")
+                return papers
+        except Exception as e:
+            print(f"[PaperSearchChain] Local index error: {str(e)}")
+
+        try:
+            papers = crossref_client.search_works(query, rows=max_results)
         except Exception as e:
             print(f"Search error: {str(e)}")
             return []
+        try:
+            # 建立向量需要数百毫秒，放到CPU执行器中不阻塞本次推荐
+            cpu_executor.submit(self._index_papers, papers, query)
+        except QueueFullError:
+            pass
+        return papers
+
+    @staticmethod
+    def _index_papers(papers: List[Dict], query: str) -> None:
+        try:
+            paper_index.add_papers(papers, query)
+        except Exception as e:
+            print(f"[PaperSearchChain] Failed to index papers: {str(e)}")
     
     def _format_papers(self, papers: List[Dict]) -> str:
         """格式化论文信息"""
@@ -154,13 +204,74 @@ class PaperSearchChain:
             formatted.append(paper_info)
         return "\n\n".join(formatted)
     
-    def search(self, question: str) -> Dict[str, Any]:
-        """搜索和推荐论文"""
+    def _generate_query(self, question: str) -> str:
+        """生成学术搜索查询"""
+        search_chain = LLMChain(llm=self.llm, prompt=self._create_search_prompt())
+        return search_chain.run({"question": question})
+
+    def rank_papers(self, question: str, papers: List[Dict]) -> List[Dict]:
+        """按问题与论文标题+摘要的embedding余弦相似度排序，为每篇论文添加score字段"""
+        if not papers:
+            return []
+        texts = [f"{paper['title']}. {clean_abstract(paper.get('abstract'))}" for paper in papers]
+        doc_vectors = np.asarray(self.embedding_model.embed_documents(texts), dtype=np.float32)
+        query_vector = np.asarray(self.embedding_model.embed_query(question), dtype=np.float32)
+        doc_vectors /= np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+        scores = doc_vectors @ query_vector
+        order = np.argsort(-scores)
+        return [{**papers[i], "score": round(float(scores[i]), 4)} for i in order]
+
+    def prepare_recommendation(self, question: str, top_k: int = RERANK_TOP_K) -> Dict[str, Any]:
+        """
+        检索候选论文并按embedding相似度排序
+        返回排序后的前top_k篇论文与撰写推荐理由的提示；没有检索到论文时prompt为None
+        """
+        query = self._generate_query(question)
+        candidates = self._search_papers(query, max_results=RERANK_CANDIDATES)
+        if not candidates:
+            return {"prompt": None, "papers": [], "all_papers": []}
+        ranked = self.rank_papers(question, candidates)
+        papers = ranked[:top_k]
+        prompt = self._create_justify_prompt().format(
+            question=question,
+            papers=self._format_papers(papers)
+        )
+        return {"prompt": prompt, "papers": papers, "all_papers": ranked}
+
+    def search(self, question: str, rerank: str = PAPER_RERANK, justify: bool = True) -> Dict[str, Any]:
+        """
+        搜索和推荐论文
+        rerank为embedding时按相似度排序，justify为False时不调用模型撰写推荐理由，直接返回排序结果
+        """
+        if rerank != RERANK_LLM:
+            try:
+                prepared = self.prepare_recommendation(question)
+                if prepared["prompt"] is None:
+                    return {
+                        "success": False,
+                        "error": "No papers found"
+                    }
+                result = {
+                    "success": True,
+                    "papers": prepared["papers"],
+                    "all_papers": prepared["all_papers"]
+                }
+                if justify:
+                    result["recommendations"] = self.llm(prepared["prompt"])
+                return result
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": str(e)
+                }
+        return self._search_with_llm_filter(question)
+
+    def _search_with_llm_filter(self, question: str) -> Dict[str, Any]:
+        """由模型筛选并推荐论文"""
         try:
             # 生成搜索查询
-            search_prompt = self._create_search_prompt()
-            search_chain = LLMChain(llm=self.llm, prompt=search_prompt)
-            query = search_chain.run({"question": question})
+            query = self._generate_query(question)
             
             # 搜索论文
             papers = self._search_papers(query)
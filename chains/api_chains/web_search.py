@@ -1,21 +1,35 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
 import os
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain_community.tools import DuckDuckGoSearchRun
 from utils.model_loader import ModelLoader
 from utils.vectorizer import Vectorizer
+from utils.web_search import WebSearcher, web_searcher
+from utils.retriever import retriever
+from utils.corpus_index import corpus_index
+
+# 全文库问答时从语料索引中检索的候选分块数
+LIBRARY_CANDIDATES = int(os.getenv("LIBRARY_CANDIDATES", "20"))
 
 class WebSearchChain:
     """论文阅读的网页搜索链"""
     
-    def __init__(self):
+    def __init__(self, searcher: Optional[WebSearcher] = None):
         self.model_loader = ModelLoader()
         self.vectorizer = Vectorizer()
         self.llm = self.model_loader.load_chat_model()
-        self.search_tool = DuckDuckGoSearchRun()  # 使用DuckDuckGo搜索
-        self._vector_stores = {}  # 缓存向量存储
+        # 默认使用WEB_SEARCH_BACKEND指定的后端，测试时可传入使用FakeSearchBackend的实例
+        self.searcher = searcher or web_searcher
+        # 登记提示模板的静态前缀，生成时复用其KV缓存
+        ModelLoader.register_prompt_prefix("web_search", self._create_search_prompt().template)
+        ModelLoader.register_prompt_prefix("web_answer", self._create_answer_prompt().template)
+
+    def cleanup(self):
+        """释放模型引用"""
+        self.vectorizer.cleanup()
+        self.model_loader.cleanup()
+        self.llm = None
         
     def _create_search_prompt(self) -> PromptTemplate:
         """创建搜索提示模板"""
@@ -119,20 +133,15 @@ class WebSearchChain:
             input_variables=["context", "question", "search_results"]
         )
     
-    def _get_or_create_vector_store(self, file_path: str, paper_content: str):
-        """获取或创建向量存储"""
-        store_name = f"paper_{hash(file_path)}"
-        
-        # 检查缓存
-        if file_path in self._vector_stores:
-            print("[WebSearchChain] Using cached vector store")
-            return self._vector_stores[file_path]
-            
-        print("[WebSearchChain] Creating new vector store...")
-        vector_store = self.vectorizer.process_file(file_path, store_name)
-        self._vector_stores[file_path] = vector_store
-        return vector_store
+    def get_or_create_vector_store(self, file_path: str):
+        """获取或创建向量存储，内存缓存与解析结果由所有处理链共享"""
+        store_name = self.vectorizer.get_store_name(file_path)
+        return self.vectorizer.process_file(file_path, store_name)
     
+    def _count_tokens(self, text: str) -> int:
+        """使用chat模型的tokenizer计算token数"""
+        return len(self.model_loader.tokenizer.encode(text, add_special_tokens=False))
+
     def _generate_search_queries(self, paper_content: str, question: str) -> List[str]:
         """生成搜索查询"""
         search_prompt = self._create_search_prompt()
@@ -149,61 +158,99 @@ class WebSearchChain:
         return queries[:3]  # 最多返回3个查询
         
     def _perform_searches(self, queries: List[str]) -> str:
-        """执行搜索查询"""
-        all_results = []
+        """并发执行搜索查询，返回去重排序后的结果文本"""
+        results = self.searcher.search(queries)
+        return self.searcher.format_results(results)
+        
+    def search_web(self, question: str) -> str:
+        """只执行网络搜索，直接以问题作为查询"""
+        return self._perform_searches([question])
         
-        for query in queries:
-            try:
-                results = self.search_tool.run(query)
-                all_results.append(results)
-            except Exception as e:
-                print(f"[WebSearchChain] Search error for query '{query}': {str(e)}")
-                
-        return "\n\n".join(all_results)
+    def prepare_answer(self, file_path: str, question: str) -> Dict[str, Any]:
+        """检索论文内容、执行网络搜索并构建回答提示"""
+        # 获取或创建向量存储
+        vector_store = self.get_or_create_vector_store(file_path)
         
-    def process_paper(self, file_path: str, paper_content: str, question: str) -> Dict[str, Any]:
+        # 从论文中检索相关内容
+        print("[WebSearchChain] Retrieving relevant content from paper...")
+        docs = retriever.retrieve(vector_store, question, self._count_tokens)
+        context = "\n\n".join([doc.page_content for doc in docs])
+        print(f"[WebSearchChain] Retrieved {len(docs)} relevant sections")
+        return self._prepare_with_context(context, question)
+
+    def prepare_library_answer(self, question: str, doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        在全部已索引文档（或doc_ids指定的文档）中检索相关内容并构建回答提示
+        返回结果的sources为上下文分块所属的文档
+        """
+        print("[WebSearchChain] Retrieving relevant content from library...")
+        candidates = corpus_index.search(question, LIBRARY_CANDIDATES, doc_ids)
+        docs, _ = retriever.pack(candidates, self._count_tokens, retriever.context_tokens)
+        context = "\n\n".join([doc.page_content for doc in docs])
+        print(f"[WebSearchChain] Retrieved {len(docs)} sections from {len({d.metadata['doc_id'] for d in docs})} documents")
+        prepared = self._prepare_with_context(context, question)
+        prepared["sources"] = list({
+            doc.metadata["doc_id"]: {"doc_id": doc.metadata["doc_id"], "source": doc.metadata["source"]}
+            for doc in docs
+        }.values())
+        return prepared
+
+    def _prepare_with_context(self, context: str, question: str) -> Dict[str, Any]:
+        # 生成并执行搜索
+        print("[WebSearchChain] Generating search queries...")
+        queries = self._generate_search_queries(context, question)
+        print("[WebSearchChain] Performing web searches...")
+        search_results = self._perform_searches(queries)
+        
+        prompt = self._create_answer_prompt().format(
+            context=context,
+            question=question,
+            search_results=search_results
+        )
+        return {
+            "prompt": prompt,
+            "context": context,
+            "search_results": search_results
+        }
+        
+    def process_paper(self, file_path: str, question: str) -> Dict[str, Any]:
         """处理论文并回答问题"""
         try:
             print(f"\n[WebSearchChain] Processing question about: {file_path}")
             print(f"[WebSearchChain] Question: {question}")
             
-            # 获取或创建向量存储
-            vector_store = self._get_or_create_vector_store(file_path, paper_content)
-            
-            # 从论文中检索相关内容
-            print("[WebSearchChain] Retrieving relevant content from paper...")
-            docs = vector_store.similarity_search(question, k=3)
-            context = "\n\n".join([doc.page_content for doc in docs])
-            print(f"[WebSearchChain] Retrieved {len(docs)} relevant sections")
-            
-            # 生成并执行搜索
-            print("[WebSearchChain] Generating search queries...")
-            queries = self._generate_search_queries(context, question)
-            print("[WebSearchChain] Performing web searches...")
-            search_results = self._perform_searches(queries)
-            
-            # 创建回答链
-            print("[WebSearchChain] Generating answer...")
-            answer_prompt = self._create_answer_prompt()
-            answer_chain = LLMChain(llm=self.llm, prompt=answer_prompt)
-            
-            # 生成回答
-            answer = answer_chain.run({
-                "context": context,
-                "question": question,
-                "search_results": search_results
-            })
+            return self._answer(self.prepare_answer(file_path, question))
             
+        except Exception as e:
+            print(f"[WebSearchChain] Error: {str(e)}")
             return {
-                "success": True,
-                "answer": answer,
-                "context": context,
-                "search_results": search_results
+                "success": False,
+                "error": str(e)
             }
-            
+
+    def process_library(self, question: str, doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """基于全文库回答问题"""
+        try:
+            print(f"[WebSearchChain] Question about library: {question}")
+            return self._answer(self.prepare_library_answer(question, doc_ids))
+
         except Exception as e:
             print(f"[WebSearchChain] Error: {str(e)}")
             return {
                 "success": False,
                 "error": str(e)
             }
+
+    def _answer(self, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        # 生成回答
+        print("[WebSearchChain] Generating answer...")
+        answer = self.llm(prepared["prompt"])
+        result = {
+            "success": True,
+            "answer": answer,
+            "context": prepared["context"],
+            "search_results": prepared["search_results"]
+        }
+        if "sources" in prepared:
+            result["sources"] = prepared["sources"]
+        return result
@@ -1,8 +1,23 @@
+import os
+import json
+import hashlib
 from typing import List, Dict, Any, Optional
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from utils.model_loader import ModelLoader
 from utils.vectorizer import Vectorizer
+from utils.store_cache import vector_store_cache
+from utils.retriever import retriever
+
+# 摘要模式：retrieval 只使用检索到的片段，map_reduce 覆盖全文
+SUMMARY_MODE_RETRIEVAL = "retrieval"
+SUMMARY_MODE_MAP_REDUCE = "map_reduce"
+
+SUMMARY_CACHE_DIR = "database/summary_cache"
+# map阶段每次输入的最大token数
+MAP_INPUT_TOKENS = int(os.getenv("SUMMARY_MAP_INPUT_TOKENS", "1500"))
+# reduce阶段与最终摘要的上下文token预算
+REDUCE_CONTEXT_TOKENS = int(os.getenv("SUMMARY_REDUCE_CONTEXT_TOKENS", "3000"))
 
 class SummaryChain:
     """摘要写作的RAG链"""
@@ -11,19 +26,33 @@ class SummaryChain:
         self._model_loader = None
         self._vectorizer = None
         self._chat_model = None
-        self._vector_store_cache = {}  # 缓存vector store
+        # 登记提示模板的静态前缀，生成时复用其KV缓存
+        ModelLoader.register_prompt_prefix("summary", self._create_prompt_template().template)
+        ModelLoader.register_prompt_prefix("summary_map", self._create_map_prompt_template().template)
+        ModelLoader.register_prompt_prefix("summary_reduce", self._create_reduce_prompt_template().template)
 
     def clear_cache(self, file_path: Optional[str] = None):
         """清理缓存
-        如果指定file_path，只清理该文件的缓存
+        如果指定file_path，只将该文件的向量存储移出内存（磁盘索引保留）
         否则清理所有缓存
         """
         if file_path is None:
             print("[SummaryChain] Clearing all caches")
-            self._vector_store_cache.clear()
-        elif file_path in self._vector_store_cache:
+            vector_store_cache.clear()
+        elif os.path.exists(file_path):
             print(f"[SummaryChain] Clearing cache for {file_path}")
-            del self._vector_store_cache[file_path]
+            vector_store_cache.pop(self.vectorizer.get_store_name(file_path))
+
+    def cleanup(self):
+        """释放缓存和模型引用"""
+        self.clear_cache()
+        if self._vectorizer is not None:
+            self._vectorizer.cleanup()
+            self._vectorizer = None
+        if self._model_loader is not None:
+            self._model_loader.cleanup()
+            self._model_loader = None
+        self._chat_model = None
         
     @property
     def model_loader(self):
@@ -84,30 +113,168 @@ class SummaryChain:
             input_variables=["context", "query"]
         )
 
-    def get_or_create_vector_store(self, file_path: str) -> Any:
-        """获取或创建向量存储"""
-        store_name = f"summary_{hash(file_path)}"
+    def _create_map_prompt_template(self) -> PromptTemplate:
+        """创建片段摘要（map阶段）提示模板"""
+        template = """
+你是一个由Chat-Essay驱动的智能论文处理助手。下面是一篇论文中的一个连续片段，请提炼这个片段的要点，包括研究问题、方法、实验、结论等其中出现的关键信息。
+
+要求：
+1. 只总结片段中实际出现的内容，不要编造或推测片段之外的信息。
+2. 保留关键术语、数据集名称、公式名称和重要数值。
+3. 使用与片段相同的语言，以简洁的要点形式输出，不超过200字。
+
+论文片段:
+{text}
+
+片段要点：
+"""
         
-        # 先检查内存缓存
-        if file_path in self._vector_store_cache:
-            print("[SummaryChain] Using cached vector store")
-            return self._vector_store_cache[file_path]
-            
-        # 再检查磁盘缓存
-        vector_store = self.vectorizer.load_vector_store(store_name)
-        if vector_store is not None:
-            print("[SummaryChain] Loaded vector store from disk")
-            self._vector_store_cache[file_path] = vector_store
-            return vector_store
-            
-        # 都没有则创建新的
-        print("[SummaryChain] Creating new vector store")
-        # 清理旧的缓存和文件
-        self.clear_cache(file_path)
-        vector_store = self.vectorizer.process_file(file_path, store_name)
-        self._vector_store_cache[file_path] = vector_store
-        return vector_store
+        return PromptTemplate(
+            template=template,
+            input_variables=["text"]
+        )
+
+    def _create_reduce_prompt_template(self) -> PromptTemplate:
+        """创建要点合并（reduce阶段）提示模板"""
+        template = """
+你是一个由Chat-Essay驱动的智能论文处理助手。下面是同一篇论文中若干连续部分的要点，请结合用户请求将它们合并为一份更精炼的要点总结。
+
+要求：
+1. 去除重复内容，保留与用户请求相关的核心观点、方法和结论。
+2. 不要编造要点中没有的信息，保留关键术语和重要数值。
+3. 使用与要点相同的语言，输出不超过400字。
+
+论文要点:
+{text}
+
+用户请求:
+{query}
+
+合并后的要点：
+"""
         
+        return PromptTemplate(
+            template=template,
+            input_variables=["text", "query"]
+        )
+
+    def get_or_create_vector_store(self, file_path: str) -> Any:
+        """获取或创建向量存储，依次查找共享内存缓存、磁盘索引，都没有时解析文档"""
+        store_name = self.vectorizer.get_store_name(file_path)
+        return self.vectorizer.process_file(file_path, store_name)
+        
+    def _count_tokens(self, text: str) -> int:
+        """使用chat模型的tokenizer计算token数"""
+        self.model_loader.load_chat_model()  # 确保tokenizer已加载
+        return len(self.model_loader.tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def _all_chunks(vector_store) -> List[str]:
+        """按原文顺序取出向量存储中的全部片段"""
+        index_to_id = vector_store.index_to_docstore_id
+        chunks = []
+        for i in sorted(index_to_id):
+            doc = vector_store.docstore.search(index_to_id[i])
+            if hasattr(doc, "page_content"):
+                chunks.append(doc.page_content)
+        return chunks
+
+    def _group_by_budget(self, texts: List[str], budget: int) -> List[List[str]]:
+        """将连续文本分组，每组token数不超过预算（单条超出预算时独占一组）"""
+        groups: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = self._count_tokens(text)
+            if current and current_tokens + tokens > budget:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _load_partial_summary(self, digest: str) -> Optional[str]:
+        """片段摘要只缓存在磁盘上，内存占用不随处理过的文档增长"""
+        cache_path = os.path.join(SUMMARY_CACHE_DIR, f"{digest}.json")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    return json.load(f)["summary"]
+            except Exception as e:
+                print(f"[SummaryChain] Error reading partial summary cache: {e}")
+        return None
+
+    def _save_partial_summary(self, digest: str, summary: str) -> None:
+        os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+        cache_path = os.path.join(SUMMARY_CACHE_DIR, f"{digest}.json")
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    def _map_summaries(self, vector_store) -> List[str]:
+        """map阶段：并行总结全部片段，结果按片段内容与chat模型缓存，与用户请求无关"""
+        map_prompt = self._create_map_prompt_template()
+        groups = ["\n".join(group) for group in self._group_by_budget(self._all_chunks(vector_store), MAP_INPUT_TOKENS)]
+        # 更换chat模型或采样参数后重新生成片段摘要
+        model_id = ModelLoader.chat_model_id()
+        digests = [
+            hashlib.sha256(f"{model_id}\n{map_prompt.template}\n{text}".encode("utf-8")).hexdigest()
+            for text in groups
+        ]
+
+        partials: List[Optional[str]] = [self._load_partial_summary(digest) for digest in digests]
+        missing = [i for i, partial in enumerate(partials) if partial is None]
+        print(f"[SummaryChain] Map stage: {len(groups)} sections, {len(groups) - len(missing)} cached")
+
+        if missing:
+            # 一次性提交全部片段，由生成调度器合并为批次
+            outputs = self.llm.batch([map_prompt.format(text=groups[i]) for i in missing])
+            for i, output in zip(missing, outputs):
+                partials[i] = output.strip()
+                self._save_partial_summary(digests[i], partials[i])
+        return [partial for partial in partials if partial]
+
+    def _reduce_summaries(self, partials: List[str], query: str) -> str:
+        """reduce阶段：在上下文预算内逐层合并片段摘要"""
+        reduce_prompt = self._create_reduce_prompt_template()
+        level = 0
+        while len(partials) > 1 and self._count_tokens("\n\n".join(partials)) > REDUCE_CONTEXT_TOKENS:
+            groups = self._group_by_budget(partials, REDUCE_CONTEXT_TOKENS)
+            if len(groups) == len(partials):
+                # 每条要点都已超出预算，两两合并以保证继续收敛
+                groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+            level += 1
+            print(f"[SummaryChain] Reduce level {level}: {len(partials)} -> {len(groups)}")
+            outputs = self.llm.batch(
+                [reduce_prompt.format(text="\n\n".join(group), query=query) for group in groups]
+            )
+            partials = [output.strip() for output in outputs]
+        return "\n\n".join(partials)
+
+    def _retrieve_context(self, vector_store, query: str, mode: str = SUMMARY_MODE_RETRIEVAL) -> str:
+        """检索与查询相关的论文内容"""
+        if mode == SUMMARY_MODE_MAP_REDUCE:
+            print("[SummaryChain] Summarizing whole document with map-reduce...")
+            context = self._reduce_summaries(self._map_summaries(vector_store), query)
+            print("[SummaryChain] Reduced context length:", len(context))
+            return context
+
+        print("[SummaryChain] Retrieving relevant documents...")
+        # BM25与向量检索融合排序，在上下文token预算内装填分块
+        docs = retriever.retrieve(vector_store, query, self._count_tokens)
+        context = "\n\n".join([doc.page_content for doc in docs])
+        print("[SummaryChain] Retrieved context length:", len(context))
+        return context
+
+    def build_prompt(self, file_path: str, query: str, mode: str = SUMMARY_MODE_RETRIEVAL) -> str:
+        """检索论文内容并填充提示模板"""
+        vector_store = self.get_or_create_vector_store(file_path)
+        context = self._retrieve_context(vector_store, query, mode)
+        return self._create_prompt_template().format(context=context, query=query)
+
     def create_chain(self, vector_store):
         """创建生成摘要的LLM链"""
         print("[SummaryChain] Creating chain...")
@@ -116,11 +283,12 @@ class SummaryChain:
         print("[SummaryChain] Chain created")
         return chain, vector_store
     
-    def process_file(self, file_path: str, query: str) -> Dict[str, Any]:
+    def process_file(self, file_path: str, query: str, mode: str = SUMMARY_MODE_RETRIEVAL) -> Dict[str, Any]:
         """处理文件并生成摘要"""
         try:
             print("\n[SummaryChain] Processing file:", file_path)
             print("[SummaryChain] Query:", query)
+            print("[SummaryChain] Mode:", mode)
             
             # 获取或创建向量存储
             vector_store = self.get_or_create_vector_store(file_path)
@@ -130,10 +298,7 @@ class SummaryChain:
             chain, vector_store = self.create_chain(vector_store)
             
             # 检索相关内容
-            print("[SummaryChain] Retrieving relevant documents...")
-            docs = vector_store.similarity_search(query, k=3)
-            context = "\n\n".join([doc.page_content for doc in docs])
-            print("[SummaryChain] Retrieved context length:", len(context))
+            context = self._retrieve_context(vector_store, query, mode)
             
             # 执行生成
             print("[SummaryChain] Running chain...")
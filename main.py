@@ -1,13 +1,18 @@
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, Request, HTTPException, UploadFile, File
 from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import json
+from fastapi.concurrency import run_in_threadpool
 import os
-from datetime import datetime
 import uuid
 from contextlib import asynccontextmanager
-from main_routes import router, processor_manager
+from typing import Any, Dict, Optional
+from main_routes import router, processor_manager, schedule_indexing
+from utils.chat_store import chat_store, ChatConflictError, CHAT_PAGE_SIZE
+from utils.upload_store import upload_store, UploadTooLargeError, UploadOffsetError, UPLOAD_CHUNK_SIZE, UPLOAD_DIR
+from utils.crossref import crossref_client
+from utils.corpus_index import corpus_index
+from utils.executor import cpu_executor
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -19,6 +24,11 @@ async def lifespan(app: FastAPI):
         print("正在清理资源...")
         try:
             processor_manager.cleanup()
+            chat_store.compact()
+            chat_store.close()
+            upload_store.close()
+            crossref_client.purge_expired()
+            crossref_client.close()
             print("资源清理完成")
         except Exception as e:
             print(f"清理资源时出错: {str(e)}")
@@ -28,12 +38,12 @@ app = FastAPI(title="Chat-Essay Web UI", lifespan=lifespan)
 # 包含功能路由
 app.include_router(router)
 
-# 确保database目录存在
-DATABASE_DIR = "database"
-os.makedirs(DATABASE_DIR, exist_ok=True)
+# 确保上传目录存在
+SERVED_FILE_EXTENSIONS = (".pdf", ".txt", ".docx")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# 挂载database目录（优先）
-app.mount("/database", StaticFiles(directory="database"), name="database")
+# 只对外提供上传的文件，database下的各SQLite数据库与索引不可通过URL下载
+app.mount("/database/blobs", StaticFiles(directory=UPLOAD_DIR), name="database")
 
 # 挂载静态文件
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -61,17 +71,8 @@ async def save_chat(request: Request):
         if not chat_id:
             chat_id = str(uuid.uuid4())
 
-        chat_data = {
-            "id": chat_id,
-            "title": title,
-            "messages": messages,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "file_path": file_path
-        }
-
         # 保存聊天记录
-        with open(os.path.join(CHAT_HISTORY_DIR, f"{chat_id}.json"), "w", encoding="utf-8") as f:
-            json.dump(chat_data, f, ensure_ascii=False, indent=2)
+        chat_store.save_chat(chat_id, title, messages, file_path=file_path)
 
         return JSONResponse({
             "success": True,
@@ -83,38 +84,65 @@ async def save_chat(request: Request):
             "error": str(e)
         })
 
+@app.post("/append_chat")
+async def append_chat(request: Request):
+    """追加新的消息，base_count为客户端已保存的消息数"""
+    try:
+        data = await request.json()
+        messages = data.get("messages", [])
+        base_count = int(data.get("base_count", 0))
+        title = data.get("title")
+        chat_id = data.get("chat_id")
+        file_path = data.get("file_path")
+
+        if not chat_id:
+            chat_id = str(uuid.uuid4())
+
+        message_count = chat_store.append_messages(
+            chat_id,
+            messages,
+            base_count,
+            title=title,
+            file_path=file_path
+        )
+
+        return JSONResponse({
+            "success": True,
+            "chat_id": chat_id,
+            "message_count": message_count
+        })
+    except ChatConflictError as e:
+        # 客户端与服务器的消息数不一致，由客户端改用/save_chat保存完整会话
+        return JSONResponse({
+            "success": False,
+            "error": str(e),
+            "message_count": e.message_count
+        }, status_code=409)
+    except Exception as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        })
+
 @app.get("/get_chat_history")
-async def get_chat_history():
+async def get_chat_history(limit: int = CHAT_PAGE_SIZE, cursor: Optional[str] = None):
+    """按更新时间降序分页返回聊天历史，next_cursor用于获取下一页"""
     try:
-        history = []
-        for filename in os.listdir(CHAT_HISTORY_DIR):
-            if filename.endswith(".json"):
-                with open(os.path.join(CHAT_HISTORY_DIR, filename), "r", encoding="utf-8") as f:
-                    chat_data = json.load(f)
-                    history.append({
-                        "id": chat_data["id"],
-                        "title": chat_data["title"],
-                        "timestamp": chat_data["timestamp"]
-                    })
-        
-        # 按时间戳降序排序
-        history.sort(key=lambda x: x["timestamp"], reverse=True)
-        return history
+        return chat_store.list_chats(limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/get_chat/{chat_id}")
 async def get_chat(chat_id: str):
     try:
-        chat_file = os.path.join(CHAT_HISTORY_DIR, f"{chat_id}.json")
-        if not os.path.exists(chat_file):
+        chat_data = chat_store.get_chat(chat_id)
+        if chat_data is None:
             return JSONResponse({
                 "error": "Chat not found"
             })
-
-        with open(chat_file, "r", encoding="utf-8") as f:
-            chat_data = json.load(f)
-            return chat_data
+        return chat_data
     except Exception as e:
         return JSONResponse({
             "error": str(e)
@@ -123,13 +151,11 @@ async def get_chat(chat_id: str):
 @app.delete("/delete_chat/{chat_id}")
 async def delete_chat(chat_id: str):
     try:
-        chat_file = os.path.join(CHAT_HISTORY_DIR, f"{chat_id}.json")
-        if not os.path.exists(chat_file):
+        if not chat_store.delete_chat(chat_id):
             return JSONResponse({
                 "error": "Chat not found"
             })
 
-        os.remove(chat_file)
         return JSONResponse({
             "success": True
         })
@@ -138,35 +164,141 @@ async def delete_chat(chat_id: str):
             "error": str(e)
         })
 
+def _upload_error_response(error: Exception) -> JSONResponse:
+    """上传错误：超出大小限制返回413，分片偏移不一致返回409并附带服务器已接收的字节数"""
+    if isinstance(error, UploadTooLargeError):
+        return JSONResponse({
+            "success": False,
+            "error": str(error),
+            "max_bytes": error.limit
+        }, status_code=413)
+    if isinstance(error, UploadOffsetError):
+        return JSONResponse({
+            "success": False,
+            "error": str(error),
+            "offset": error.expected
+        }, status_code=409)
+    if isinstance(error, KeyError):
+        return JSONResponse({
+            "success": False,
+            "error": "Upload session not found"
+        }, status_code=404)
+    return JSONResponse({
+        "success": False,
+        "error": str(error)
+    })
+
+async def _upload_result(record: Dict[str, Any], file_name: Optional[str]) -> JSONResponse:
+    """返回上传结果，并在后台为文件建立索引"""
+    return JSONResponse({
+        "success": True,
+        "fileUrl": record["file_url"],
+        "fileName": file_name,
+        "uploadId": record["upload_id"],
+        "digest": record["digest"],
+        "deduplicated": record["deduplicated"],
+        "indexJobId": await schedule_indexing(record["file_url"])
+    })
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(request: Request, file: UploadFile = File(...)):
     try:
-        # 生成唯一的文件名
-        file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
-        file_path = os.path.join(DATABASE_DIR, f"{file_id}{file_extension}")
+        # 按请求头提前拒绝超出限制的文件
+        content_length = int(request.headers.get("content-length") or 0)
+        if content_length > upload_store.max_bytes + 1024 * 1024:
+            raise UploadTooLargeError(upload_store.max_bytes)
 
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # 按块写入磁盘并计算摘要，内容相同的文件只保存一份；哈希与磁盘写入在线程池中进行，不阻塞事件循环
+        writer = await run_in_threadpool(upload_store.open_writer, file.filename)
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(writer.write, chunk)
+        except Exception:
+            await run_in_threadpool(writer.abort)
+            raise
+        record = await run_in_threadpool(writer.commit)
 
         # 返回文件URL
+        return await _upload_result(record, file.filename)
+    except Exception as e:
+        return _upload_error_response(e)
+
+@app.post("/upload/init")
+async def init_upload(request: Request):
+    """创建分片上传会话，返回upload_id与建议的分片大小"""
+    try:
+        data = await request.json()
+        session = upload_store.create_session(data.get("filename"), int(data.get("size", 0)))
+        return JSONResponse({"success": True, **session})
+    except Exception as e:
+        return _upload_error_response(e)
+
+@app.get("/upload/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """查询分片上传进度，用于断点续传"""
+    status = upload_store.session_status(upload_id)
+    if status is None:
+        return _upload_error_response(KeyError(upload_id))
+    return JSONResponse({"success": True, **status})
+
+@app.put("/upload/{upload_id}/chunk")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """在offset处写入一个分片，请求体为分片的原始字节，超过UPLOAD_CHUNK_SIZE时返回413"""
+    try:
+        if int(request.headers.get("content-length") or 0) > UPLOAD_CHUNK_SIZE:
+            raise UploadTooLargeError(UPLOAD_CHUNK_SIZE)
+        # 边接收边检查大小，不把超大的请求体整个读入内存
+        data = bytearray()
+        async for part in request.stream():
+            data.extend(part)
+            if len(data) > UPLOAD_CHUNK_SIZE:
+                raise UploadTooLargeError(UPLOAD_CHUNK_SIZE)
+        received = await run_in_threadpool(upload_store.append_chunk, upload_id, offset, bytes(data))
+        return JSONResponse({"success": True, "offset": received})
+    except Exception as e:
+        return _upload_error_response(e)
+
+@app.post("/upload/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """完成分片上传"""
+    try:
+        record = await run_in_threadpool(upload_store.complete_session, upload_id)
+        return await _upload_result(record, record["filename"])
+    except Exception as e:
+        return _upload_error_response(e)
+
+@app.delete("/upload/{upload_id}")
+async def delete_upload(upload_id: str):
+    """删除上传记录，内容无其他引用时删除文件并从全文库索引中移除"""
+    try:
+        released = upload_store.release(upload_id)
+        if released is None:
+            return JSONResponse({
+                "error": "Upload not found"
+            })
+        if released["blob_deleted"]:
+            try:
+                await cpu_executor.run(corpus_index.remove_document, released["digest"])
+            except Exception as e:
+                print(f"[Upload] Error removing {released['digest'][:12]} from corpus index: {str(e)}")
         return JSONResponse({
-            "success": True,
-            "fileUrl": f"/database/{file_id}{file_extension}",
-            "fileName": file.filename
+            "success": True
         })
     except Exception as e:
         return JSONResponse({
-            "success": False,
             "error": str(e)
         })
 
 @app.get("/files/{file_name}")
 async def get_file(file_name: str):
-    file_path = os.path.join(DATABASE_DIR, file_name)
-    if not os.path.exists(file_path):
+    # 只提供已上传的文档，不暴露database下的数据库文件与未完成的上传
+    if os.path.splitext(file_name)[1].lower() not in SERVED_FILE_EXTENSIONS:
+        raise HTTPException(status_code=404, detail="File not found")
+    file_path = os.path.join(UPLOAD_DIR, file_name)
+    if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path)
 
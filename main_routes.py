@@ -1,13 +1,29 @@
 from fastapi import APIRouter, HTTPException, File, UploadFile, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
+import json
+import asyncio
+import time
 import uuid
-from typing import Dict, Any, Optional
-from chains.rag_chains.summary_chain import SummaryChain
+import threading
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, Optional, Tuple
+from chains.rag_chains.summary_chain import SummaryChain, SUMMARY_MODE_RETRIEVAL, SUMMARY_MODE_MAP_REDUCE
 from chains.api_chains.web_search import WebSearchChain
-from chains.api_chains.paper_search import PaperSearchChain
+from chains.api_chains.paper_search import PaperSearchChain, PAPER_RERANK
 from utils.file_processor import FileProcessor
 from utils.model_loader import ModelLoader
+from utils.model_registry import model_registry
+from utils.store_cache import vector_store_cache
+from utils import ingestion
+from utils.executor import QueueFullError, inference_executor, cpu_executor
+from utils.crossref import crossref_client
+from utils.web_search import web_searcher
+from utils.paper_index import paper_index
+from utils.index_jobs import index_jobs, JOB_DONE, JOB_FAILED
+from utils.response_cache import response_cache, make_scope, RESPONSE_CACHE_ENABLED
+from utils.retriever import retriever
+from utils.corpus_index import corpus_index
+from utils.query_embeddings import query_embedding_cache
 
 router = APIRouter()
 
@@ -57,13 +73,24 @@ class ProcessorManager:
         return self._paper_search_chain
 
     def cleanup(self):
-        """清理所有资源"""
-        if self._model_loader:
+        """清理所有资源，模型通过ModelRegistry统一释放"""
+        for holder in (self._summary_chain, self._web_search_chain, self._paper_search_chain, self._model_loader, index_jobs, paper_index, response_cache, retriever, corpus_index):
+            if holder is None:
+                continue
             try:
-                self._model_loader.cleanup()
-                print("模型资源已清理")
+                holder.cleanup()
             except Exception as e:
-                print(f"清理模型资源时出错: {str(e)}")
+                print(f"清理资源时出错: {str(e)}")
+        vector_store_cache.clear()
+        try:
+            ingestion.shutdown()
+        except Exception as e:
+            print(f"关闭文档解析进程池时出错: {str(e)}")
+        try:
+            model_registry.release_all()
+            print("模型资源已清理")
+        except Exception as e:
+            print(f"清理模型资源时出错: {str(e)}")
         self._file_processor = None
         self._model_loader = None
         self._summary_chain = None
@@ -84,6 +111,105 @@ def get_summary_chain() -> Optional[SummaryChain]:
 DATABASE_DIR = "database"
 os.makedirs(DATABASE_DIR, exist_ok=True)
 
+def _queue_full_response(error: QueueFullError) -> JSONResponse:
+    """推理队列已满时返回503"""
+    print(f"[API] Rejecting request: {str(error)}")
+    return JSONResponse(
+        {
+            "success": False,
+            "error": "服务器繁忙，请稍后重试"
+        },
+        status_code=503,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+# 各路由返回结果中回答文本所在的字段
+RESPONSE_FIELDS = {"summary": "summary", "read-paper": "answer", "chat": "response"}
+
+def _response_scope(route: str, mode: str = "", real_path: Optional[str] = None) -> str:
+    """回答缓存的范围：路由、模式、文档摘要与chat模型（含采样参数）标识"""
+    document = FileProcessor.file_digest(real_path) if real_path else "-"
+    return make_scope(route, mode, document, ModelLoader.chat_model_id())
+
+async def _lookup_response(data: Dict[str, Any], route: str, question: str, mode: str = "",
+                           real_path: Optional[str] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    查找缓存的回答，返回 (缓存范围, 命中结果)
+    请求中no_cache为真时跳过查找，生成的新回答仍会写入缓存
+    """
+    if not RESPONSE_CACHE_ENABLED or not question:
+        return None, None
+
+    def _lookup():
+        try:
+            scope = _response_scope(route, mode, real_path)
+        except Exception as e:
+            # 文件不存在等错误交给后续处理流程报告
+            print(f"[API] Response cache unavailable: {str(e)}")
+            return None, None
+        if data.get("no_cache"):
+            response_cache.record_bypass()
+            return scope, None
+        return scope, response_cache.get(scope, question)
+
+    # 文件摘要与问题embedding放在CPU线程池中计算
+    (scope, hit), _ = await cpu_executor.run(_lookup)
+    if hit is not None:
+        print(f"[API] Response cache {hit['match']} hit for {route}")
+    return scope, hit
+
+def _store_response(scope: Optional[str], question: str, payload: Dict[str, Any]) -> None:
+    """在后台写入回答缓存，payload的text字段为回答文本"""
+    if scope is None or not payload.get("text"):
+        return
+    try:
+        cpu_executor.submit(response_cache.put, scope, question, payload)
+    except QueueFullError:
+        pass
+
+def _cached_result(route: str, hit: Dict[str, Any]) -> JSONResponse:
+    payload = dict(hit["payload"])
+    return JSONResponse({
+        "success": True,
+        RESPONSE_FIELDS[route]: payload.pop("text"),
+        **payload,
+        "cached": hit["match"],
+        "similarity": hit["similarity"],
+        "queue_wait_ms": 0
+    })
+
+def _cached_stream(hit: Dict[str, Any]) -> StreamingResponse:
+    """以SSE形式一次性返回缓存的回答"""
+    payload = dict(hit["payload"])
+
+    def _events() -> Iterator[str]:
+        yield _sse_event({"token": payload.pop("text")})
+        yield _sse_event({"done": True, "queue_wait_ms": 0, "cached": hit["match"],
+                          "similarity": hit["similarity"], **payload})
+
+    return _sse_response(_events())
+
+@router.get("/metrics")
+async def get_metrics():
+    """运行时指标"""
+    return JSONResponse({
+        "models": model_registry.memory_report(),
+        "generation": ModelLoader.generation_stats(),
+        "embedding": ModelLoader.embedding_stats(),
+        "query_embeddings": query_embedding_cache.stats(),
+        "vector_stores": vector_store_cache.stats(),
+        "crossref": crossref_client.stats(),
+        "web_search": web_searcher.stats(),
+        "paper_index": paper_index.stats(),
+        "response_cache": response_cache.stats(),
+        "retrieval": retriever.stats(),
+        "corpus_index": corpus_index.stats(),
+        "executors": {
+            "inference": inference_executor.stats(),
+            "cpu": cpu_executor.stats()
+        }
+    })
+
 @router.post("/summary")
 async def generate_summary(request: Request):
     """生成文档摘要"""
@@ -91,6 +217,7 @@ async def generate_summary(request: Request):
         data = await request.json()
         file_path = data.get("file_path", "")
         query = data.get("content", "")
+        mode = data.get("mode", SUMMARY_MODE_RETRIEVAL)
         
         if file_path and file_path.startswith("/database/"):
             # 如果提供了文件路径，处理文件摘要
@@ -103,19 +230,36 @@ async def generate_summary(request: Request):
             if data.get("isNewUpload"):
                 print("[API] New file uploaded, clearing cache...")
                 chain.clear_cache(real_path)
+            
+            scope, hit = await _lookup_response(data, "summary", query, mode, real_path)
+            if hit is not None:
+                return _cached_result("summary", hit)
+
+            # 在CPU线程池中解析与向量化文档
+            await cpu_executor.run(chain.get_or_create_vector_store, real_path)
                 
             # 生成摘要    
-            result = chain.process_file(real_path, query)
+            result, queue_wait = await inference_executor.run(chain.process_file, real_path, query, mode)
         else:
+            scope, hit = await _lookup_response(data, "summary", query)
+            if hit is not None:
+                return _cached_result("summary", hit)
+
             # 如果没有文件路径，直接处理文本查询
-            response = processor_manager.summary_chain.llm(query)
+            response, queue_wait = await inference_executor.run(lambda: processor_manager.summary_chain.llm(query))
             result = {
                 "success": True,
                 "summary": response
             }
+
+        if result.get("success"):
+            _store_response(scope, query, {"text": result.get("summary")})
             
+        result["queue_wait_ms"] = queue_wait
         return JSONResponse(result)
         
+    except QueueFullError as e:
+        return _queue_full_response(e)
     except Exception as e:
         return JSONResponse({
             "success": False,
@@ -130,32 +274,54 @@ async def read_paper(request: Request):
         file_path = data.get("file_path", "")
         question = data.get("content", "")
         
-        if file_path and file_path.startswith("/database/"):
+        if data.get("library"):
+            # 在全部已索引文档（或documents指定的文档摘要）中检索并回答问题
+            result, queue_wait = await inference_executor.run(
+                lambda: processor_manager.web_search_chain.process_library(question, data.get("documents"))
+            )
+            result["queue_wait_ms"] = queue_wait
+        elif file_path and file_path.startswith("/database/"):
             # 如果提供了文件路径，结合文件内容回答问题
             real_path = os.path.join(os.getcwd(), file_path.lstrip("/"))
             print(f"[API] Processing paper: {real_path}")
+            scope, hit = await _lookup_response(data, "read-paper", question, real_path=real_path)
+            if hit is not None:
+                return _cached_result("read-paper", hit)
             
-            # 读取文件内容
-            paper_content = "\n".join(processor_manager.file_processor.load_document(real_path))
-            print("[API] Document loaded, sending to WebSearchChain")
+            # 在CPU线程池中逐页解析并向量化文档，解析结果与其他处理链共享
+            await cpu_executor.run(
+                lambda: processor_manager.web_search_chain.get_or_create_vector_store(real_path)
+            )
             
             # 调用处理链
-            result = processor_manager.web_search_chain.process_paper(
-                file_path=real_path,
-                paper_content=paper_content,
-                question=question
+            result, queue_wait = await inference_executor.run(
+                lambda: processor_manager.web_search_chain.process_paper(
+                    file_path=real_path,
+                    question=question
+                )
             )
+            result["queue_wait_ms"] = queue_wait
+            if result.get("success"):
+                _store_response(scope, question, {
+                    "text": result.get("answer"),
+                    "context": result.get("context"),
+                    "search_results": result.get("search_results")
+                })
         else:
             # 如果没有文件路径，只进行网络搜索
             print("[API] No file provided, performing web search only")
             try:
-                response = processor_manager.web_search_chain.search_tool.run(question)
+                response, _ = await cpu_executor.run(
+                    lambda: processor_manager.web_search_chain.search_web(question)
+                )
                 result = {
                     "success": True,
                     "answer": response,
                     "context": "",  # 没有文档上下文
                     "search_results": response  # 搜索结果作为主要内容
                 }
+            except QueueFullError:
+                raise
             except Exception as e:
                 print(f"[API] Search error: {str(e)}")
                 result = {
@@ -165,6 +331,34 @@ async def read_paper(request: Request):
             
         return JSONResponse(result)
         
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    except Exception as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        })
+
+@router.post("/library/search")
+async def search_library(request: Request):
+    """在全部已索引文档（或documents指定的文档摘要）中检索相关分块"""
+    try:
+        data = await request.json()
+        query = data.get("content", "")
+        if not query:
+            return JSONResponse({
+                "success": False,
+                "error": "查询内容不能为空"
+            })
+        docs, _ = await cpu_executor.run(
+            corpus_index.search, query, int(data.get("k", 8)), data.get("documents")
+        )
+        return JSONResponse({
+            "success": True,
+            "results": [{"text": doc.page_content, **doc.metadata} for doc in docs]
+        })
+    except QueueFullError as e:
+        return _queue_full_response(e)
     except Exception as e:
         return JSONResponse({
             "success": False,
@@ -177,32 +371,26 @@ async def recommend_papers(request: Request):
     try:
         data = await request.json()
         question = data.get("content", "")
-        result = processor_manager.paper_search_chain.search(question)
+        rerank = data.get("rerank", PAPER_RERANK)
+        # justify为False时只返回按embedding相似度排序的论文，不调用模型撰写推荐理由
+        justify = data.get("justify", True)
+        result, queue_wait = await inference_executor.run(
+            lambda: processor_manager.paper_search_chain.search(question, rerank=rerank, justify=justify)
+        )
+        result["queue_wait_ms"] = queue_wait
         return JSONResponse(result)
         
+    except QueueFullError as e:
+        return _queue_full_response(e)
     except Exception as e:
         return JSONResponse({
             "success": False,
             "error": str(e)
         })
 
-@router.post("/chat")
-async def chat(request: Request):
-    """自定义聊天"""
-    try:
-        data = await request.json()
-        message = data.get("content", "")
-        
-        if not message:
-            return JSONResponse({
-                "success": False,
-                "error": "消息内容不能为空"
-            })
-            
-        print(f"开始处理消息: {message}")  # 调试日志
-        
-        # 添加提示模板
-        prompt = f"""
+def _create_chat_prompt(message: str) -> str:
+    """创建自定义聊天的提示"""
+    return f"""
 你是一个由Chat-Essay驱动的智能论文处理助手，非常乐意帮助用户回答各种问题（通常是关于学术论文的问题）。
 
 以下是具体的要求：
@@ -241,20 +429,50 @@ async def chat(request: Request):
 {message}
 
 回答:"""
+
+ModelLoader.register_prompt_prefix("chat", _create_chat_prompt("{message}"))
+
+@router.post("/chat")
+async def chat(request: Request):
+    """自定义聊天"""
+    try:
+        data = await request.json()
+        message = data.get("content", "")
+        
+        if not message:
+            return JSONResponse({
+                "success": False,
+                "error": "消息内容不能为空"
+            })
+            
+        print(f"开始处理消息: {message}")  # 调试日志
+        try:
+            scope, hit = await _lookup_response(data, "chat", message)
+        except QueueFullError as e:
+            return _queue_full_response(e)
+        if hit is not None:
+            return _cached_result("chat", hit)
+        
+        # 添加提示模板
+        prompt = _create_chat_prompt(message)
         
         try:
             # 使用llm属性处理消息
-            response = processor_manager.summary_chain.llm(prompt)
+            response, queue_wait = await inference_executor.run(lambda: processor_manager.summary_chain.llm(prompt))
             print(f"模型返回结果: {response}")  # 调试日志
             
             if not response:
                 raise ValueError("模型返回空响应")
+            _store_response(scope, message, {"text": response})
                 
             return JSONResponse({
                 "success": True,
-                "response": response
+                "response": response,
+                "queue_wait_ms": queue_wait
             })
             
+        except QueueFullError as e:
+            return _queue_full_response(e)
         except Exception as model_error:
             print(f"模型处理错误: {str(model_error)}")  # 调试日志
             return JSONResponse({
@@ -268,3 +486,284 @@ async def chat(request: Request):
             "success": False,
             "error": f"请求处理错误: {str(e)}"
         })
+
+def _sse_event(payload: Dict[str, Any]) -> str:
+    """编码一条server-sent event"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _sse_response(events: Any) -> StreamingResponse:
+    """包装SSE事件迭代器为流式响应"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 流式输出时检查客户端是否已断开的间隔（秒）
+STREAM_DISCONNECT_INTERVAL = 0.5
+
+async def _stream_response(request: Request, prepare: Callable[[], Dict[str, Any]],
+                           cache: Optional[Tuple[Optional[str], str]] = None,
+                           prepare_uses_model: bool = False) -> Any:
+    """
+    以SSE形式流式返回模型输出
+    prepare负责检索等准备工作，返回包含prompt的字典，其余字段随结束事件一起返回；
+    prelude字段（可选）在生成开始前作为第一个事件发送
+    cache为 (缓存范围, 问题) 时，生成完成后将回答写入缓存
+    只做检索的准备工作在CPU执行器中完成；prepare_uses_model为真时（生成搜索查询、map-reduce摘要等）
+    准备工作与生成一样提交到推理执行器，受推理并发数与队列长度限制。任一队列已满时直接返回503；
+    客户端断开后停止生成，释放推理位置
+    """
+    prepare_executor = inference_executor if prepare_uses_model else cpu_executor
+    try:
+        prepared, _ = await prepare_executor.run(prepare)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    except Exception as e:
+        print(f"[API] Stream error: {str(e)}")
+        return _sse_response(iter([_sse_event({"error": str(e)})]))
+
+    prompt = prepared.pop("prompt")
+    prelude = prepared.pop("prelude", None)
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    stop = threading.Event()
+    submitted_at = time.monotonic()
+
+    def _put(event: Optional[Dict[str, Any]]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def _generate():
+        queue_wait = round((time.monotonic() - submitted_at) * 1000, 2)
+        try:
+            if stop.is_set():
+                return
+            tokens = []
+            for token in processor_manager.model_loader.stream_generate(prompt, stop):
+                tokens.append(token)
+                _put({"token": token})
+            if stop.is_set():
+                print("[API] Client disconnected, generation stopped")
+                return
+            _put({"done": True, "queue_wait_ms": queue_wait, **prepared})
+            if cache is not None:
+                _store_response(cache[0], cache[1], {"text": "".join(tokens), **prepared})
+        except Exception as e:
+            print(f"[API] Stream error: {str(e)}")
+            _put({"error": str(e)})
+        finally:
+            _put(None)
+
+    try:
+        inference_executor.submit(_generate)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+
+    async def _events() -> AsyncIterator[str]:
+        try:
+            if prelude:
+                yield _sse_event(prelude)
+            checked_at = time.monotonic()
+            while True:
+                if time.monotonic() - checked_at >= STREAM_DISCONNECT_INTERVAL:
+                    if await request.is_disconnected():
+                        break
+                    checked_at = time.monotonic()
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=STREAM_DISCONNECT_INTERVAL)
+                except asyncio.TimeoutError:
+                    continue
+                if event is None:
+                    break
+                yield _sse_event(event)
+        finally:
+            # 客户端断开（或响应被取消）时通知生成线程停止；正常结束时生成已完成，设置无影响
+            stop.set()
+
+    return _sse_response(_events())
+
+# 索引进度事件的推送间隔（秒）
+INDEX_EVENT_INTERVAL = 0.5
+# 上传后自动建立索引的文件类型
+INDEXABLE_EXTENSIONS = (".pdf", ".txt", ".docx")
+
+async def schedule_indexing(file_url: str) -> Optional[str]:
+    """
+    上传完成后在后台建立索引，返回任务ID
+    执行器队列已满或出错时返回None，问答路由会在首次使用时建立索引
+    """
+    if not file_url.lower().endswith(INDEXABLE_EXTENSIONS):
+        return None
+    real_path = os.path.join(os.getcwd(), file_url.lstrip("/"))
+    try:
+        # 首次调用需要加载embedding模型并计算文件摘要，放入CPU执行器避免阻塞事件循环
+        job, _ = await cpu_executor.run(index_jobs.submit, real_path)
+        print(f"[API] Indexing job {job['job_id']}: {job['status']}")
+        return job["job_id"]
+    except Exception as e:
+        print(f"[API] Failed to schedule indexing for {file_url}: {str(e)}")
+        return None
+
+@router.get("/index/{job_id}")
+async def get_index_job(job_id: str):
+    """查询索引任务状态：已解析页数、已向量化分块数"""
+    job = index_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Index job not found"
+        }, status_code=404)
+    return JSONResponse({"success": True, **job})
+
+@router.get("/index/{job_id}/events")
+async def stream_index_job(job_id: str):
+    """以SSE推送索引任务进度，任务结束后关闭连接"""
+    if index_jobs.get(job_id) is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Index job not found"
+        }, status_code=404)
+
+    async def _events():
+        last = None
+        while True:
+            job = index_jobs.get(job_id)
+            if job is None:
+                break
+            if job != last:
+                yield _sse_event(job)
+                last = job
+            if job["status"] in (JOB_DONE, JOB_FAILED):
+                break
+            await asyncio.sleep(INDEX_EVENT_INTERVAL)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/summary/stream")
+async def stream_summary(request: Request):
+    """流式生成文档摘要"""
+    data = await request.json()
+    file_path = data.get("file_path", "")
+    query = data.get("content", "")
+    mode = data.get("mode", SUMMARY_MODE_RETRIEVAL)
+
+    real_path = None
+    if file_path and file_path.startswith("/database/"):
+        real_path = os.path.join(os.getcwd(), file_path.lstrip("/"))
+    try:
+        scope, hit = await _lookup_response(data, "summary", query, mode if real_path else "", real_path)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    if hit is not None:
+        return _cached_stream(hit)
+
+    if real_path:
+        chain = processor_manager.summary_chain
+        if data.get("isNewUpload"):
+            print("[API] New file uploaded, clearing cache...")
+            chain.clear_cache(real_path)
+        try:
+            # 在CPU线程池中解析与向量化文档
+            await cpu_executor.run(chain.get_or_create_vector_store, real_path)
+        except QueueFullError as e:
+            return _queue_full_response(e)
+        except Exception as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            })
+
+    def _prepare() -> Dict[str, Any]:
+        if real_path:
+            return {"prompt": processor_manager.summary_chain.build_prompt(real_path, query, mode)}
+        return {"prompt": query}
+
+    # map-reduce模式在准备阶段逐段调用模型生成片段摘要
+    return await _stream_response(request, _prepare, cache=(scope, query),
+                                  prepare_uses_model=bool(real_path) and mode == SUMMARY_MODE_MAP_REDUCE)
+
+@router.post("/read-paper/stream")
+async def stream_read_paper(request: Request):
+    """流式阅读论文并回答问题"""
+    data = await request.json()
+    file_path = data.get("file_path", "")
+    question = data.get("content", "")
+
+    if data.get("library"):
+        # 全文库问答，sources随结束事件返回
+        return await _stream_response(
+            request,
+            lambda: processor_manager.web_search_chain.prepare_library_answer(question, data.get("documents")),
+            prepare_uses_model=True
+        )
+
+    if not (file_path and file_path.startswith("/database/")):
+        # 没有文件时只返回网络搜索结果，无需流式生成
+        return await read_paper(request)
+
+    real_path = os.path.join(os.getcwd(), file_path.lstrip("/"))
+    print(f"[API] Streaming answer for paper: {real_path}")
+    try:
+        scope, hit = await _lookup_response(data, "read-paper", question, real_path=real_path)
+        if hit is not None:
+            return _cached_stream(hit)
+
+        # 在CPU线程池中解析与向量化文档
+        await cpu_executor.run(lambda: processor_manager.web_search_chain.get_or_create_vector_store(real_path))
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    except Exception as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        })
+
+    def _prepare() -> Dict[str, Any]:
+        return processor_manager.web_search_chain.prepare_answer(real_path, question)
+
+    # 准备阶段调用模型生成搜索查询
+    return await _stream_response(request, _prepare, cache=(scope, question), prepare_uses_model=True)
+
+@router.post("/recommend-papers/stream")
+async def stream_recommend_papers(request: Request):
+    """流式推荐论文：先推送按相似度排序的论文列表，再流式生成推荐理由"""
+    data = await request.json()
+    question = data.get("content", "")
+
+    def _prepare() -> Dict[str, Any]:
+        prepared = processor_manager.paper_search_chain.prepare_recommendation(question)
+        if prepared["prompt"] is None:
+            raise ValueError("No papers found")
+        return {
+            "prompt": prepared["prompt"],
+            "prelude": {"papers": prepared["papers"]},
+            "all_papers": prepared["all_papers"]
+        }
+
+    # 准备阶段调用模型生成检索查询
+    return await _stream_response(request, _prepare, prepare_uses_model=True)
+
+@router.post("/chat/stream")
+async def stream_chat(request: Request):
+    """流式自定义聊天"""
+    data = await request.json()
+    message = data.get("content", "")
+
+    if not message:
+        return JSONResponse({
+            "success": False,
+            "error": "消息内容不能为空"
+        })
+
+    try:
+        scope, hit = await _lookup_response(data, "chat", message)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    if hit is not None:
+        return _cached_stream(hit)
+
+    return await _stream_response(request, lambda: {"prompt": _create_chat_prompt(message)}, cache=(scope, message))
@@ -18,8 +18,14 @@ const newChatButton = document.querySelector('.new-chat-button');
 
 // 全局变量
 let currentChatId = null;
+let savedMessageCount = 0; // 当前会话已保存到服务器的消息数
 let currentPdfPath = null; // 添加PDF路径变量
 let loadingMessage = null;
+let historyCursor = null; // 聊天历史下一页的游标
+let historyLoading = false;
+const HISTORY_PAGE_SIZE = 50;
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024; // 超过该大小的文件使用分片上传
+const MAX_CHUNK_RETRIES = 3;
 
 document.addEventListener('DOMContentLoaded', function() {
     // 确保highlight.js加载完成
@@ -59,6 +65,8 @@ document.addEventListener('DOMContentLoaded', function() {
         } else { // 摘要生成或阅读论文
             chatInputWrapper.classList.add('upload-mode');
         }
+        // 只在摘要生成模式下显示"全文摘要"选项
+        chatInputWrapper.classList.toggle('summary-mode', index === 1);
     }
 
     // 默认激活第一个按钮
@@ -275,6 +283,148 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // 渲染流式输出的内容（支持未闭合的思考标签）
+    function renderStreamingContent(contentDiv, text) {
+        let thinkContent = null;
+        let mainContent = text;
+
+        if (text.includes('<think>') || text.includes('</think>')) {
+            const parts = text.split('</think>');
+            thinkContent = parts[0].replace(/<think>/g, '').trim();
+            mainContent = parts.length > 1 ? parts[1].trim() : '';
+        }
+
+        let thinkingBubble = contentDiv.querySelector('.thinking-bubble');
+        let mainContentDiv = contentDiv.querySelector('.main-bubble');
+
+        if (thinkContent !== null && !thinkingBubble) {
+            thinkingBubble = document.createElement('div');
+            thinkingBubble.className = 'thinking-bubble';
+            contentDiv.insertBefore(thinkingBubble, contentDiv.firstChild);
+        }
+        if (!mainContentDiv) {
+            mainContentDiv = document.createElement('div');
+            mainContentDiv.className = 'main-bubble';
+            contentDiv.appendChild(mainContentDiv);
+        }
+
+        if (thinkingBubble) {
+            thinkingBubble.textContent = thinkContent;
+        }
+        mainContentDiv.innerHTML = marked.parse(mainContent);
+    }
+
+    // 将排序后的论文列表格式化为markdown
+    function formatRankedPapers(papers) {
+        const lines = papers.map((paper, index) => {
+            const authors = (paper.authors || []).join(', ');
+            const link = paper.url || (paper.doi ? `https://doi.org/${paper.doi}` : '');
+            return `${index + 1}. **${paper.title}**\n` +
+                `    - **作者**：${authors}\n` +
+                `    - **年份**：${paper.year || '未知'}\n` +
+                `    - **DOI**：${paper.doi}\n` +
+                (link ? `    - **网址**：${link}\n` : '') +
+                `    - **相关度**：${paper.score}`;
+        });
+        return `以下是关于您研究问题的相关论文推荐：\n\n${lines.join('\n')}\n\n`;
+    }
+
+    // 以流式方式请求接口，并将模型输出实时渲染到消息中
+    // 返回最终文本；接口返回普通JSON时返回解析后的结果对象
+    async function streamMessage(endpoint, requestData) {
+        const isSplitView = !document.getElementById('split-view').classList.contains('hidden');
+        const activeMessages = isSplitView ? splitMessagesContainer : messagesContainer;
+
+        const response = await fetch(endpoint, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestData)
+        });
+
+        // 503表示服务器繁忙，按普通JSON错误处理
+        if (!response.ok && response.status !== 503) {
+            throw new Error('API request failed');
+        }
+
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('text/event-stream')) {
+            return { result: await response.json() };
+        }
+
+        // 创建助手消息，替换加载动画
+        const messageElement = createMessageElement('', false);
+        const contentDiv = messageElement.querySelector('.message-content');
+        contentDiv.innerHTML = '';
+        contentDiv.classList.add('typing');
+        if (loadingMessage && loadingMessage.parentNode === activeMessages) {
+            activeMessages.replaceChild(messageElement, loadingMessage);
+        } else {
+            activeMessages.appendChild(messageElement);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let error = null;
+        let renderPending = false;
+
+        // 每帧最多渲染一次，避免频繁重新解析markdown
+        const scheduleRender = () => {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                renderStreamingContent(contentDiv, text);
+                messageElement.scrollIntoView({ behavior: 'smooth', block: 'end' });
+            });
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE事件以空行分隔
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                if (!dataLine) continue;
+
+                const event = JSON.parse(dataLine.slice(6));
+                if (event.token) {
+                    text += event.token;
+                    scheduleRender();
+                } else if (event.papers) {
+                    // 推荐文献先返回按相关度排序的论文，推荐理由随后流式生成
+                    text = formatRankedPapers(event.papers) + text;
+                    scheduleRender();
+                } else if (event.error) {
+                    error = event.error;
+                }
+            }
+        }
+
+        if (error && !text) {
+            text = '抱歉，处理您的请求时出现错误：' + error;
+        }
+
+        // 最终渲染并高亮代码
+        contentDiv.classList.remove('typing');
+        renderStreamingContent(contentDiv, text);
+        contentDiv.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightElement(block);
+        });
+        messageElement.scrollIntoView({ behavior: 'smooth', block: 'end' });
+
+        await saveCurrentChat();
+        return { text };
+    }
+
     // 获取消息内容，保持思考标签格式
     function getMessageContent(messageElement) {
         const messageContent = messageElement.querySelector('.message-content');
@@ -358,7 +508,7 @@ document.addEventListener('DOMContentLoaded', function() {
         await saveCurrentChat();
     }
 
-    // 保存当前聊天记录
+    // 保存当前聊天记录，只发送尚未保存的新消息
     async function saveCurrentChat() {
         const messages = [];
 
@@ -368,6 +518,8 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('messages');
 
         activeMessages.querySelectorAll('.message').forEach(msgEl => {
+            // 跳过加载动画，它会在回复完成后被替换
+            if (msgEl.querySelector('.loading-dots')) return;
             messages.push({
                 role: msgEl.classList.contains('user') ? 'user' : 'assistant',
                 content: msgEl.classList.contains('user') ? 
@@ -376,45 +528,75 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
         
-        if (messages.length === 0) return;
+        if (messages.length <= savedMessageCount) return;
         
         const firstUserMessage = messages.find(msg => msg.role === 'user')?.content || '新对话';
         const title = firstUserMessage.length > 20 ? firstUserMessage.substring(0, 20) + '...' : firstUserMessage;
         
         try {
-            const response = await fetch('/save_chat', {
+            let response = await fetch('/append_chat', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
                     chat_id: currentChatId,
-                    messages: messages,
+                    base_count: savedMessageCount,
+                    messages: messages.slice(savedMessageCount),
                     title: title,
                     file_path: currentPdfPath
                 })
             });
             
+            // 与服务器记录不一致时保存完整会话
+            if (response.status === 409) {
+                response = await fetch('/save_chat', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({
+                        chat_id: currentChatId,
+                        messages: messages,
+                        title: title,
+                        file_path: currentPdfPath
+                    })
+                });
+            }
+            
             const data = await response.json();
             if (data.success) {
+                const isNewChat = currentChatId !== data.chat_id;
                 currentChatId = data.chat_id;
-                await loadChatHistory(); // 刷新历史记录
+                savedMessageCount = messages.length;
+                if (isNewChat) {
+                    await loadChatHistory(); // 新会话出现在历史记录中
+                }
             }
         } catch (error) {
             console.error('Error saving chat:', error);
         }
     }
 
-    // 加载聊天历史
-    async function loadChatHistory() {
+    // 加载聊天历史，append为true时加载下一页
+    async function loadChatHistory(append = false) {
+        if (append && (!historyCursor || historyLoading)) return;
+        historyLoading = true;
         try {
-            const response = await fetch('/get_chat_history');
-            const history = await response.json();
+            const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+            if (append) {
+                params.set('cursor', historyCursor);
+            }
+            const response = await fetch(`/get_chat_history?${params}`);
+            const page = await response.json();
             
             const historyContainer = document.querySelector('.chat-history');
-            historyContainer.innerHTML = '';
+            if (!append) {
+                historyContainer.innerHTML = '';
+            }
+            historyCursor = page.next_cursor;
             
-            history.forEach(chat => {
+            page.items.forEach(chat => {
                 const historyItem = document.createElement('div');
                 historyItem.className = 'chat-history-item';
                 historyItem.setAttribute('data-chat-id', chat.id);
@@ -446,9 +628,19 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         } catch (error) {
             console.error('Error loading chat history:', error);
+        } finally {
+            historyLoading = false;
         }
     }
 
+    // 聊天历史滚动到底部时加载下一页
+    document.querySelector('.chat-history').addEventListener('scroll', (e) => {
+        const container = e.currentTarget;
+        if (container.scrollTop + container.clientHeight >= container.scrollHeight - 50) {
+            loadChatHistory(true);
+        }
+    });
+
     // 加载特定的聊天记录
     async function loadChat(chatId) {
         resetToInitialState();
@@ -495,6 +687,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // 更新当前聊天ID
             currentChatId = chatId;
+            savedMessageCount = chatData.messages.length;
             
             // 在移动端自动关闭侧边栏
             if (window.innerWidth <= 768) {
@@ -527,6 +720,59 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // 分片上传大文件，每个分片失败后查询服务器已接收的偏移并重试
+    async function uploadInChunks(file, onProgress) {
+        const initResponse = await fetch('/upload/init', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const session = await initResponse.json();
+        if (!session.success) {
+            throw new Error(session.error || 'Upload failed');
+        }
+
+        let offset = session.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            try {
+                const response = await fetch(`/upload/${session.upload_id}/chunk?offset=${offset}`, {
+                    method: 'PUT',
+                    body: chunk
+                });
+                const result = await response.json();
+                if (response.status === 409) {
+                    offset = result.offset;
+                    continue;
+                }
+                if (!result.success) {
+                    throw new Error(result.error || 'Upload failed');
+                }
+                offset = result.offset;
+                retries = 0;
+                onProgress(offset, file.size);
+            } catch (error) {
+                if (++retries > MAX_CHUNK_RETRIES) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                const status = await (await fetch(`/upload/${session.upload_id}`)).json();
+                if (!status.success) throw error;
+                offset = status.offset;
+            }
+        }
+
+        const completeResponse = await fetch(`/upload/${session.upload_id}/complete`, {
+            method: 'POST'
+        });
+        const data = await completeResponse.json();
+        if (!data.success) {
+            throw new Error(data.error || 'Upload failed');
+        }
+        return data;
+    }
+
     // 处理文件上传
     async function handleFileUpload(file) {
         if (!file) return;
@@ -541,27 +787,34 @@ document.addEventListener('DOMContentLoaded', function() {
         // 显示loading界面
         loadingContainer.classList.remove('hidden');
 
-        // 创建FormData对象
-        const formData = new FormData();
-        formData.append('file', file);
+        const updateProgress = (loaded, total) => {
+            const percentCompleted = Math.round((loaded * 100) / total);
+            progressBar.style.width = `${percentCompleted}%`;
+            progressText.textContent = `${percentCompleted}%`;
+        };
 
         try {
-            // 上传文件
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData,
-                onUploadProgress: (progressEvent) => {
-                    const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-                    progressBar.style.width = `${percentCompleted}%`;
-                    progressText.textContent = `${percentCompleted}%`;
-                }
-            });
+            let data;
+            if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                // 大文件分片上传，失败时从服务器记录的偏移处续传
+                data = await uploadInChunks(file, updateProgress);
+            } else {
+                // 创建FormData对象
+                const formData = new FormData();
+                formData.append('file', file);
 
-            if (!response.ok) {
-                throw new Error('Upload failed');
-            }
+                // 上传文件
+                const response = await fetch('/upload', {
+                    method: 'POST',
+                    body: formData
+                });
 
-            const data = await response.json();
+                data = await response.json();
+                if (!response.ok || !data.success) {
+                    throw new Error(data.error || 'Upload failed');
+                }
+                updateProgress(file.size, file.size);
+            }
 
             // 隐藏loading和欢迎界面
             loadingContainer.classList.add('hidden');
@@ -593,29 +846,18 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // 重置对话ID并发送系统消息
             currentChatId = null;
+            savedMessageCount = 0;
             
             if (currentMode === 'summary') {
                 // 摘要生成模式：直接请求摘要
                 await addMessage('正在生成文档摘要...', false);
                 
-                const response = await fetch('/summary', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        file_path: currentPdfPath,
-                        content: '请生成这篇文章的详细摘要。',
-                        isNewUpload: true  // 标记新上传的文件
-                    })
+                await streamMessage('/summary/stream', {
+                    file_path: currentPdfPath,
+                    content: '请生成这篇文章的详细摘要。',
+                    mode: getSummaryMode(),
+                    isNewUpload: true  // 标记新上传的文件
                 });
-                
-                const result = await response.json();
-                if (result.success) {
-                    await addMessage(result.summary, false);
-                } else {
-                    await addMessage('抱歉，处理您的请求时出现错误：' + (result.error || '未知错误'), false);
-                }
             } else if (currentMode === 'read-paper') {
                 // 阅读论文模式：等待用户具体问题
                 await addMessage('文件上传成功，请问您想了解这篇论文的哪些内容？', false);
@@ -629,7 +871,7 @@ document.addEventListener('DOMContentLoaded', function() {
         } catch (error) {
             console.error('Error uploading file:', error);
             loadingContainer.classList.add('hidden');
-            alert('文件上传失败，请重试');
+            alert('文件上传失败：' + error.message);
         }
     }
 
@@ -637,6 +879,12 @@ document.addEventListener('DOMContentLoaded', function() {
     fileUpload.addEventListener('change', (e) => handleFileUpload(e.target.files[0]));
     fileUploadBottom.addEventListener('change', (e) => handleFileUpload(e.target.files[0]));
 
+    // 摘要方式：默认只总结检索到的片段，勾选"全文摘要"时使用map-reduce覆盖所有片段
+    function getSummaryMode() {
+        const toggle = document.getElementById('summary-map-reduce');
+        return toggle && toggle.checked ? 'map_reduce' : 'retrieval';
+    }
+
     // 获取当前选中的模式
     function getCurrentMode() {
         const activeButton = document.querySelector('.nav-button-welcome[data-active="true"]');
@@ -666,7 +914,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         try {
             const currentMode = getCurrentMode();
-            let response;
+            let result;
 
         // 构造请求数据
         const requestData = {
@@ -678,21 +926,15 @@ document.addEventListener('DOMContentLoaded', function() {
         if ((currentMode === 'summary' || currentMode === 'read-paper') && currentPdfPath) {
             requestData.file_path = currentPdfPath;
         }
+        if (currentMode === 'summary') {
+            requestData.mode = getSummaryMode();
+        }
 
-            // 发送请求
-            response = await fetch(`/${currentMode}`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestData)
-            });
-
-            if (!response.ok) {
-                throw new Error('API request failed');
-            }
+            // 所有模式都流式渲染模型的增量输出
+            const streamed = await streamMessage(`/${currentMode}/stream`, requestData);
+            if (!streamed.result) return;
+            result = streamed.result;
 
-            const result = await response.json();
             if (result.success) {
                 let responseMessage = result.response || result.summary || result.answer || result.recommendations;
                 await addMessage(responseMessage, false);
@@ -726,6 +968,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function resetToInitialState() {
         // 重置当前聊天ID
         currentChatId = null;
+        savedMessageCount = 0;
         
         // 获取所有需要操作的元素
         const welcomeContainer = document.getElementById('welcome-container');
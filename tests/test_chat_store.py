@@ -0,0 +1,76 @@
+import importlib
+import os
+
+import pytest
+
+from utils.chat_store import ChatConflictError, ChatStore
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChatStore(str(tmp_path / "chats.db"))
+    yield store
+    store.close()
+
+def _messages(count, start=0):
+    return [{"role": "user", "content": f"message {start + i}"} for i in range(count)]
+
+def test_append_with_stale_base_count_conflicts(store):
+    assert store.append_messages("chat", _messages(2), base_count=0, title="t") == 2
+    assert store.append_messages("chat", _messages(1, 2), base_count=2) == 3
+    # 另一个客户端仍以2条消息为基准追加
+    with pytest.raises(ChatConflictError) as error:
+        store.append_messages("chat", _messages(1, 2), base_count=2)
+    assert error.value.message_count == 3
+    assert [m["content"] for m in store.get_chat("chat")["messages"]] == [f"message {i}" for i in range(3)]
+
+def test_append_to_missing_chat_requires_zero_base(store):
+    with pytest.raises(ChatConflictError):
+        store.append_messages("chat", _messages(1), base_count=1)
+    assert not store.has_chat("chat")
+
+def test_cursor_paging_with_equal_timestamps(store):
+    ids = [f"chat-{i:02d}" for i in range(7)]
+    for chat_id in ids:
+        store.save_chat(chat_id, chat_id, _messages(1), timestamp="2024-01-01 00:00:00")
+
+    seen = []
+    cursor = None
+    while True:
+        page = store.list_chats(limit=3, cursor=cursor)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    # 更新时间相同时按ID降序，不重复也不遗漏
+    assert seen == sorted(ids, reverse=True)
+
+def test_invalid_cursor_raises_value_error(store):
+    with pytest.raises(ValueError):
+        store.list_chats(cursor="not-a-cursor")
+
+@pytest.fixture
+def client(tmp_path_factory, tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    # main在导入时按工作目录创建数据目录并挂载static与templates
+    app_dir = tmp_path_factory.getbasetemp() / "app"
+    if not app_dir.exists():
+        app_dir.mkdir()
+        for name in ("static", "templates"):
+            os.symlink(os.path.join(REPO_DIR, name), app_dir / name)
+    monkeypatch.chdir(app_dir)
+    main = importlib.import_module("main")
+    store = ChatStore(str(tmp_path / "chats.db"))
+    monkeypatch.setattr(main, "chat_store", store)
+    yield TestClient(main.app)
+    store.close()
+
+def test_invalid_cursor_returns_400(client):
+    response = client.get("/get_chat_history", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_chat_history_pages(client):
+    assert client.get("/get_chat_history").json() == {"items": [], "next_cursor": None}
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.executor import BoundedExecutor, QueueFullError
+
+@pytest.fixture
+def executor():
+    executor = BoundedExecutor("test", 1, 2)
+    yield executor
+    executor.shutdown()
+
+def _blocker(executor):
+    """占用唯一的工作线程，直到返回的事件被设置"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    future = executor.submit(block)
+    assert started.wait(5)
+    return future, release
+
+def test_rejects_when_queue_full(executor):
+    future, release = _blocker(executor)
+    queued = [executor.submit(lambda: None) for _ in range(2)]
+    with pytest.raises(QueueFullError) as error:
+        executor.submit(lambda: None)
+    assert error.value.retry_after >= 1
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    for item in [future] + queued:
+        item.result(5)
+    stats = executor.stats()
+    assert stats["completed"] == 3
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert executor._slots._value == 3
+
+def test_result_includes_queue_wait(executor):
+    result, wait_ms = executor.submit(lambda x: x * 2, 21).result(5)
+    assert result == 42
+    assert wait_ms >= 0
+
+def test_cancelled_queued_run_releases_slot(executor):
+    async def scenario():
+        future, release = _blocker(executor)
+        task = asyncio.ensure_future(executor.run(lambda: None))
+        await asyncio.sleep(0.05)
+        assert executor.stats()["queued"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        future.result(5)
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["queued"] == 0
+    assert stats["cancelled"] == 1
+    assert executor._slots._value == 3
+    # 名额归还后可以重新排满队列
+    futures = [executor.submit(lambda: None) for _ in range(3)]
+    for future in futures:
+        future.result(5)
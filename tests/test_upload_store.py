@@ -0,0 +1,73 @@
+import hashlib
+import os
+
+import pytest
+
+from utils.upload_store import UPLOAD_DIR, UPLOAD_TMP_DIR, UploadOffsetError, UploadStore, UploadTooLargeError
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # blob与临时目录是相对工作目录的路径
+    monkeypatch.chdir(tmp_path)
+    store = UploadStore(db_path="database/uploads.db", max_bytes=1024)
+    yield store
+    store.close()
+
+def test_store_creates_no_files_until_used(store, tmp_path):
+    assert not (tmp_path / "database").exists()
+    store.create_session("a.txt", 10)
+    assert os.path.isdir(UPLOAD_TMP_DIR)
+    # 未完成的分片不在对外提供下载的目录下
+    assert os.path.commonpath([UPLOAD_TMP_DIR, UPLOAD_DIR]) != UPLOAD_DIR
+
+def test_chunks_in_order(store):
+    session = store.create_session("a.txt", 10)
+    assert store.append_chunk(session["upload_id"], 0, b"hello") == 5
+    assert store.append_chunk(session["upload_id"], 5, b"world") == 10
+    record = store.complete_session(session["upload_id"])
+    assert record["digest"] == hashlib.sha256(b"helloworld").hexdigest()
+    assert record["size"] == 10
+    with open(record["file_url"].lstrip("/"), "rb") as f:
+        assert f.read() == b"helloworld"
+
+def test_retransmitted_chunk_overwrites_tail(store):
+    session = store.create_session("a.txt", 10)
+    store.append_chunk(session["upload_id"], 0, b"hello")
+    store.append_chunk(session["upload_id"], 5, b"wxxxx")
+    # 客户端未收到响应，从较早的偏移重传
+    assert store.append_chunk(session["upload_id"], 5, b"world") == 10
+    record = store.complete_session(session["upload_id"])
+    assert record["digest"] == hashlib.sha256(b"helloworld").hexdigest()
+
+def test_retransmit_after_restart_rehashes(store):
+    session = store.create_session("a.txt", 10)
+    store.append_chunk(session["upload_id"], 0, b"hello")
+    # 服务重启后增量摘要丢失
+    store._session_hashes.clear()
+    store.append_chunk(session["upload_id"], 5, b"world")
+    record = store.complete_session(session["upload_id"])
+    assert record["digest"] == hashlib.sha256(b"helloworld").hexdigest()
+
+def test_offset_beyond_received_rejected(store):
+    session = store.create_session("a.txt", 10)
+    store.append_chunk(session["upload_id"], 0, b"hello")
+    with pytest.raises(UploadOffsetError) as error:
+        store.append_chunk(session["upload_id"], 7, b"rld")
+    assert error.value.expected == 5
+    assert store.session_status(session["upload_id"])["offset"] == 5
+
+def test_chunk_past_declared_size_rejected(store):
+    session = store.create_session("a.txt", 4)
+    with pytest.raises(UploadTooLargeError):
+        store.append_chunk(session["upload_id"], 0, b"hello")
+    assert store.session_status(session["upload_id"])["offset"] == 0
+
+def test_incomplete_session_cannot_complete(store):
+    session = store.create_session("a.txt", 10)
+    store.append_chunk(session["upload_id"], 0, b"hello")
+    with pytest.raises(UploadOffsetError):
+        store.complete_session(session["upload_id"])
+
+def test_unknown_session(store):
+    with pytest.raises(KeyError):
+        store.append_chunk("missing", 0, b"data")
@@ -0,0 +1,245 @@
+import os
+import base64
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", "chat_history/chats.db")
+# 聊天历史列表每页的默认与最大条数
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+# 空闲页占比超过该值时压缩数据库
+CHAT_COMPACT_FREE_RATIO = float(os.getenv("CHAT_COMPACT_FREE_RATIO", "0.25"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    file_path TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chats_updated ON chats (updated_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+"""
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def encode_cursor(timestamp: str, chat_id: str) -> str:
+    """将 (时间戳, 聊天ID) 编码为不透明的分页游标"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{chat_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, chat_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, chat_id
+
+class ChatConflictError(Exception):
+    """追加消息时客户端的消息数与服务器不一致"""
+
+    def __init__(self, chat_id: str, message_count: int, base_count: int):
+        super().__init__(f"Chat {chat_id} has {message_count} messages, client expected {base_count}")
+        self.message_count = message_count
+
+class ChatStore:
+    """基于SQLite（WAL模式）的聊天记录存储
+
+    会话元数据与消息分表保存，历史列表按 (更新时间, ID) 索引做游标分页，
+    按ID读取单个会话只需一次主键查询。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path: str = CHAT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # 数据库在首次使用时才创建，导入模块（如迁移脚本指定了其他路径时）不会产生文件
+        self._connect_lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            with self._connect_lock:
+                if self._connection is None:
+                    os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.execute("PRAGMA foreign_keys=ON")
+                    conn.executescript(SCHEMA)
+                    self._connection = conn
+        return self._connection
+
+    @classmethod
+    def get_instance(cls) -> "ChatStore":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ChatStore()
+        return cls._instance
+
+    def save_chat(self, chat_id: str, title: str, messages: List[Dict[str, Any]],
+                  file_path: Optional[str] = None, timestamp: Optional[str] = None) -> None:
+        """保存完整会话，替换该会话已有的全部消息"""
+        timestamp = timestamp or _now()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    """
+                    INSERT INTO chats (id, title, file_path, created_at, updated_at, message_count)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        title = excluded.title,
+                        file_path = excluded.file_path,
+                        updated_at = excluded.updated_at,
+                        message_count = excluded.message_count
+                    """,
+                    (chat_id, title, file_path, timestamp, timestamp, len(messages))
+                )
+                self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                self._conn.executemany(
+                    "INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(chat_id, seq, msg.get("role", "user"), msg.get("content", "")) for seq, msg in enumerate(messages)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append_messages(self, chat_id: str, messages: List[Dict[str, Any]], base_count: int,
+                        title: Optional[str] = None, file_path: Optional[str] = None) -> int:
+        """
+        在会话末尾追加消息，只写入新增的消息
+        base_count为客户端已保存的消息数，与服务器不一致时抛出ChatConflictError；
+        会话不存在且base_count为0时创建会话。返回追加后的消息数
+        """
+        timestamp = _now()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT message_count FROM chats WHERE id = ?", (chat_id,)
+                ).fetchone()
+                message_count = row["message_count"] if row is not None else 0
+                if message_count != base_count:
+                    raise ChatConflictError(chat_id, message_count, base_count)
+
+                if row is None:
+                    self._conn.execute(
+                        """
+                        INSERT INTO chats (id, title, file_path, created_at, updated_at, message_count)
+                        VALUES (?, ?, ?, ?, ?, 0)
+                        """,
+                        (chat_id, title or "新对话", file_path, timestamp, timestamp)
+                    )
+                self._conn.executemany(
+                    "INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [
+                        (chat_id, base_count + i, msg.get("role", "user"), msg.get("content", ""))
+                        for i, msg in enumerate(messages)
+                    ]
+                )
+                message_count = base_count + len(messages)
+                self._conn.execute(
+                    """
+                    UPDATE chats SET
+                        title = COALESCE(?, title),
+                        file_path = COALESCE(?, file_path),
+                        updated_at = ?,
+                        message_count = ?
+                    WHERE id = ?
+                    """,
+                    (title, file_path, timestamp, message_count, chat_id)
+                )
+                self._conn.execute("COMMIT")
+                return message_count
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_chat(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """按ID读取会话及其全部消息，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            messages = self._conn.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)
+            ).fetchall()
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "timestamp": row["updated_at"],
+            "file_path": row["file_path"],
+        }
+
+    def list_chats(self, limit: int = CHAT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按更新时间降序分页列出会话元数据
+        返回本页条目和下一页的游标（没有更多时为None）
+        """
+        limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+        query = "SELECT id, title, updated_at FROM chats"
+        params: List[Any] = []
+        if cursor:
+            query += " WHERE (updated_at, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        items = [{"id": r["id"], "title": r["title"], "timestamp": r["updated_at"]} for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """删除会话，返回是否存在"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            return cursor.rowcount > 0
+
+    def has_chat(self, chat_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone() is not None
+
+    def compact(self, min_free_ratio: float = CHAT_COMPACT_FREE_RATIO) -> None:
+        """
+        压缩数据库：将WAL写回主库并截断
+        空闲页占比超过min_free_ratio时执行VACUUM回收删除会话留下的空间
+        """
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages / page_count > min_free_ratio:
+                print(f"[ChatStore] Vacuuming {free_pages}/{page_count} free pages")
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+chat_store = ChatStore.get_instance()
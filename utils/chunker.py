@@ -0,0 +1,201 @@
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+# 段落以空行分隔
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# 中文句末标点后直接断句；英文句末标点后需跟空白，且下一句以大写字母、数字、引号或中文开头
+SENTENCE_BREAK = re.compile(r"(?<=[。！？；])|(?<=[.!?])\s+(?=[A-Z0-9\"'“(\[一-鿿])")
+# 章节标题：编号标题、常见英文章节名或中文章节名
+SECTION_HEADING = re.compile(
+    r"^\s*("
+    r"(\d+(\.\d+)*\.?|[IVX]+\.)\s+[A-Z一-鿿][^\n.。]{0,60}"
+    r"|(Abstract|Introduction|Background|Related Work|Methods?|Methodology|Experiments?|Results|"
+    r"Discussion|Conclusions?|References|Acknowledge?ments?|Appendix)\b[^\n]{0,40}"
+    r"|[一二三四五六七八九十]+[、.．][^\n]{0,40}"
+    r"|(摘\s*要|引\s*言|结\s*论|参考文献|致\s*谢)[^\n]{0,20}"
+    r")\s*$"
+)
+WHITESPACE = re.compile(r"\S+")
+
+class _Unit:
+    """分块的最小单位：页面中的一段连续文本"""
+
+    __slots__ = ("page", "start", "end", "tokens")
+
+    def __init__(self, page: int, start: int, end: int, tokens: int):
+        self.page = page
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+
+class TokenChunker:
+    """基于token计数、按段落/句子/章节边界切分文本的分块器"""
+
+    def __init__(self, count_tokens: Callable[[str], int],
+                 chunk_tokens: int = CHUNK_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        self.count_tokens = count_tokens
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer: Any, **kwargs) -> "TokenChunker":
+        """使用HuggingFace tokenizer计数token"""
+        return cls(lambda text: len(tokenizer.encode(text, add_special_tokens=False)), **kwargs)
+
+    @property
+    def config_id(self) -> str:
+        """分块配置标识，参与向量存储的缓存键"""
+        return f"token:{self.chunk_tokens}:{self.overlap_tokens}"
+
+    def iter_chunks(self, pages: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        逐页读取文本并生成分块
+        每个分块包含text和metadata（起止页码、字符偏移、所在章节）
+        """
+        page_texts: Dict[int, str] = {}
+        current: List[_Unit] = []
+        current_tokens = 0
+        section = ""
+        section_for_chunk = ""
+
+        for page_number, text in enumerate(pages, start=1):
+            page_texts[page_number] = text
+            for start, end, is_heading in self._iter_blocks(text):
+                if is_heading:
+                    # 章节标题处强制断开，标题归入新章节的第一个分块
+                    if current:
+                        yield self._build_chunk(current, page_texts, section_for_chunk)
+                        current, current_tokens = [], 0
+                    section = text[start:end].strip()
+                for unit in self._iter_units(page_number, text, start, end):
+                    if current and current_tokens + unit.tokens > self.chunk_tokens:
+                        yield self._build_chunk(current, page_texts, section_for_chunk)
+                        current = self._overlap(current, self.chunk_tokens - unit.tokens)
+                        current_tokens = sum(u.tokens for u in current)
+                    if not current:
+                        section_for_chunk = section
+                    current.append(unit)
+                    current_tokens += unit.tokens
+
+            # 只保留当前分块仍引用的页面文本，内存占用与页数无关
+            keep = {unit.page for unit in current}
+            for stale in [p for p in page_texts if p not in keep and p != page_number]:
+                del page_texts[stale]
+
+        if current:
+            yield self._build_chunk(current, page_texts, section_for_chunk)
+
+    def _iter_blocks(self, text: str) -> Iterator[Tuple[int, int, bool]]:
+        """按空行切分段落，并将单独成行的章节标题切分出来"""
+        position = 0
+        for match in list(PARAGRAPH_BREAK.finditer(text)) + [None]:
+            end = match.start() if match else len(text)
+            block_start = position
+            line_start = position
+            while line_start < end:
+                line_end = text.find("\n", line_start, end)
+                line_end = end if line_end == -1 else line_end
+                if SECTION_HEADING.match(text[line_start:line_end]):
+                    if text[block_start:line_start].strip():
+                        yield block_start, line_start, False
+                    yield line_start, line_end, True
+                    block_start = line_end
+                line_start = line_end + 1
+            if text[block_start:end].strip():
+                yield block_start, end, False
+            position = match.end() if match else len(text)
+
+    def _iter_units(self, page: int, text: str, start: int, end: int) -> Iterator[_Unit]:
+        """将段落切分为句子；超出预算的句子再按单词或字符切分"""
+        sentence_start = start
+        for match in list(SENTENCE_BREAK.finditer(text, start, end)) + [None]:
+            sentence_end = match.start() if match else end
+            yield from self._split_sentence(page, text, sentence_start, sentence_end)
+            sentence_start = match.end() if match else end
+
+    def _split_sentence(self, page: int, text: str, start: int, end: int) -> Iterator[_Unit]:
+        # 去掉首尾空白，偏移仍对应原文
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start >= end:
+            return
+
+        tokens = self.count_tokens(text[start:end])
+        if tokens <= self.chunk_tokens:
+            yield _Unit(page, start, end, tokens)
+            return
+
+        # 句子过长：按空白分词后贪心合并
+        piece_start, piece_tokens, piece_end = start, 0, start
+        for word in WHITESPACE.finditer(text, start, end):
+            word_tokens = self.count_tokens(word.group())
+            if word_tokens > self.chunk_tokens:
+                # 没有空白的长串（如中文长句）只能按字符切分
+                if piece_end > piece_start:
+                    yield _Unit(page, piece_start, piece_end, piece_tokens)
+                yield from self._split_chars(page, text, word.start(), word.end())
+                piece_start, piece_tokens, piece_end = word.end(), 0, word.end()
+                continue
+            if piece_end > piece_start and piece_tokens + word_tokens > self.chunk_tokens:
+                yield _Unit(page, piece_start, piece_end, piece_tokens)
+                piece_start, piece_tokens = word.start(), 0
+            piece_tokens += word_tokens
+            piece_end = word.end()
+        if piece_end > piece_start:
+            yield _Unit(page, piece_start, piece_end, piece_tokens)
+
+    def _split_chars(self, page: int, text: str, start: int, end: int) -> Iterator[_Unit]:
+        # 按token比例估算每段字符数
+        total_tokens = max(self.count_tokens(text[start:end]), 1)
+        step = max(1, (end - start) * self.chunk_tokens // total_tokens)
+        for piece_start in range(start, end, step):
+            piece_end = min(piece_start + step, end)
+            yield _Unit(page, piece_start, piece_end, self.count_tokens(text[piece_start:piece_end]))
+
+    def _overlap(self, units: List[_Unit], room: int) -> List[_Unit]:
+        """
+        取上一分块末尾的完整句子作为下一分块的开头
+        总token数不超过overlap_tokens和剩余空间room，且不会包含上一分块的全部内容
+        """
+        limit = min(self.overlap_tokens, room)
+        kept: List[_Unit] = []
+        tokens = 0
+        for unit in reversed(units[1:]):
+            if tokens + unit.tokens > limit:
+                break
+            kept.insert(0, unit)
+            tokens += unit.tokens
+        return kept
+
+    @staticmethod
+    def _build_chunk(units: List[_Unit], page_texts: Dict[int, str], section: str) -> Dict[str, Any]:
+        """按原文切片拼接分块文本，跨页时每页一段"""
+        parts = []
+        page_start: Optional[_Unit] = None
+        previous: Optional[_Unit] = None
+        for unit in units + [None]:
+            if page_start is not None and (unit is None or unit.page != page_start.page):
+                parts.append(page_texts[page_start.page][page_start.start:previous.end])
+                page_start = None
+            if unit is not None:
+                page_start = page_start or unit
+                previous = unit
+
+        first, last = units[0], units[-1]
+        return {
+            "text": "\n".join(parts),
+            "metadata": {
+                "page": first.page,
+                "page_end": last.page,
+                "start": first.start,
+                "end": last.end,
+                "section": section,
+            },
+        }
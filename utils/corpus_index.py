@@ -0,0 +1,398 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+
+CORPUS_INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", "database/corpus_index")
+# IVF的聚类中心数；分块数达到 nlist * TRAIN_POINTS_PER_LIST 前使用精确检索
+CORPUS_INDEX_NLIST = int(os.getenv("CORPUS_INDEX_NLIST", "256"))
+# 每次查询扫描的聚类数
+CORPUS_INDEX_NPROBE = int(os.getenv("CORPUS_INDEX_NPROBE", "16"))
+# 按文档过滤后候选分块不超过该值时扫描全部聚类，保证过滤检索的召回
+CORPUS_INDEX_EXACT_FILTER = int(os.getenv("CORPUS_INDEX_EXACT_FILTER", "4096"))
+# 新增或删除多少个文档后将向量索引写回磁盘，进程意外退出时未保存的文档在下次加载时重新计算向量
+CORPUS_INDEX_SAVE_EVERY = int(os.getenv("CORPUS_INDEX_SAVE_EVERY", "8"))
+
+# faiss建议每个聚类至少39个训练样本
+TRAIN_POINTS_PER_LIST = 39
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    saved INTEGER NOT NULL DEFAULT 0,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class CorpusIndex:
+    """全部上传文档的分块索引
+
+    分块文本与元数据保存在SQLite中，向量以分块ID保存在一个faiss索引中：分块数较少时为
+    精确检索的IndexIDMap2(IndexFlatIP)，达到训练规模后迁移为IndexIVFFlat。检索可按文档ID过滤，
+    上传被删除后移除对应文档的全部向量。分块ID自增且不复用，已删除分块的残留向量在检索时被忽略。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, index_dir: str = CORPUS_INDEX_DIR, embeddings=None,
+                 nlist: int = CORPUS_INDEX_NLIST, nprobe: int = CORPUS_INDEX_NPROBE):
+        self.index_dir = index_dir
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._vector_path = os.path.join(index_dir, "corpus.faiss")
+        self._db_path = os.path.join(index_dir, "corpus.db")
+        self._lock = threading.RLock()
+        # 首次使用时才创建目录并打开数据库，导入模块不产生文件
+        self._connection: Optional[sqlite3.Connection] = None
+        # 未指定embeddings时使用models/embedded，首次按文本检索时加载
+        self._embeddings = embeddings
+        self._custom_embeddings = embeddings is not None
+        self._model_loader = None
+        self._vectors = None
+        self._unsaved = 0
+        self._stats = {"searches": 0, "filtered_searches": 0, "total_ms": 0.0}
+
+    @classmethod
+    def get_instance(cls) -> "CorpusIndex":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = CorpusIndex()
+        return cls._instance
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    os.makedirs(self.index_dir, exist_ok=True)
+                    conn = sqlite3.connect(self._db_path, check_same_thread=False, isolation_level=None)
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                    self._connection = conn
+        return self._connection
+
+    def _exists(self) -> bool:
+        """索引是否已创建，未创建时查询类操作直接返回空结果"""
+        return self._connection is not None or os.path.exists(self._db_path)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from utils.model_loader import ModelLoader
+            self._model_loader = ModelLoader()
+            self._embeddings = self._model_loader.load_embedding_model()
+        return self._embeddings
+
+    def _embedding_id(self) -> str:
+        if self._custom_embeddings:
+            return type(self._embeddings).__name__
+        from utils.model_loader import ModelLoader
+        return ModelLoader.embedding_model_id()
+
+    def has_document(self, doc_id: str) -> bool:
+        if not self._exists():
+            return False
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def add_document(self, doc_id: str, vector_store, source: str) -> bool:
+        """从单个文档的FAISS向量存储复制分块与向量，文档已存在时返回False"""
+        if self.has_document(doc_id):
+            return False
+        index_to_id = vector_store.index_to_docstore_id
+        documents = [vector_store.docstore.search(index_to_id[i]) for i in range(vector_store.index.ntotal)]
+        texts = [document.page_content for document in documents]
+        if getattr(vector_store.index, "lossy", False):
+            # 压缩且未保存float16向量的存储只能还原近似向量，重新计算embedding
+            vectors = self.embeddings.embed_documents(texts)
+        else:
+            vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+        return self.add_chunks(
+            doc_id,
+            texts,
+            [document.metadata for document in documents],
+            vectors,
+            source
+        )
+
+    def add_chunks(self, doc_id: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                   vectors: np.ndarray, source: str = "") -> bool:
+        """写入一个文档的全部分块与对应向量，文档已存在时返回False"""
+        if not texts:
+            return False
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            index = self._get_vectors(vectors.shape[1])
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO documents (doc_id, source, chunks, added_at) VALUES (?, ?, ?, ?)",
+                    (doc_id, source, len(texts), time.time())
+                ).rowcount
+                if not inserted:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.executemany(
+                    "INSERT INTO chunks (doc_id, position, text, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (doc_id, position, text, json.dumps(metadata or {}, ensure_ascii=False))
+                        for position, (text, metadata) in enumerate(zip(texts, metadatas))
+                    ]
+                )
+                ids = np.asarray([
+                    row[0] for row in self._conn.execute(
+                        "SELECT id FROM chunks WHERE doc_id = ? ORDER BY position", (doc_id,)
+                    )
+                ], dtype=np.int64)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            index.add_with_ids(vectors, ids)
+            self._maybe_train()
+            self._mark_dirty()
+        print(f"[CorpusIndex] Added {doc_id[:12]} ({len(texts)} chunks)")
+        return True
+
+    def remove_document(self, doc_id: str) -> bool:
+        """删除文档的分块与向量，文档不存在时返回False"""
+        if not self._exists():
+            return False
+        with self._lock:
+            ids = np.asarray([
+                row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE doc_id = ?", (doc_id,))
+            ], dtype=np.int64)
+            deleted = self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            if not deleted:
+                return False
+            if len(ids) and (self._vectors is not None or os.path.exists(self._vector_path)):
+                self._get_vectors().remove_ids(faiss.IDSelectorBatch(ids))
+            self._mark_dirty()
+        print(f"[CorpusIndex] Removed {doc_id[:12]} ({len(ids)} chunks)")
+        return True
+
+    def search(self, query: str, k: int = 8, doc_ids: Optional[Iterable[str]] = None) -> List[Document]:
+        """按语义检索全部文档（或doc_ids指定的文档）中的分块"""
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return self.search_by_vector(vector, k, doc_ids)
+
+    def search_by_vector(self, vector: np.ndarray, k: int = 8,
+                         doc_ids: Optional[Iterable[str]] = None) -> List[Document]:
+        """返回与向量最相似的分块，metadata中包含doc_id、source与score"""
+        started = time.perf_counter()
+        vector = self._normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if not self._exists():
+            return []
+        with self._lock:
+            if self._vectors is None and not os.path.exists(self._vector_path) and not self._has_documents():
+                return []
+            index = self._get_vectors(vector.shape[1])
+            if index.ntotal == 0:
+                return []
+            params = self._search_params(index, None if doc_ids is None else list(doc_ids))
+            if params is False:
+                return []
+            scores, ids = index.search(vector, min(k, index.ntotal), params=params)
+            hits = [(int(i), float(score)) for i, score in zip(ids[0], scores[0]) if i >= 0]
+            rows = self._conn.execute(
+                f"""
+                SELECT c.id, c.doc_id, c.text, c.metadata, d.source FROM chunks c
+                JOIN documents d ON d.doc_id = c.doc_id WHERE c.id IN ({','.join('?' * len(hits))})
+                """,
+                [i for i, _ in hits]
+            ).fetchall() if hits else []
+            self._stats["searches"] += 1
+            self._stats["filtered_searches"] += doc_ids is not None
+            self._stats["total_ms"] += (time.perf_counter() - started) * 1000
+        by_id = {row["id"]: row for row in rows}
+        return [
+            Document(
+                page_content=by_id[i]["text"],
+                metadata={**json.loads(by_id[i]["metadata"]), "doc_id": by_id[i]["doc_id"],
+                          "source": by_id[i]["source"], "score": round(score, 4)}
+            )
+            for i, score in hits if i in by_id
+        ]
+
+    def documents(self) -> List[Dict[str, Any]]:
+        if not self._exists():
+            return []
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, source, chunks, added_at FROM documents ORDER BY added_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents, chunks = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents"
+            ).fetchone() if self._exists() else (0, 0)
+            stats = dict(self._stats)
+            stats["index_type"] = self._index_type(self._vectors) if self._vectors is not None else None
+        stats["documents"] = documents
+        stats["chunks"] = chunks
+        stats["nlist"] = self.nlist
+        stats["nprobe"] = self.nprobe
+        total_ms = stats.pop("total_ms")
+        stats["avg_search_ms"] = round(total_ms / stats["searches"], 2) if stats["searches"] else 0.0
+        return stats
+
+    def save(self) -> None:
+        """写回向量索引，并将已写入索引的文档标记为已保存"""
+        with self._lock:
+            if self._vectors is None or not self._unsaved:
+                return
+            tmp_path = f"{self._vector_path}.tmp"
+            faiss.write_index(self._vectors, tmp_path)
+            os.replace(tmp_path, self._vector_path)
+            self._conn.execute("UPDATE documents SET saved = 1 WHERE saved = 0")
+            self._unsaved = 0
+
+    def cleanup(self):
+        """保存向量索引并释放embedding模型引用"""
+        self.save()
+        with self._lock:
+            self._vectors = None
+        if self._model_loader is not None:
+            self._model_loader.cleanup()
+            self._model_loader = None
+            self._embeddings = None
+
+    def _search_params(self, index, doc_ids: Optional[List[str]]):
+        """构建检索参数，按文档过滤时限定分块ID；过滤后没有分块时返回False"""
+        selector = None
+        candidates = index.ntotal
+        if doc_ids is not None:
+            ids = np.asarray([
+                row[0] for row in self._conn.execute(
+                    f"SELECT id FROM chunks WHERE doc_id IN ({','.join('?' * len(doc_ids))})", doc_ids
+                )
+            ] if doc_ids else [], dtype=np.int64)
+            if len(ids) == 0:
+                return False
+            selector = faiss.IDSelectorBatch(ids)
+            candidates = len(ids)
+        if self._index_type(index) == INDEX_IVF:
+            nprobe = self.nlist if candidates <= CORPUS_INDEX_EXACT_FILTER else self.nprobe
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def _get_vectors(self, dim: Optional[int] = None):
+        """
+        加载向量索引（调用方持有锁）
+        上次保存后写入的文档由数据库中的分块文本重新计算向量补回索引；embedding模型变化时清空索引
+        """
+        if self._vectors is not None:
+            return self._vectors
+        embedding_id = self._embedding_id()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedding_id'").fetchone()
+        if row is not None and row["value"] == embedding_id and (os.path.exists(self._vector_path) or self._has_documents()):
+            if os.path.exists(self._vector_path):
+                self._vectors = faiss.read_index(self._vector_path)
+            else:
+                # 首次保存前进程退出，索引文件尚不存在
+                self._vectors = faiss.IndexIDMap2(faiss.IndexFlatIP(dim or self._embedding_dim()))
+            self._recover_unsaved()
+            return self._vectors
+        if row is not None:
+            print("[CorpusIndex] Embedding model changed, clearing corpus index")
+        self._conn.execute("DELETE FROM chunks")
+        self._conn.execute("DELETE FROM documents")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedding_id', ?)", (embedding_id,))
+        if os.path.exists(self._vector_path):
+            os.remove(self._vector_path)
+        self._vectors = faiss.IndexIDMap2(faiss.IndexFlatIP(dim or self._embedding_dim()))
+        return self._vectors
+
+    def _embedding_dim(self) -> int:
+        return len(self.embeddings.embed_query("dimension probe"))
+
+    def _has_documents(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is not None
+
+    def _recover_unsaved(self) -> None:
+        """
+        将上次保存后写入的文档补回索引（调用方持有锁）
+        分块文本保存在数据库中，重新计算向量；先按ID移除，避免索引文件已写入但未标记保存时重复加入
+        """
+        unsaved = [row[0] for row in self._conn.execute("SELECT doc_id FROM documents WHERE saved = 0")]
+        if not unsaved:
+            return
+        print(f"[CorpusIndex] Re-embedding {len(unsaved)} documents written after the last save")
+        for doc_id in unsaved:
+            rows = self._conn.execute(
+                "SELECT id, text FROM chunks WHERE doc_id = ? ORDER BY position", (doc_id,)
+            ).fetchall()
+            if not rows:
+                continue
+            ids = np.asarray([row["id"] for row in rows], dtype=np.int64)
+            try:
+                vectors = self.embeddings.embed_documents([row["text"] for row in rows])
+            except Exception as e:
+                # 无法计算向量时删除该文档，再次加载其向量存储时会重新加入
+                print(f"[CorpusIndex] Error re-embedding {doc_id[:12]}, dropping it: {str(e)}")
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                continue
+            self._vectors.remove_ids(faiss.IDSelectorBatch(ids))
+            self._vectors.add_with_ids(self._normalize(np.asarray(vectors, dtype=np.float32)), ids)
+        self._maybe_train()
+        self._unsaved += 1
+        self.save()
+
+    def _maybe_train(self) -> None:
+        """分块数达到训练规模后，用已有向量训练IVF并迁移（调用方持有锁）"""
+        index = self._vectors
+        if self._index_type(index) != INDEX_FLAT or index.ntotal < self.nlist * TRAIN_POINTS_PER_LIST:
+            return
+        started = time.perf_counter()
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        ids = faiss.vector_to_array(index.id_map)
+        quantizer = faiss.IndexFlatIP(index.d)
+        ivf = faiss.IndexIVFFlat(quantizer, index.d, self.nlist, faiss.METRIC_INNER_PRODUCT)
+        ivf.train(vectors)
+        ivf.add_with_ids(vectors, ids)
+        self._vectors = ivf
+        self._unsaved += 1
+        print(f"[CorpusIndex] Trained IVF index ({self.nlist} lists) on {len(ids)} chunks "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    def _mark_dirty(self) -> None:
+        self._unsaved += 1
+        if self._unsaved >= CORPUS_INDEX_SAVE_EVERY:
+            self.save()
+
+    @staticmethod
+    def _index_type(index) -> str:
+        return INDEX_IVF if isinstance(faiss.downcast_index(index), faiss.IndexIVF) else INDEX_FLAT
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+corpus_index = CorpusIndex.get_instance()
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# CrossRef接口地址，测试时可指向本地桩服务（benchmarks/crossref_stub.py）
+CROSSREF_API_URL = os.getenv("CROSSREF_API_URL", "https://api.crossref.org/works")
+# 联系邮箱，填写后请求进入CrossRef的polite池
+CROSSREF_MAILTO = os.getenv("CROSSREF_MAILTO", "")
+CROSSREF_CONNECT_TIMEOUT = float(os.getenv("CROSSREF_CONNECT_TIMEOUT", "5"))
+CROSSREF_READ_TIMEOUT = float(os.getenv("CROSSREF_READ_TIMEOUT", "20"))
+# 连接错误、429与5xx的重试次数，按指数退避并遵循Retry-After
+CROSSREF_RETRIES = int(os.getenv("CROSSREF_RETRIES", "3"))
+CROSSREF_POOL_SIZE = int(os.getenv("CROSSREF_POOL_SIZE", "8"))
+# 查询结果缓存的有效期（秒），过期条目仅在网络请求失败时使用
+CROSSREF_CACHE_TTL = float(os.getenv("CROSSREF_CACHE_TTL", str(7 * 24 * 3600)))
+CROSSREF_DB_PATH = os.getenv("CROSSREF_DB_PATH", "database/crossref.db")
+
+SELECT_FIELDS = "DOI,title,author,published-print,published-online,abstract,URL"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    dois TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS papers (
+    doi TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    year INTEGER,
+    abstract TEXT,
+    url TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+def normalize_query(query: str) -> str:
+    """统一大小写、引号与空白，使近似相同的查询命中同一缓存"""
+    query = query.strip().lower().replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", query)
+
+def parse_work(item: Dict[str, Any]) -> Dict[str, Any]:
+    """将CrossRef的work条目转换为论文元数据"""
+    date = item.get("published-print") or item.get("published-online") or {}
+    return {
+        "title": (item.get("title") or [""])[0],
+        "authors": [
+            (author.get("given", "") + " " + author.get("family", "")).strip()
+            for author in item.get("author", [])
+        ],
+        "year": (date.get("date-parts") or [[0]])[0][0] or 0,
+        "doi": item.get("DOI", ""),
+        "abstract": item.get("abstract", "No abstract available"),
+        "url": item.get("URL", ""),
+    }
+
+class CrossRefClient:
+    """CrossRef检索客户端
+
+    复用连接池并设置超时与重试，查询结果按规范化后的查询和参数缓存到SQLite。
+    缓存只保存DOI列表，论文元数据按DOI单独保存，重复出现的论文从本地读取。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, api_url: str = CROSSREF_API_URL, db_path: str = CROSSREF_DB_PATH,
+                 cache_ttl: float = CROSSREF_CACHE_TTL):
+        self.api_url = api_url
+        self.cache_ttl = cache_ttl
+        self.timeout = (CROSSREF_CONNECT_TIMEOUT, CROSSREF_READ_TIMEOUT)
+        self.session = self._create_session()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._stats = {"requests": 0, "cache_hits": 0, "stale_hits": 0, "errors": 0, "paper_hits": 0}
+
+    @classmethod
+    def get_instance(cls) -> "CrossRefClient":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = CrossRefClient()
+        return cls._instance
+
+    @staticmethod
+    def _create_session() -> requests.Session:
+        retry = Retry(
+            total=CROSSREF_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=CROSSREF_POOL_SIZE, pool_maxsize=CROSSREF_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        agent = "Chat-Essay/1.0"
+        if CROSSREF_MAILTO:
+            agent += f" (mailto:{CROSSREF_MAILTO})"
+        session.headers.update({"User-Agent": agent})
+        return session
+
+    def search_works(self, query: str, rows: int = 10) -> List[Dict[str, Any]]:
+        """
+        检索论文，返回论文元数据列表
+        缓存未过期时不访问网络；网络请求失败时退回过期缓存，没有缓存则抛出异常
+        """
+        params = {"query": normalize_query(query), "rows": rows, "sort": "relevance", "select": SELECT_FIELDS}
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+        cached = self._get_cached(key)
+        if cached is not None and time.time() - cached[0] <= self.cache_ttl:
+            self._count("cache_hits")
+            return cached[1]
+
+        try:
+            self._count("requests")
+            response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            papers = [parse_work(item) for item in response.json()["message"]["items"]]
+        except Exception as e:
+            self._count("errors")
+            if cached is not None:
+                print(f"[CrossRef] Request failed, serving stale results: {str(e)}")
+                self._count("stale_hits")
+                return cached[1]
+            raise
+
+        self._store(key, params["query"], papers)
+        return papers
+
+    def get_paper(self, doi: str) -> Optional[Dict[str, Any]]:
+        """按DOI读取论文元数据，本地没有时请求CrossRef并保存"""
+        papers = self.get_papers([doi])
+        if papers:
+            self._count("paper_hits")
+            return papers[0]
+        try:
+            self._count("requests")
+            response = self.session.get(f"{self.api_url.rstrip('/')}/{doi}", timeout=self.timeout)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            paper = parse_work(response.json()["message"])
+        except Exception:
+            self._count("errors")
+            raise
+        self._store(None, None, [paper])
+        return paper
+
+    def get_papers(self, dois: List[str]) -> List[Dict[str, Any]]:
+        """按给定顺序读取本地保存的论文元数据，忽略未保存的DOI"""
+        if not dois:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM papers WHERE doi IN ({','.join('?' * len(dois))})",
+                [doi.lower() for doi in dois]
+            ).fetchall()
+        by_doi = {row["doi"]: self._row_to_paper(row) for row in rows}
+        return [by_doi[doi.lower()] for doi in dois if doi.lower() in by_doi]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_queries"] = self._conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+            stats["papers"] = self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+        return stats
+
+    def purge_expired(self) -> int:
+        """删除过期的查询缓存，论文元数据保留"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM queries WHERE fetched_at < ?", (time.time() - self.cache_ttl,)
+            )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        self.session.close()
+        with self._lock:
+            self._conn.close()
+
+    def _get_cached(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT dois, fetched_at FROM queries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        dois = json.loads(row["dois"])
+        papers = self.get_papers(dois)
+        if len(papers) != len(dois):
+            # 元数据缺失时视为未缓存
+            return None
+        return row["fetched_at"], papers
+
+    def _store(self, key: Optional[str], query: Optional[str], papers: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        papers = [paper for paper in papers if paper["doi"]]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO papers (doi, title, authors, year, abstract, url, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (doi) DO UPDATE SET
+                        title = excluded.title,
+                        authors = excluded.authors,
+                        year = excluded.year,
+                        abstract = excluded.abstract,
+                        url = excluded.url,
+                        updated_at = excluded.updated_at
+                    """,
+                    [
+                        (paper["doi"].lower(), paper["title"], json.dumps(paper["authors"], ensure_ascii=False),
+                         paper["year"], paper["abstract"], paper["url"], now)
+                        for paper in papers
+                    ]
+                )
+                if key is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO queries (key, query, dois, fetched_at) VALUES (?, ?, ?, ?)",
+                        (key, query, json.dumps([paper["doi"] for paper in papers]), now)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _row_to_paper(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "title": row["title"],
+            "authors": json.loads(row["authors"]),
+            "year": row["year"],
+            "doi": row["doi"],
+            "abstract": row["abstract"],
+            "url": row["url"],
+        }
+
+crossref_client = CrossRefClient.get_instance()
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from utils.query_embeddings import query_embedding_cache
+
+# auto时有GPU使用cuda，否则使用cpu
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "auto")
+# auto时cuda使用fp16，cpu使用fp32；int8为CPU上的动态量化
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "auto")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 大于1时在CPU上使用多进程编码
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "0"))
+
+EMBEDDING_PRECISIONS = ("fp32", "fp16", "int8")
+
+def resolve_device(device: str = EMBEDDING_DEVICE) -> str:
+    """解析embedding设备"""
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+def resolve_precision(device: str, precision: str = EMBEDDING_PRECISION) -> str:
+    """
+    解析embedding推理精度
+    fp16只在GPU上启用，int8动态量化只在CPU上启用，不支持的组合退回到该设备的默认精度
+    """
+    on_cuda = device.startswith("cuda")
+    if precision == "auto":
+        return "fp16" if on_cuda else "fp32"
+    if precision not in EMBEDDING_PRECISIONS:
+        raise ValueError(f"Unsupported embedding precision: {precision}")
+    if precision == "fp16" and not on_cuda:
+        print("[Embeddings] fp16 is not supported on CPU, using fp32")
+        return "fp32"
+    if precision == "int8" and on_cuda:
+        print("[Embeddings] int8 dynamic quantization is CPU only, using fp16")
+        return "fp16"
+    return precision
+
+class BatchedEmbeddings(Embeddings):
+    """
+    基于SentenceTransformer的批量embedding
+    支持设置批大小、设备与精度（fp32/fp16/int8），以及CPU多进程编码
+    """
+
+    def __init__(self, model_path: str,
+                 device: str = "cpu",
+                 precision: str = "fp32",
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 processes: int = EMBEDDING_PROCESSES,
+                 normalize: bool = True,
+                 model_id: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+
+        # 查询embedding缓存的键包含该标识，模型替换后缓存的向量不再命中
+        self.model_id = model_id or model_path
+        self.device = device
+        self.precision = precision
+        self.batch_size = batch_size
+        self.normalize = normalize
+        # 与HuggingFaceEmbeddings一致，模型保存在client属性中
+        self.client = SentenceTransformer(model_path, device=device)
+        self.client.eval()
+        if precision == "fp16":
+            self.client.half()
+        elif precision == "int8":
+            self.client = torch.quantization.quantize_dynamic(self.client, {torch.nn.Linear}, dtype=torch.qint8)
+
+        self._pool = None
+        if processes > 1 and precision == "int8":
+            # 动态量化后的模型无法传递给spawn子进程
+            print("[Embeddings] Multi-process encoding is not supported with int8, using a single process")
+        elif processes > 1 and device == "cpu":
+            self._pool = self.client.start_multi_process_pool(target_devices=["cpu"] * processes)
+
+        self._lock = threading.Lock()
+        self._texts = 0
+        self._calls = 0
+        self._seconds = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.monotonic()
+        if self._pool is not None:
+            vectors = self.client.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+            if self.normalize:
+                vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        else:
+            with torch.inference_mode():
+                vectors = self.client.encode(
+                    texts,
+                    batch_size=self.batch_size,
+                    normalize_embeddings=self.normalize,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._texts += len(texts)
+            self._calls += 1
+            self._seconds += elapsed
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """查询经缓存与微批处理编码，并发到达的查询合并为一次encode"""
+        return query_embedding_cache.embed(self, text, self.model_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """embedding吞吐指标"""
+        with self._lock:
+            return {
+                "device": self.device,
+                "precision": self.precision,
+                "batch_size": self.batch_size,
+                "processes": len(self._pool["processes"]) if self._pool else 1,
+                "texts_embedded": self._texts,
+                "calls": self._calls,
+                "texts_per_second": round(self._texts / self._seconds, 1) if self._seconds else 0.0,
+            }
+
+    def close(self) -> None:
+        """停止多进程编码池"""
+        if self._pool is not None:
+            self.client.stop_multi_process_pool(self._pool)
+            self._pool = None
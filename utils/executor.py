@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+# 启用批处理生成时默认与GenerationScheduler的批大小一致，使并发请求可以合并到同一批次；
+# 未启用时pipeline逐个生成，默认只允许一个推理任务同时运行
+INFERENCE_CONCURRENCY = int(os.getenv(
+    "INFERENCE_CONCURRENCY",
+    os.getenv("GENERATION_BATCH_SIZE", "4") if os.getenv("GENERATION_BATCHING", "1") == "1" else "1"
+))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_QUEUE_SIZE = int(os.getenv("CPU_QUEUE_SIZE", "32"))
+
+class QueueFullError(Exception):
+    """执行器队列已满"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """带有界等待队列的线程池
+
+    同时运行的任务数不超过max_workers，排队任务数不超过max_queue，
+    队列满时立即抛出QueueFullError而不是无限等待。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """提交任务，Future的结果为 (返回值, 排队等待毫秒数)"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError(self.name, self._estimate_retry_after())
+
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+
+        def _run() -> Tuple[Any, float]:
+            started_at = time.monotonic()
+            wait = started_at - enqueued_at
+            with self._lock:
+                self._running += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return fn(*args, **kwargs), round(wait * 1000, 2)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self._completed += 1
+                    self._total_run += time.monotonic() - started_at
+                self._slots.release()
+
+        def _on_done(future: Future) -> None:
+            # 排队中被取消（如等待的协程被取消）的任务不会执行_run，在此归还名额
+            if future.cancelled():
+                with self._lock:
+                    self._pending -= 1
+                    self._cancelled += 1
+                self._slots.release()
+
+        try:
+            future = self._pool.submit(_run)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(_on_done)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, float]:
+        """在执行器中运行任务并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _estimate_retry_after(self) -> int:
+        """按平均执行时间估算队列排空所需的秒数"""
+        with self._lock:
+            avg_run = self._total_run / self._completed if self._completed else 1.0
+            queued = max(self._pending - self._running, 0)
+        return max(1, int(avg_run * (queued + 1) / self.max_workers + 0.5))
+
+    def stats(self) -> Dict[str, Any]:
+        """执行器指标"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(self._pending - self._running, 0),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "cancelled": self._cancelled,
+                "avg_queue_wait_ms": round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                "max_queue_wait_ms": round(self._max_wait * 1000, 2),
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+# 模型推理执行器：限制同时进行的生成任务数量
+inference_executor = BoundedExecutor("inference", INFERENCE_CONCURRENCY, INFERENCE_QUEUE_SIZE)
+# CPU密集任务执行器：文档解析、分块与向量化
+cpu_executor = BoundedExecutor("cpu", CPU_POOL_WORKERS, CPU_QUEUE_SIZE)
@@ -1,19 +1,47 @@
 import os
-from typing import List, Optional
+import hashlib
+import threading
+from typing import Dict, Iterator, List, Tuple
 from langchain_community.document_loaders import (
-    PyPDFLoader,
     TextLoader,
     Docx2txtLoader,
 )
+from utils.ingestion import iter_pdf_pages
 
 class FileProcessor:
     """文件处理工具类"""
+
+    _digest_cache: Dict[str, Tuple[float, int, str]] = {}
+    _digest_lock = threading.Lock()
+
+    @classmethod
+    def file_digest(cls, file_path: str) -> str:
+        """
+        计算文件内容的SHA-256摘要
+        按(路径, 修改时间, 大小)缓存，文件未变化时不重复读取
+        """
+        stat = os.stat(file_path)
+        with cls._digest_lock:
+            cached = cls._digest_cache.get(file_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+
+        with cls._digest_lock:
+            cls._digest_cache[file_path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
     
     @staticmethod
-    def load_document(file_path: str) -> List[str]:
+    def iter_pages(file_path: str) -> Iterator[str]:
         """
-        根据文件类型加载文档
+        根据文件类型逐页生成文档文本
         支持: .txt, .pdf, .docx
+        PDF在进程池中按页并行解析，按页序惰性返回
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
@@ -22,25 +50,31 @@ class FileProcessor:
         
         try:
             if file_extension == '.pdf':
-                loader = PyPDFLoader(file_path)
-                documents = loader.load()
-                return [doc.page_content for doc in documents]
+                yield from iter_pdf_pages(file_path)
                 
             elif file_extension == '.txt':
                 loader = TextLoader(file_path, encoding='utf-8')
-                documents = loader.load()
-                return [doc.page_content for doc in documents]
+                for doc in loader.lazy_load():
+                    yield doc.page_content
                 
             elif file_extension == '.docx':
                 loader = Docx2txtLoader(file_path)
-                documents = loader.load()
-                return [doc.page_content for doc in documents]
+                for doc in loader.lazy_load():
+                    yield doc.page_content
                 
             else:
                 raise ValueError(f"Unsupported file type: {file_extension}")
                 
         except Exception as e:
             raise Exception(f"Error loading document: {str(e)}")
+
+    @staticmethod
+    def load_document(file_path: str) -> List[str]:
+        """
+        根据文件类型加载文档的全部页面
+        支持: .txt, .pdf, .docx
+        """
+        return list(FileProcessor.iter_pages(file_path))
     
     @staticmethod
     def split_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
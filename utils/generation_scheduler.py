@@ -0,0 +1,580 @@
+import os
+import time
+import queue
+import inspect
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+import torch
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, LLMResult
+from langchain_community.llms.utils import enforce_stop_tokens
+
+try:
+    from transformers import DynamicCache # type: ignore
+except ImportError:  # 旧版本transformers直接使用元组形式的KV缓存
+    DynamicCache = None
+
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "4"))
+GENERATION_BATCH_WINDOW_MS = float(os.getenv("GENERATION_BATCH_WINDOW_MS", "20"))
+
+# 是否复用已注册提示前缀的KV缓存，关闭时仍按前缀统计预填充耗时，便于对比
+GENERATION_PREFIX_CACHE = os.getenv("GENERATION_PREFIX_CACHE", "1") == "1"
+# 前缀KV缓存的总token数上限，超出时淘汰最久未使用的前缀
+GENERATION_PREFIX_CACHE_TOKENS = int(os.getenv("GENERATION_PREFIX_CACHE_TOKENS", "16384"))
+# 短于该token数的前缀不值得缓存
+PREFIX_MIN_TOKENS = 16
+# 未匹配任何前缀的请求在预填充指标中的标签
+UNMATCHED_PREFIX = "other"
+
+# 单个请求可覆盖的采样参数
+SAMPLING_PARAMS = ("do_sample", "max_new_tokens", "temperature", "top_p", "top_k", "repetition_penalty")
+
+def prompt_prefix(template: str) -> str:
+    """提示模板中第一个变量之前的静态部分"""
+    index = template.find("{")
+    return template if index < 0 else template[:index]
+
+def _to_legacy_cache(cache: Any) -> Any:
+    """将模型返回的KV缓存转换为 ((key, value), ...) 元组形式"""
+    if hasattr(cache, "to_legacy_cache"):
+        return cache.to_legacy_cache()
+    if hasattr(cache, "layers"):
+        return tuple((layer.keys, layer.values) for layer in cache.layers)
+    return cache
+
+def _from_legacy_cache(legacy: Any) -> Any:
+    """将元组形式的KV缓存转换回模型接受的缓存对象"""
+    if DynamicCache is not None and hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(legacy)
+    return legacy
+
+class _GenerationRequest:
+    """调度队列中的单个生成请求"""
+
+    def __init__(self, prompt_ids: List[int], params: Dict[str, Any], future: Future, streamer: Any = None,
+                 stop_event: Optional[threading.Event] = None):
+        self.prompt_ids = prompt_ids
+        self.params = params
+        self.future = future
+        self.streamer = streamer
+        # 被设置时（如客户端断开）提前结束，释放批次位置
+        self.stop_event = stop_event
+        self.generated: List[int] = []
+        self.seen = set(prompt_ids)  # 用于重复惩罚
+        self.submitted_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        # 匹配到的提示前缀
+        self.prefix: Optional[str] = None
+        self.prefix_ids: List[int] = []
+
+class GenerationScheduler:
+    """连续批处理生成调度器
+
+    在短时间窗口内收集待处理的prompt，左填充后合并为一个批次逐步解码；
+    已结束的序列立即移出批次释放位置，新请求在下一步解码前预填充并并入批次。
+    prompt以已注册的静态前缀开头时，复用该前缀的KV缓存，只预填充后面的可变部分。
+    """
+
+    def __init__(self, model, tokenizer, default_params: Dict[str, Any],
+                 max_batch_size: int = GENERATION_BATCH_SIZE,
+                 batch_window_ms: float = GENERATION_BATCH_WINDOW_MS):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.default_params = {key: default_params[key] for key in SAMPLING_PARAMS if key in default_params}
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000
+        self.device = model.device
+
+        eos_token_id = tokenizer.eos_token_id
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self._accepts_position_ids = "position_ids" in inspect.signature(model.forward).parameters
+        # 复用前缀时前缀与后缀之间可能有填充，需要显式传入position_ids
+        self.prefix_cache_enabled = GENERATION_PREFIX_CACHE and self._accepts_position_ids
+
+        # 前缀名称 -> token ids；前缀KV缓存只在调度线程中读写
+        self._prefixes: Dict[str, List[int]] = {}
+        self._prefix_kv: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._prefix_kv_tokens = 0
+
+        self._queue: "queue.Queue[_GenerationRequest]" = queue.Queue()
+        self._stopped = threading.Event()
+        # 保证shutdown之后不会再有请求进入队列
+        self._submit_lock = threading.Lock()
+
+        # 当前批次状态
+        self._rows: List[_GenerationRequest] = []
+        self._cache: Any = None
+        self._mask: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+
+        # 指标
+        self._lock = threading.Lock()
+        self._steps = 0
+        self._batch_size_total = 0
+        self._max_batch_seen = 0
+        self._prefills = 0
+        self._tokens_generated = 0
+        self._decode_time = 0.0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._ttft_total = 0.0
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+        # 前缀标签 -> 预填充次数、耗时与token数
+        self._prefill_stats: Dict[str, Dict[str, float]] = {}
+
+        self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    def register_prefix(self, name: str, text: str) -> None:
+        """
+        注册提示模板的静态前缀
+        去掉最后一个token，避免其与后续文本在分词时合并导致前缀不一致
+        """
+        prefix_ids = self.tokenizer(text, add_special_tokens=True)["input_ids"][:-1]
+        if len(prefix_ids) < PREFIX_MIN_TOKENS:
+            return
+        with self._lock:
+            if self._prefixes.get(name) != prefix_ids:
+                self._prefixes[name] = prefix_ids
+
+    def submit(self, prompt: str, streamer: Any = None, stop_event: Optional[threading.Event] = None,
+               **params) -> Future:
+        """提交生成请求，返回结果为生成文本的Future；stop_event被设置后请求提前结束，结果为已生成的文本"""
+        merged = dict(self.default_params)
+        merged.update({key: value for key, value in params.items() if key in SAMPLING_PARAMS and value is not None})
+        prompt_ids = self.tokenizer(prompt, add_special_tokens=True)["input_ids"]
+        future: Future = Future()
+        request = _GenerationRequest(prompt_ids, merged, future, streamer, stop_event)
+        self._match_prefix(request)
+        with self._submit_lock:
+            if self._stopped.is_set():
+                raise RuntimeError("Generation scheduler has been shut down")
+            self._queue.put(request)
+        return future
+
+    def _match_prefix(self, request: _GenerationRequest) -> None:
+        """为请求匹配最长的已注册前缀，prompt必须比前缀长"""
+        with self._lock:
+            prefixes = list(self._prefixes.items())
+        for name, prefix_ids in prefixes:
+            if len(prefix_ids) <= len(request.prefix_ids) or len(prefix_ids) >= len(request.prompt_ids):
+                continue
+            if request.prompt_ids[:len(prefix_ids)] == prefix_ids:
+                request.prefix = name
+                request.prefix_ids = prefix_ids
+
+    def generate(self, prompt: str, **params) -> str:
+        """阻塞生成，直到返回完整文本"""
+        return self.submit(prompt, **params).result()
+
+    def shutdown(self) -> None:
+        """
+        停止调度线程，批次中与队列中未完成的请求以异常结束，避免调用方一直等待
+        批次状态只由调度线程读写，由它在当前步骤结束后自行结束剩余请求；这里最多等待5秒
+        """
+        with self._submit_lock:
+            self._stopped.set()
+        self._thread.join(timeout=5)
+        if self._thread.is_alive():
+            print("[GenerationScheduler] Scheduler thread still finishing the current step")
+
+    def stats(self) -> Dict[str, Any]:
+        """批大小与吞吐指标"""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "active": len(self._rows),
+                "queued": self._queue.qsize(),
+                "decode_steps": self._steps,
+                "prefills": self._prefills,
+                "avg_batch_size": round(self._batch_size_total / self._steps, 2) if self._steps else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "tokens_generated": self._tokens_generated,
+                "tokens_per_sec": round(self._tokens_generated / self._decode_time, 2) if self._decode_time else 0.0,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "avg_time_to_first_token_ms": round(self._ttft_total / self._completed * 1000, 2) if self._completed else 0.0,
+                "prefix_cache": {
+                    "enabled": self.prefix_cache_enabled,
+                    "registered": len(self._prefixes),
+                    "entries": len(self._prefix_kv),
+                    "tokens": self._prefix_kv_tokens,
+                    "hits": self._prefix_hits,
+                    "misses": self._prefix_misses,
+                },
+                "prefill": {
+                    label: {
+                        "requests": int(entry["requests"]),
+                        "avg_prefill_ms": round(entry["time"] / entry["requests"] * 1000, 2),
+                        "avg_prefill_tokens": round(entry["tokens"] / entry["requests"], 1),
+                        "avg_reused_tokens": round(entry["reused"] / entry["requests"], 1),
+                    }
+                    for label, entry in self._prefill_stats.items()
+                },
+            }
+
+    def _loop(self) -> None:
+        while not self._stopped.is_set():
+            new_requests: List[_GenerationRequest] = []
+            try:
+                new_requests = self._collect()
+                started = time.monotonic()
+                with torch.inference_mode():
+                    if new_requests:
+                        self._prefill(new_requests)
+                    if self._rows:
+                        self._decode_step()
+                with self._lock:
+                    self._decode_time += time.monotonic() - started
+            except Exception as e:
+                print(f"[GenerationScheduler] Error during generation: {str(e)}")
+                self._fail_all(e, new_requests)
+        # shutdown之后不会再有请求入队，结束批次中与队列中剩余的请求
+        pending: List[_GenerationRequest] = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._fail_all(RuntimeError("Generation scheduler has been shut down"), pending)
+
+    def _collect(self) -> List[_GenerationRequest]:
+        """收集新请求：批次为空时阻塞等待并在窗口期内继续收集，否则只取已到达的请求"""
+        free_slots = self.max_batch_size - len(self._rows)
+        requests: List[_GenerationRequest] = []
+        if free_slots <= 0:
+            return requests
+
+        if not self._rows:
+            try:
+                requests.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                return requests
+            deadline = time.monotonic() + self.batch_window
+            while len(requests) < free_slots:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    requests.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            while len(requests) < free_slots:
+                try:
+                    requests.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return requests
+
+    def _prefill(self, requests: List[_GenerationRequest]) -> None:
+        """按前缀分组预填充新请求，同一前缀的请求共享一次前向计算"""
+        groups: Dict[Optional[str], List[_GenerationRequest]] = {}
+        for request in requests:
+            # 排队期间已取消的请求不再预填充
+            if request.stop_event is not None and request.stop_event.is_set():
+                self._finish(request, cancelled=True)
+                continue
+            groups.setdefault(request.prefix if self.prefix_cache_enabled else None, []).append(request)
+        for prefix, group in groups.items():
+            started = time.monotonic()
+            self._prefill_group(group, prefix)
+            self._record_prefill(group, prefix, time.monotonic() - started)
+
+    def _prefill_group(self, requests: List[_GenerationRequest], prefix: Optional[str]) -> None:
+        """
+        左填充新请求并批量预填充，然后并入当前批次
+        prefix不为None时以该前缀的KV缓存为起点，只预填充各请求在前缀之后的部分
+        """
+        prefix_len = len(requests[0].prefix_ids) if prefix is not None else 0
+        prefix_cache = self._get_prefix_cache(prefix, requests[0].prefix_ids) if prefix is not None else None
+
+        suffixes = [request.prompt_ids[prefix_len:] for request in requests]
+        max_len = max(len(suffix) for suffix in suffixes)
+        input_ids = torch.full((len(requests), max_len), self.pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+        for i, suffix in enumerate(suffixes):
+            input_ids[i, max_len - len(suffix):] = torch.tensor(suffix, dtype=torch.long)
+            suffix_mask[i, max_len - len(suffix):] = 1
+        input_ids = input_ids.to(self.device)
+        # 完整的mask为 [前缀][填充][后缀]，填充位置被屏蔽
+        mask = torch.cat([torch.ones((len(requests), prefix_len), dtype=torch.long), suffix_mask], dim=1).to(self.device)
+
+        kwargs = {}
+        if self._accepts_position_ids:
+            position_ids = (mask.cumsum(-1) - 1)[:, prefix_len:]
+            kwargs["position_ids"] = position_ids.masked_fill(mask[:, prefix_len:] == 0, 1)
+        if prefix_cache is not None:
+            kwargs["past_key_values"] = _from_legacy_cache(tuple(
+                (k.expand(len(requests), -1, -1, -1).contiguous(), v.expand(len(requests), -1, -1, -1).contiguous())
+                for k, v in prefix_cache
+            ))
+        outputs = self.model(input_ids=input_ids, attention_mask=mask, use_cache=True, **kwargs)
+        with self._lock:
+            self._prefills += 1
+
+        next_tokens = self._sample(outputs.logits[:, -1, :], requests)
+        keep = self._record_tokens(requests, next_tokens)
+        if not keep:
+            return
+
+        new_cache = _to_legacy_cache(outputs.past_key_values)
+        keep_index = torch.tensor(keep, device=self.device)
+        new_cache = tuple((k.index_select(0, keep_index), v.index_select(0, keep_index)) for k, v in new_cache)
+        new_mask = mask.index_select(0, keep_index)
+        new_rows = [requests[i] for i in keep]
+        new_next = next_tokens.index_select(0, keep_index)
+
+        if not self._rows:
+            self._rows = new_rows
+            self._cache = _from_legacy_cache(new_cache)
+            self._mask = new_mask
+            self._next_tokens = new_next
+            return
+
+        # 对齐长度后在batch维拼接：较短的一方在左侧补零并用mask屏蔽
+        old_cache = _to_legacy_cache(self._cache)
+        old_len = self._mask.shape[1]
+        new_len = new_mask.shape[1]
+        total = max(old_len, new_len)
+        merged = []
+        for (old_k, old_v), (new_k, new_v) in zip(old_cache, new_cache):
+            merged.append((
+                torch.cat([self._pad_left(old_k, total), self._pad_left(new_k, total)], dim=0),
+                torch.cat([self._pad_left(old_v, total), self._pad_left(new_v, total)], dim=0),
+            ))
+        self._cache = _from_legacy_cache(tuple(merged))
+        self._mask = torch.cat([self._pad_left_mask(self._mask, total), self._pad_left_mask(new_mask, total)], dim=0)
+        self._next_tokens = torch.cat([self._next_tokens, new_next], dim=0)
+        self._rows = self._rows + new_rows
+
+    def _get_prefix_cache(self, name: str, prefix_ids: List[int]) -> Any:
+        """返回前缀的KV缓存（元组形式，batch为1），未缓存或前缀已变化时计算并按LRU淘汰"""
+        entry = self._prefix_kv.get(name)
+        if entry is not None and entry["ids"] is prefix_ids:
+            self._prefix_kv.move_to_end(name)
+            with self._lock:
+                self._prefix_hits += 1
+            return entry["cache"]
+
+        input_ids = torch.tensor([prefix_ids], dtype=torch.long, device=self.device)
+        outputs = self.model(input_ids=input_ids, use_cache=True)
+        cache = _to_legacy_cache(outputs.past_key_values)
+        if entry is not None:
+            self._prefix_kv_tokens -= len(entry["ids"])
+        self._prefix_kv[name] = {"ids": prefix_ids, "cache": cache}
+        self._prefix_kv_tokens += len(prefix_ids)
+        # 最新计算的前缀即使单独超出上限也保留
+        while self._prefix_kv_tokens > GENERATION_PREFIX_CACHE_TOKENS and len(self._prefix_kv) > 1:
+            _, evicted = self._prefix_kv.popitem(last=False)
+            self._prefix_kv_tokens -= len(evicted["ids"])
+        with self._lock:
+            self._prefix_misses += 1
+        return cache
+
+    def _record_prefill(self, requests: List[_GenerationRequest], prefix: Optional[str], elapsed: float) -> None:
+        """按前缀标签记录预填充耗时，同组请求共享一次前向计算的耗时"""
+        with self._lock:
+            for request in requests:
+                entry = self._prefill_stats.setdefault(
+                    request.prefix or UNMATCHED_PREFIX,
+                    {"requests": 0, "time": 0.0, "tokens": 0, "reused": 0}
+                )
+                reused = len(request.prefix_ids) if prefix is not None else 0
+                entry["requests"] += 1
+                entry["time"] += elapsed
+                entry["tokens"] += len(request.prompt_ids) - reused
+                entry["reused"] += reused
+
+    def _decode_step(self) -> None:
+        """对当前批次执行一步解码"""
+        batch_size = len(self._rows)
+        self._mask = torch.cat(
+            [self._mask, torch.ones((batch_size, 1), dtype=self._mask.dtype, device=self._mask.device)],
+            dim=1
+        )
+        kwargs = {}
+        if self._accepts_position_ids:
+            kwargs["position_ids"] = (self._mask.sum(dim=1, keepdim=True) - 1)
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=self._mask,
+            past_key_values=self._cache,
+            use_cache=True,
+            **kwargs
+        )
+        self._cache = outputs.past_key_values
+
+        with self._lock:
+            self._steps += 1
+            self._batch_size_total += batch_size
+            self._max_batch_seen = max(self._max_batch_seen, batch_size)
+
+        next_tokens = self._sample(outputs.logits[:, -1, :], self._rows)
+        keep = self._record_tokens(self._rows, next_tokens)
+        if len(keep) == batch_size:
+            self._next_tokens = next_tokens
+            return
+
+        # 移除已结束的序列，释放批次位置
+        if not keep:
+            self._reset_batch()
+            return
+        keep_index = torch.tensor(keep, device=self.device)
+        legacy = _to_legacy_cache(self._cache)
+        mask = self._mask.index_select(0, keep_index)
+        # 裁掉所有剩余序列都为填充的左侧列
+        offset = int((mask.cumsum(dim=1) == 0).sum(dim=1).min().item())
+        self._cache = _from_legacy_cache(tuple(
+            (k.index_select(0, keep_index)[:, :, offset:], v.index_select(0, keep_index)[:, :, offset:])
+            for k, v in legacy
+        ))
+        self._mask = mask[:, offset:]
+        self._next_tokens = next_tokens.index_select(0, keep_index)
+        self._rows = [self._rows[i] for i in keep]
+
+    def _sample(self, logits: torch.Tensor, requests: List[_GenerationRequest]) -> torch.Tensor:
+        """按每个请求自己的采样参数选出下一个token"""
+        logits = logits.float()
+        tokens = []
+        for i, request in enumerate(requests):
+            params = request.params
+            row = logits[i]
+
+            penalty = params.get("repetition_penalty", 1.0)
+            if penalty and penalty != 1.0 and request.seen:
+                seen = torch.tensor(list(request.seen), device=row.device)
+                scores = row.index_select(0, seen)
+                scores = torch.where(scores < 0, scores * penalty, scores / penalty)
+                row = row.index_copy(0, seen, scores)
+
+            temperature = params.get("temperature", 1.0)
+            if not params.get("do_sample", False) or not temperature:
+                tokens.append(int(torch.argmax(row).item()))
+                continue
+
+            row = row / temperature
+            top_k = params.get("top_k", 0)
+            if top_k and top_k < row.shape[-1]:
+                threshold = torch.topk(row, top_k).values[-1]
+                row = row.masked_fill(row < threshold, float("-inf"))
+            top_p = params.get("top_p", 1.0)
+            if top_p and top_p < 1.0:
+                sorted_logits, sorted_index = torch.sort(row, descending=True)
+                cumulative = torch.softmax(sorted_logits, dim=-1).cumsum(dim=-1)
+                remove = cumulative > top_p
+                remove[1:] = remove[:-1].clone()
+                remove[0] = False
+                row = row.index_fill(0, sorted_index[remove], float("-inf"))
+            probs = torch.softmax(row, dim=-1)
+            tokens.append(int(torch.multinomial(probs, num_samples=1).item()))
+        return torch.tensor(tokens, dtype=torch.long, device=self.device)
+
+    def _record_tokens(self, requests: List[_GenerationRequest], tokens: torch.Tensor) -> List[int]:
+        """记录新token并结束完成的请求，返回仍需继续解码的行号"""
+        keep = []
+        now = time.monotonic()
+        for i, token in enumerate(tokens.tolist()):
+            request = requests[i]
+            if request.first_token_at is None:
+                request.first_token_at = now
+            if request.stop_event is not None and request.stop_event.is_set():
+                self._finish(request, cancelled=True)
+                continue
+            finished = token in self.eos_token_ids
+            if not finished:
+                request.generated.append(token)
+                request.seen.add(token)
+                if request.streamer is not None:
+                    request.streamer.put(torch.tensor([token]))
+                finished = len(request.generated) >= request.params.get("max_new_tokens", 256)
+            if finished:
+                self._finish(request)
+            else:
+                keep.append(i)
+        with self._lock:
+            self._tokens_generated += len(tokens)
+        return keep
+
+    def _finish(self, request: _GenerationRequest, cancelled: bool = False) -> None:
+        text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        if request.streamer is not None:
+            request.streamer.end()
+        with self._lock:
+            if cancelled:
+                self._cancelled += 1
+            else:
+                self._completed += 1
+                self._ttft_total += request.first_token_at - request.submitted_at
+        request.future.set_result(text)
+
+    def _fail_all(self, error: Exception, pending: List[_GenerationRequest]) -> None:
+        """生成出错时结束当前批次中的所有请求"""
+        failed = {id(request): request for request in self._rows + pending if not request.future.done()}.values()
+        for request in failed:
+            if request.streamer is not None:
+                request.streamer.end()
+            request.future.set_exception(error)
+        with self._lock:
+            self._failed += len(failed)
+        self._reset_batch()
+
+    def _reset_batch(self) -> None:
+        self._rows = []
+        self._cache = None
+        self._mask = None
+        self._next_tokens = None
+
+    @staticmethod
+    def _pad_left(tensor: torch.Tensor, length: int) -> torch.Tensor:
+        """在序列维（第2维）左侧补零"""
+        pad = length - tensor.shape[2]
+        if pad <= 0:
+            return tensor
+        zeros = torch.zeros(
+            (tensor.shape[0], tensor.shape[1], pad, tensor.shape[3]),
+            dtype=tensor.dtype,
+            device=tensor.device
+        )
+        return torch.cat([zeros, tensor], dim=2)
+
+    @staticmethod
+    def _pad_left_mask(mask: torch.Tensor, length: int) -> torch.Tensor:
+        pad = length - mask.shape[1]
+        if pad <= 0:
+            return mask
+        zeros = torch.zeros((mask.shape[0], pad), dtype=mask.dtype, device=mask.device)
+        return torch.cat([zeros, mask], dim=1)
+
+class SchedulerLLM(LLM):
+    """通过GenerationScheduler生成文本的LangChain LLM"""
+
+    scheduler: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "huggingface_scheduler"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        text = self.scheduler.generate(prompt, **kwargs)
+        if stop:
+            text = enforce_stop_tokens(text, stop)
+        return text
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> LLMResult:
+        """同时提交全部prompt，使llm.batch能够合并到同一批次"""
+        futures = [self.scheduler.submit(prompt, **kwargs) for prompt in prompts]
+        generations = []
+        for future in futures:
+            text = future.result()
+            if stop:
+                text = enforce_stop_tokens(text, stop)
+            generations.append([Generation(text=text)])
+        return LLMResult(generations=generations)
@@ -0,0 +1,98 @@
+"""
+将论文元数据批量导入本地论文索引
+
+    python -m utils.import_papers --crossref-db database/crossref.db
+    python -m utils.import_papers --file works.jsonl --file crossref-dump/0.json.gz
+
+支持的输入：CrossRef检索缓存数据库、每行一个条目的JSONL，以及CrossRef公开数据的
+JSON文件（顶层为 {"items": [...]}，可为.gz压缩）。条目可以是CrossRef原始work格式，
+也可以是包含 doi/title/authors/year/abstract 字段的论文元数据。
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.crossref import parse_work
+from utils.paper_index import PaperIndex, PAPER_INDEX_DIR
+
+def _to_paper(item: Dict[str, Any]) -> Dict[str, Any]:
+    return parse_work(item) if "DOI" in item else item
+
+def iter_file(path: str) -> Iterator[Dict[str, Any]]:
+    """逐条读取JSONL或 {"items": [...]} 格式的JSON文件"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if path.endswith((".jsonl", ".jsonl.gz")) or first != "{":
+            for line in f:
+                if line.strip():
+                    yield _to_paper(json.loads(line))
+            return
+        data = json.load(f)
+        items = data.get("items") or data.get("message", {}).get("items") or [data]
+        for item in items:
+            yield _to_paper(item)
+
+def iter_crossref_db(path: str) -> Iterator[Dict[str, Any]]:
+    """读取CrossRef检索缓存中保存的论文元数据"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute("SELECT * FROM papers"):
+            yield {
+                "doi": row["doi"],
+                "title": row["title"],
+                "authors": json.loads(row["authors"]),
+                "year": row["year"],
+                "abstract": row["abstract"],
+                "url": row["url"],
+            }
+    finally:
+        conn.close()
+
+def import_papers(index: PaperIndex, papers: Iterator[Dict[str, Any]], batch_size: int = 1000) -> Dict[str, int]:
+    """分批写入论文索引，返回读取与新增的数量"""
+    counts = {"read": 0, "added": 0}
+    batch = []
+    for paper in papers:
+        batch.append(paper)
+        counts["read"] += 1
+        if len(batch) >= batch_size:
+            counts["added"] += index.add_papers(batch)
+            batch = []
+            print(f"[ImportPapers] read={counts['read']} added={counts['added']}")
+    if batch:
+        counts["added"] += index.add_papers(batch)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Import paper metadata into the local paper index")
+    parser.add_argument("--crossref-db", help="CrossRef检索缓存数据库路径")
+    parser.add_argument("--file", action="append", default=[], help="JSONL或JSON(.gz)文件，可重复指定")
+    parser.add_argument("--index-dir", default=PAPER_INDEX_DIR, help="论文索引目录")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if not args.crossref_db and not args.file:
+        parser.error("specify --crossref-db and/or --file")
+
+    index = PaperIndex(args.index_dir)
+    started = time.time()
+    totals = {"read": 0, "added": 0}
+    sources = ([iter_crossref_db(args.crossref_db)] if args.crossref_db else []) + [iter_file(p) for p in args.file]
+    for source in sources:
+        counts = import_papers(index, source, args.batch_size)
+        totals = {key: totals[key] + counts[key] for key in totals}
+    index.cleanup()
+    print(f"[ImportPapers] read={totals['read']} added={totals['added']} "
+          f"papers={index.count()} in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from utils.executor import cpu_executor
+from utils.ingestion import count_pdf_pages
+
+# 保留的已结束任务数
+INDEX_JOB_HISTORY = int(os.getenv("INDEX_JOB_HISTORY", "256"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+class IndexJobManager:
+    """后台索引任务管理器
+
+    文件上传后立即在CPU执行器中解析并向量化文档，记录已解析页数与已向量化分块数。
+    任务以向量存储名称为ID，同一内容只建立一个任务；问答路由通过Vectorizer的
+    在途任务去重等待同一次解析，而不是重新处理文档。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._vectorizer = None
+
+    @classmethod
+    def get_instance(cls) -> "IndexJobManager":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = IndexJobManager()
+        return cls._instance
+
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            from utils.vectorizer import Vectorizer
+            self._vectorizer = Vectorizer()
+        return self._vectorizer
+
+    def submit(self, file_path: str) -> Dict[str, Any]:
+        """
+        为文件创建索引任务并返回任务状态
+        相同内容已有未失败的任务时直接返回该任务；执行器队列已满时抛出QueueFullError
+        """
+        job_id = self.vectorizer.get_store_name(file_path)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] != JOB_FAILED:
+                return dict(job)
+            job = {
+                "job_id": job_id,
+                "status": JOB_QUEUED,
+                "pages_total": None,
+                "pages_parsed": 0,
+                "chunks_embedded": 0,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._jobs[job_id] = job
+            self._trim()
+
+        try:
+            cpu_executor.submit(self._run, job_id, file_path)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def cleanup(self):
+        """释放Vectorizer持有的模型引用"""
+        if self._vectorizer is not None:
+            self._vectorizer.cleanup()
+            self._vectorizer = None
+
+    def _run(self, job_id: str, file_path: str) -> None:
+        self._update(job_id, status=JOB_RUNNING, started_at=time.time())
+        try:
+            if file_path.lower().endswith(".pdf"):
+                self._update(job_id, pages_total=count_pdf_pages(file_path))
+
+            def _progress(stage: str, count: int):
+                self._update(job_id, **{"pages_parsed" if stage == "pages" else "chunks_embedded": count})
+
+            vector_store = self.vectorizer.process_file(file_path, job_id, progress=_progress)
+            self._update(job_id, status=JOB_DONE, chunks_embedded=vector_store.index.ntotal, finished_at=time.time())
+            print(f"[IndexJobs] Indexed {file_path}")
+        except Exception as e:
+            print(f"[IndexJobs] Error indexing {file_path}: {str(e)}")
+            self._update(job_id, status=JOB_FAILED, error=str(e), finished_at=time.time())
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _trim(self) -> None:
+        """只保留最近的INDEX_JOB_HISTORY个已结束任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (JOB_DONE, JOB_FAILED)]
+        for job_id in finished[:max(0, len(finished) - INDEX_JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+index_jobs = IndexJobManager.get_instance()
@@ -0,0 +1,73 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 每个解析任务处理的页数
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+# 同时在途（解析中或已解析未消费）的最大页数，决定解析阶段的内存上限
+INGEST_PAGE_WINDOW = int(os.getenv("INGEST_PAGE_WINDOW", "64"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    """懒加载解析进程池，使用spawn避免fork已加载模型与CUDA上下文的主进程"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def shutdown() -> None:
+    """关闭解析进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[str]:
+    """在子进程中提取PDF第start到end-1页的文本"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def count_pdf_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+def iter_pdf_pages(file_path: str,
+                   pages_per_task: int = INGEST_PAGES_PER_TASK,
+                   page_window: int = INGEST_PAGE_WINDOW) -> Iterator[str]:
+    """
+    按页序逐页生成PDF文本
+    页面分批提交到进程池并行解析，在途页数不超过page_window，
+    消费端处理完一批后才提交下一批，内存占用与文档总页数无关
+    """
+    total = count_pdf_pages(file_path)
+    if total == 0:
+        return
+    pool = _get_pool()
+    max_tasks = max(1, page_window // pages_per_task)
+    pending: Deque[Future] = deque()
+    next_page = 0
+
+    try:
+        while next_page < total or pending:
+            while next_page < total and len(pending) < max_tasks:
+                end = min(next_page + pages_per_task, total)
+                pending.append(pool.submit(_extract_pages, file_path, next_page, end))
+                next_page = end
+            for text in pending.popleft().result():
+                yield text
+    finally:
+        # 消费端提前退出时取消尚未开始的解析任务
+        for future in pending:
+            future.cancel()
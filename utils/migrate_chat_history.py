@@ -0,0 +1,61 @@
+"""
+将 chat_history/ 下的JSON聊天记录导入SQLite聊天存储
+
+    python -m utils.migrate_chat_history
+    python -m utils.migrate_chat_history --source chat_history --db chat_history/chats.db --overwrite
+
+已存在的会话默认跳过；导入成功的JSON文件可通过 --remove 删除。
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chat_store import ChatStore, CHAT_DB_PATH
+
+def migrate(store: ChatStore, source_dir: str, overwrite: bool = False, remove: bool = False) -> dict:
+    """导入source_dir中的全部JSON聊天记录，返回导入、跳过与失败的数量"""
+    counts = {"imported": 0, "skipped": 0, "failed": 0}
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(source_dir, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                chat_data = json.load(f)
+            chat_id = chat_data.get("id") or os.path.splitext(filename)[0]
+            if not overwrite and store.has_chat(chat_id):
+                counts["skipped"] += 1
+                continue
+            store.save_chat(
+                chat_id,
+                chat_data.get("title", "新对话"),
+                chat_data.get("messages", []),
+                file_path=chat_data.get("file_path"),
+                timestamp=chat_data.get("timestamp")
+            )
+            counts["imported"] += 1
+            if remove:
+                os.remove(path)
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[Migrate] Failed to import {filename}: {e}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JSON chat history into the SQLite chat store")
+    parser.add_argument("--source", default="chat_history", help="JSON聊天记录目录")
+    parser.add_argument("--db", default=CHAT_DB_PATH, help="SQLite数据库路径")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的会话")
+    parser.add_argument("--remove", action="store_true", help="导入成功后删除JSON文件")
+    args = parser.parse_args()
+
+    store = ChatStore(args.db)
+    counts = migrate(store, args.source, overwrite=args.overwrite, remove=args.remove)
+    store.close()
+    print(f"[Migrate] imported={counts['imported']} skipped={counts['skipped']} failed={counts['failed']}")
+
+if __name__ == "__main__":
+    main()
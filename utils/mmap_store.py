@@ -0,0 +1,681 @@
+"""
+向量存储的内存映射格式
+
+每个向量存储目录包含：
+    vectors.npy   float32 向量矩阵（n×d），以只读内存映射打开（不压缩时）
+    codes.npy     压缩后的向量编码：sq8为每维1字节（n×d），pq为每个子空间1字节（n×m）
+    sq.npy        sq8各维的最小值与取值范围（2×d）
+    pq.npy        pq各子空间的聚类中心（m×k×d/m）
+    rescore.npy   float16 向量，压缩检索的候选按其重新计算距离（可选）
+    norms.npy     各向量（压缩时为解码后向量）的平方范数，L2检索时使用
+    chunks.jsonl  分块文本与元数据，每行一个JSON
+    offsets.npy   int64 行偏移（n+1），按需读取单个分块
+    store.json    格式版本、向量数、维度、距离度量、压缩方式与当前各文件的实际文件名，最后写入，存在即表示存储完整
+
+除store.json外的文件名带版本号（如 vectors.<版本>.npy），重写存储时先写入新版本的文件再替换store.json。
+
+加载时只读取文件头，向量与文本留在页缓存中，多个worker共享同一份物理内存。
+压缩方式在构建时按 VECTOR_STORE_COMPRESSION 选定并记录在store.json中，构建日志报告节省的字节数与召回率损失。
+旧版 index.faiss/index.pkl 在首次加载时原地转换，也可离线批量转换，--compression 同时压缩未压缩的存储：
+
+    python -m utils.mmap_store
+    python -m utils.mmap_store --dir database/vector_store --keep
+    python -m utils.mmap_store --compression sq8
+"""
+import os
+import json
+import mmap
+import pickle
+import argparse
+import uuid
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+# 新建向量存储的压缩方式：none（float32）、sq8（每维int8标量量化）或 pq（乘积量化）
+VECTOR_STORE_COMPRESSION = os.getenv("VECTOR_STORE_COMPRESSION", "none")
+# 压缩存储是否额外保存float16向量，用于对候选重新计算距离
+VECTOR_STORE_RESCORE = os.getenv("VECTOR_STORE_RESCORE", "1") == "1"
+# 重新计算距离的候选数为 k×该倍数
+VECTOR_STORE_RESCORE_FACTOR = int(os.getenv("VECTOR_STORE_RESCORE_FACTOR", "4"))
+# pq子空间数（每个向量的编码字节数），须整除向量维度，0表示每个子空间8维
+VECTOR_STORE_PQ_M = int(os.getenv("VECTOR_STORE_PQ_M", "0"))
+
+FORMAT_VERSION = 1
+META_FILE = "store.json"
+VECTORS_FILE = "vectors.npy"
+CODES_FILE = "codes.npy"
+SQ_FILE = "sq.npy"
+PQ_FILE = "pq.npy"
+RESCORE_FILE = "rescore.npy"
+NORMS_FILE = "norms.npy"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.npy"
+LEGACY_INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+METRIC_L2 = "l2"
+METRIC_IP = "ip"
+
+COMPRESSION_NONE = "none"
+COMPRESSION_SQ8 = "sq8"
+COMPRESSION_PQ = "pq"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_SQ8, COMPRESSION_PQ)
+VECTOR_FILES = {
+    COMPRESSION_NONE: (VECTORS_FILE, NORMS_FILE),
+    COMPRESSION_SQ8: (CODES_FILE, SQ_FILE, NORMS_FILE),
+    COMPRESSION_PQ: (CODES_FILE, PQ_FILE, NORMS_FILE),
+}
+# 每次计算距离的行数，限制解码与类型转换的临时内存
+SEARCH_BLOCK = 4096
+PQ_TRAIN_ITERATIONS = 10
+# 每个聚类中心最多使用的训练样本数，限制大存储的训练耗时
+PQ_TRAIN_POINTS_PER_CENTROID = 64
+# 构建时以存储中的向量为查询，与未压缩的精确检索比较 recall@k
+RECALL_K = 10
+RECALL_SAMPLES = 200
+# 加载时存储恰好被重写（旧文件已删除）的重试次数
+LOAD_ATTEMPTS = 3
+
+class ReadOnlyStoreError(RuntimeError):
+    """向内存映射的向量存储添加或删除内容；需要修改时重新构建存储并用save_store写入"""
+
+    def __init__(self, operation: str):
+        super().__init__(f"[MmapStore] Memory-mapped stores are read-only: {operation} is not supported, "
+                         f"rebuild the store and write it with save_store")
+        self.operation = operation
+
+def is_mmap_store(store_path: str) -> bool:
+    return os.path.isfile(os.path.join(store_path, META_FILE))
+
+def is_legacy_store(store_path: str) -> bool:
+    return (os.path.isfile(os.path.join(store_path, LEGACY_INDEX_FILE))
+            and os.path.isfile(os.path.join(store_path, LEGACY_DOCSTORE_FILE)))
+
+class MmapFlatIndex:
+    """
+    只读的精确检索索引，向量为内存映射的float32矩阵
+    实现langchain FAISS及检索器用到的 ntotal/d/search/reconstruct/reconstruct_n
+    """
+
+    compression = COMPRESSION_NONE
+    # reconstruct是否只能返回有损的近似向量
+    lossy = False
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray, metric: str = METRIC_L2):
+        self.vectors = vectors
+        self._setup(vectors.shape[0], vectors.shape[1], norms, metric)
+
+    def _setup(self, ntotal: int, d: int, norms: np.ndarray, metric: str) -> None:
+        self.norms = norms
+        self.metric = metric
+        self.metric_type = faiss.METRIC_L2 if metric == METRIC_L2 else faiss.METRIC_INNER_PRODUCT
+        self.ntotal = int(ntotal)
+        self.d = int(d)
+
+    @property
+    def heap_bytes(self) -> int:
+        """进程堆上的数组字节数（码本、查询用的常量等），内存映射的数组由多进程共享页面，不计入"""
+        return sum(_heap_nbytes(value) for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    def _query_context(self, x: np.ndarray) -> Any:
+        """每次检索先计算一次、供各块共用的查询数据，作为参数传递以支持并发检索"""
+        return None
+
+    def _inner(self, x: np.ndarray, start: int, end: int, context: Any) -> np.ndarray:
+        """查询与 [start, end) 行向量的内积（q×(end-start)）"""
+        return x @ self.vectors[start:end].T
+
+    def _distances(self, x: np.ndarray) -> np.ndarray:
+        """全部向量的距离，越小越近：L2为平方距离，内积取负"""
+        context = self._query_context(x)
+        scores = np.concatenate(
+            [self._inner(x, start, min(start + SEARCH_BLOCK, self.ntotal), context)
+             for start in range(0, self.ntotal, SEARCH_BLOCK)],
+            axis=1
+        )
+        if self.metric == METRIC_L2:
+            return (x * x).sum(axis=1, keepdims=True) - 2 * scores + self.norms[None, :]
+        return -scores
+
+    def _prepare(self, x: np.ndarray, k: int):
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, self.d)
+        distances = np.full((len(x), k), np.inf if self.metric == METRIC_L2 else -np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        return x, distances, labels
+
+    def _finish(self, distances: np.ndarray, labels: np.ndarray, values: np.ndarray, order: np.ndarray):
+        count = order.shape[1]
+        labels[:, :count] = order
+        distances[:, :count] = values if self.metric == METRIC_L2 else -values
+        return distances, labels
+
+    def _approximate(self, x: np.ndarray, k: int):
+        """按索引自身存储的向量（压缩时为解码后的近似向量）检索"""
+        x, distances, labels = self._prepare(x, k)
+        if self.ntotal == 0 or k <= 0:
+            return distances, labels
+        scores = self._distances(x)
+        count = min(k, self.ntotal)
+        if count < self.ntotal:
+            # 候选按序号排列后再稳定排序，距离相同时与faiss一样序号小的在前
+            top = np.sort(np.argpartition(scores, count - 1, axis=1)[:, :count], axis=1)
+        else:
+            top = np.broadcast_to(np.arange(self.ntotal), (len(x), self.ntotal))
+        order = np.take_along_axis(top, np.argsort(np.take_along_axis(scores, top, axis=1), axis=1, kind="stable"), axis=1)
+        return self._finish(distances, labels, np.take_along_axis(scores, order, axis=1), order)
+
+    def search(self, x: np.ndarray, k: int, params: Any = None):
+        """返回 (distances, labels)，L2为平方距离升序，内积为降序，不足k个时以-1补齐"""
+        return self._approximate(x, k)
+
+    def reconstruct(self, key: int) -> np.ndarray:
+        return np.array(self.vectors[int(key)], dtype=np.float32)
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return np.array(self.vectors[start:start + count], dtype=np.float32)
+
+    def add(self, x: np.ndarray) -> None:
+        raise ReadOnlyStoreError("add")
+
+    def remove_ids(self, ids: Any) -> int:
+        raise ReadOnlyStoreError("remove_ids")
+
+class QuantizedIndex(MmapFlatIndex):
+    """
+    压缩向量的检索索引
+    先按编码计算近似距离取 k×rescore_factor 个候选，再用float16向量重新计算候选的距离；
+    没有float16向量时直接返回近似结果
+    """
+
+    def __init__(self, codes: np.ndarray, d: int, norms: np.ndarray, metric: str = METRIC_L2,
+                 rescore: Optional[np.ndarray] = None, rescore_factor: int = VECTOR_STORE_RESCORE_FACTOR):
+        self.codes = codes
+        self.rescore_vectors = rescore
+        self.rescore_factor = max(1, rescore_factor)
+        # 有float16向量时reconstruct返回它们，否则只能解码编码得到近似向量
+        self.lossy = rescore is None
+        self._setup(codes.shape[0], d, norms, metric)
+
+    def _decode(self, codes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def search(self, x: np.ndarray, k: int, params: Any = None):
+        if self.rescore_vectors is None or self.ntotal == 0 or k <= 0:
+            return self._approximate(x, k)
+        x, distances, labels = self._prepare(x, k)
+        _, candidates = self._approximate(x, min(self.ntotal, k * self.rescore_factor))
+        count = min(k, self.ntotal)
+        order = np.empty((len(x), count), dtype=np.int64)
+        values = np.empty((len(x), count), dtype=np.float32)
+        for row in range(len(x)):
+            # 按序号读取，映射文件的访问保持顺序
+            positions = np.sort(candidates[row])
+            vectors = np.asarray(self.rescore_vectors[positions], dtype=np.float32)
+            scores = vectors @ x[row]
+            if self.metric == METRIC_L2:
+                scores = float(x[row] @ x[row]) - 2 * scores + (vectors * vectors).sum(axis=1)
+            else:
+                scores = -scores
+            best = np.argsort(scores, kind="stable")[:count]
+            order[row], values[row] = positions[best], scores[best]
+        return self._finish(distances, labels, values, order)
+
+    def reconstruct(self, key: int) -> np.ndarray:
+        if self.rescore_vectors is not None:
+            return np.array(self.rescore_vectors[int(key)], dtype=np.float32)
+        return self._decode(self.codes[int(key):int(key) + 1])[0]
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        if self.rescore_vectors is not None:
+            return np.array(self.rescore_vectors[start:start + count], dtype=np.float32)
+        return self._decode(self.codes[start:start + count])
+
+class SQ8Index(QuantizedIndex):
+    """标量量化：每维按构建时的取值范围均匀量化为256级"""
+
+    compression = COMPRESSION_SQ8
+
+    def __init__(self, codes: np.ndarray, ranges: np.ndarray, norms: np.ndarray, metric: str = METRIC_L2,
+                 rescore: Optional[np.ndarray] = None, rescore_factor: int = VECTOR_STORE_RESCORE_FACTOR):
+        self.vmin = np.asarray(ranges[0], dtype=np.float32)
+        self.step = np.asarray(ranges[1], dtype=np.float32) / 255
+        super().__init__(codes, codes.shape[1], norms, metric, rescore, rescore_factor)
+
+    @staticmethod
+    def train(vectors: np.ndarray):
+        """返回 (编码, 各维最小值与取值范围)"""
+        vmin = vectors.min(axis=0)
+        vdiff = vectors.max(axis=0) - vmin
+        vdiff = np.where(vdiff > 0, vdiff, 1.0).astype(np.float32)
+        codes = np.clip(np.rint((vectors - vmin) / vdiff * 255), 0, 255).astype(np.uint8)
+        return codes, np.stack([vmin, vdiff]).astype(np.float32)
+
+    def _decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.vmin + codes.astype(np.float32) * self.step
+
+    def _inner(self, x: np.ndarray, start: int, end: int, context: Any) -> np.ndarray:
+        # x·(vmin + c×step) = x·vmin + (x×step)·c，不解码整块向量
+        return (x @ self.vmin)[:, None] + (x * self.step) @ self.codes[start:end].astype(np.float32).T
+
+class PQIndex(QuantizedIndex):
+    """乘积量化：向量切分为m个子空间，每个子空间以最近的聚类中心序号编码"""
+
+    compression = COMPRESSION_PQ
+
+    def __init__(self, codes: np.ndarray, centroids: np.ndarray, norms: np.ndarray, metric: str = METRIC_L2,
+                 rescore: Optional[np.ndarray] = None, rescore_factor: int = VECTOR_STORE_RESCORE_FACTOR):
+        # 码本每次检索都要整体读取，复制到进程堆上
+        self.centroids = np.array(centroids, dtype=np.float32)
+        self.m, _, self.dsub = self.centroids.shape
+        super().__init__(codes, self.m * self.dsub, norms, metric, rescore, rescore_factor)
+
+    @staticmethod
+    def subspaces(d: int, m: int = VECTOR_STORE_PQ_M) -> int:
+        if m > 0 and d % m == 0:
+            return m
+        for m in range(max(1, d // 8), 0, -1):
+            if d % m == 0:
+                return m
+        return 1
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, m: int = VECTOR_STORE_PQ_M):
+        """每个子空间做k-means（分块较少时聚类数取分块数），返回 (编码, 聚类中心)"""
+        n, d = vectors.shape
+        m = cls.subspaces(d, m)
+        dsub, ksub = d // m, min(256, n)
+        centroids = np.zeros((m, ksub, dsub), dtype=np.float32)
+        codes = np.empty((n, m), dtype=np.uint8)
+        for sub in range(m):
+            part = np.ascontiguousarray(vectors[:, sub * dsub:(sub + 1) * dsub])
+            kmeans = faiss.Kmeans(dsub, ksub, niter=PQ_TRAIN_ITERATIONS, seed=sub + 1,
+                                 min_points_per_centroid=1, max_points_per_centroid=PQ_TRAIN_POINTS_PER_CENTROID)
+            kmeans.train(part)
+            centroids[sub] = kmeans.centroids
+            codes[:, sub] = kmeans.index.search(part, 1)[1][:, 0]
+        return codes, centroids
+
+    def _decode(self, codes: np.ndarray) -> np.ndarray:
+        codes = np.asarray(codes)
+        return self.centroids[np.arange(self.m), codes].reshape(len(codes), self.d)
+
+    def _query_context(self, x: np.ndarray) -> np.ndarray:
+        # 查询各子空间与聚类中心的内积表（q×m×k），各块按编码查表求和
+        return np.einsum("qmd,mkd->qmk", x.reshape(len(x), self.m, self.dsub), self.centroids)
+
+    def _inner(self, x: np.ndarray, start: int, end: int, context: np.ndarray) -> np.ndarray:
+        codes = np.asarray(self.codes[start:end])
+        subspace = np.arange(self.m)
+        return np.stack([table[subspace, codes].sum(axis=1) for table in context])
+
+class MmapDocstore(Docstore):
+    """分块按行偏移从内存映射的JSONL文件中读取，键为分块序号的字符串"""
+
+    def __init__(self, chunks_path: str, offsets: np.ndarray):
+        self.offsets = offsets
+        self._file = open(chunks_path, "rb")
+        # 空文件无法映射
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(chunks_path) else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, position: int) -> Document:
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return Document(page_content=record["text"], metadata=record.get("metadata") or {})
+
+    def search(self, search: str):
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        return self.get(position)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise ReadOnlyStoreError("add")
+
+    def delete(self, ids: Any) -> None:
+        raise ReadOnlyStoreError("delete")
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+class PositionIds(Mapping):
+    """序号到docstore键的映射（i -> str(i)），不为每个分块创建条目"""
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def __getitem__(self, position: int) -> str:
+        position = int(position)
+        if not 0 <= position < self.count:
+            raise KeyError(position)
+        return str(position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+class MmapFAISS(FAISS):
+    """load_store返回的只读向量存储，修改操作在计算embedding之前直接抛出ReadOnlyStoreError"""
+
+    def add_texts(self, texts: Any, metadatas: Any = None, ids: Any = None, **kwargs: Any):
+        raise ReadOnlyStoreError("add_texts")
+
+    async def aadd_texts(self, texts: Any, metadatas: Any = None, ids: Any = None, **kwargs: Any):
+        raise ReadOnlyStoreError("add_texts")
+
+    def add_embeddings(self, text_embeddings: Any, metadatas: Any = None, ids: Any = None, **kwargs: Any):
+        raise ReadOnlyStoreError("add_embeddings")
+
+    def delete(self, ids: Any = None, **kwargs: Any):
+        raise ReadOnlyStoreError("delete")
+
+    def merge_from(self, target: FAISS) -> None:
+        raise ReadOnlyStoreError("merge_from")
+
+def _heap_nbytes(array: np.ndarray) -> int:
+    """数组或其所属的数组来自内存映射时返回0，否则返回其字节数"""
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return 0
+        base = base.base
+    return 0 if isinstance(base, mmap.mmap) else array.nbytes
+
+def _squared_norms(vectors: np.ndarray) -> np.ndarray:
+    return (vectors * vectors).sum(axis=1).astype(np.float32)
+
+def _open_index(arrays: Dict[str, np.ndarray], compression: str, metric: str) -> MmapFlatIndex:
+    rescore = arrays.get(RESCORE_FILE)
+    if compression == COMPRESSION_SQ8:
+        return SQ8Index(arrays[CODES_FILE], arrays[SQ_FILE], arrays[NORMS_FILE], metric, rescore)
+    if compression == COMPRESSION_PQ:
+        return PQIndex(arrays[CODES_FILE], arrays[PQ_FILE], arrays[NORMS_FILE], metric, rescore)
+    return MmapFlatIndex(arrays[VECTORS_FILE], arrays[NORMS_FILE], metric)
+
+def encode_vectors(vectors: np.ndarray, compression: str = VECTOR_STORE_COMPRESSION,
+                   rescore: bool = VECTOR_STORE_RESCORE, pq_m: int = VECTOR_STORE_PQ_M) -> Dict[str, np.ndarray]:
+    """按压缩方式生成向量部分各文件的内容，没有向量或压缩后（含码本）不小于原始大小时不压缩"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"[MmapStore] Unknown compression: {compression}")
+    plain = {VECTORS_FILE: vectors, NORMS_FILE: _squared_norms(vectors)}
+    if compression == COMPRESSION_NONE or len(vectors) == 0:
+        return plain
+    if compression == COMPRESSION_SQ8:
+        codes, ranges = SQ8Index.train(vectors)
+        arrays = {CODES_FILE: codes, SQ_FILE: ranges}
+        decoded = SQ8Index(codes, ranges, None)._decode(codes)
+    else:
+        codes, centroids = PQIndex.train(vectors, pq_m)
+        arrays = {CODES_FILE: codes, PQ_FILE: centroids}
+        decoded = PQIndex(codes, centroids, None)._decode(codes)
+    # L2距离按解码后的向量计算，范数也取解码后的值
+    arrays[NORMS_FILE] = _squared_norms(decoded)
+    if rescore:
+        arrays[RESCORE_FILE] = vectors.astype(np.float16)
+    if sum(array.nbytes for array in arrays.values()) >= sum(array.nbytes for array in plain.values()):
+        print(f"[MmapStore] {compression} does not shrink {len(vectors)} vectors, storing float32")
+        return plain
+    return arrays
+
+def _recall(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(expected.tolist()) & set(actual.tolist())) for expected, actual in zip(truth, found))
+    return round(hits / truth.size, 4)
+
+def compression_report(vectors: np.ndarray, arrays: Dict[str, np.ndarray], compression: str, metric: str) -> Dict[str, Any]:
+    """
+    与未压缩存储（float32向量与范数）相比节省的字节数，以及以存储中的向量为查询时相对精确检索的recall@k
+    scan_bytes为每次检索需要扫描的字节数（不含仅读取候选行的float16向量）
+    """
+    raw = vectors.nbytes + len(vectors) * 4
+    stored = sum(array.nbytes for array in arrays.values())
+    report = {
+        "compression": compression,
+        "rescore": RESCORE_FILE in arrays,
+        "raw_bytes": raw,
+        "stored_bytes": stored,
+        "saved_bytes": raw - stored,
+        "scan_bytes": stored - (arrays[RESCORE_FILE].nbytes if RESCORE_FILE in arrays else 0),
+    }
+    if VECTORS_FILE in arrays or len(vectors) == 0:
+        return report
+    index = _open_index(arrays, compression, metric)
+    exact = MmapFlatIndex(vectors, _squared_norms(vectors), metric)
+    queries = vectors[np.random.default_rng(0).choice(len(vectors), min(RECALL_SAMPLES, len(vectors)), replace=False)]
+    k = min(RECALL_K, len(vectors))
+    truth = exact.search(queries, k)[1]
+    recall = _recall(truth, index.search(queries, k)[1])
+    report.update({"recall_k": k, "recall": recall, "recall_loss": round(1 - recall, 4)})
+    if report["rescore"]:
+        report["recall_without_rescore"] = _recall(truth, index._approximate(queries, k)[1])
+    return report
+
+def _versioned(name: str, version: str) -> str:
+    """vectors.npy -> vectors.<version>.npy"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{version}{ext}"
+
+def _store_files(meta: Dict[str, Any]) -> Dict[str, str]:
+    """store.json记录的 逻辑文件名 -> 实际文件名，早期写入的存储直接使用逻辑文件名"""
+    return meta.get("files") or {name: name for name in (CHUNKS_FILE, OFFSETS_FILE, *VECTOR_FILES[
+        meta.get("compression", COMPRESSION_NONE)], *((RESCORE_FILE,) if meta.get("rescore") else ()))}
+
+def _write_files(store_path: str, vectors: np.ndarray, documents, metric: str,
+                 normalize_L2: bool, distance_strategy: str, compression: str = VECTOR_STORE_COMPRESSION,
+                 rescore: bool = VECTOR_STORE_RESCORE) -> Dict[str, Any]:
+    """
+    每次写入使用带版本号的新文件名，全部写完后替换store.json切换到新的一组文件，
+    读取中的进程不会看到新旧文件混合；多个worker同时转换时各自写入不同的文件，最后替换store.json的生效。
+    documents为None时沿用已有的分块文件，只重写向量部分；返回压缩报告
+    """
+    os.makedirs(store_path, exist_ok=True)
+    previous = _store_files(read_meta(store_path)) if is_mmap_store(store_path) else {}
+    version = uuid.uuid4().hex[:12]
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    files: Dict[str, str] = {}
+    arrays = encode_vectors(vectors, compression, rescore)
+    if documents is not None:
+        offsets = [0]
+        files[CHUNKS_FILE] = _versioned(CHUNKS_FILE, version)
+        chunks_path = os.path.join(store_path, files[CHUNKS_FILE])
+        with open(chunks_path, "wb") as f:
+            for document in documents:
+                line = json.dumps({"text": document.page_content, "metadata": document.metadata},
+                                  ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        if len(offsets) - 1 != len(vectors):
+            os.remove(chunks_path)
+            raise ValueError(f"[MmapStore] {len(vectors)} vectors but {len(offsets) - 1} chunks")
+        arrays[OFFSETS_FILE] = np.asarray(offsets, dtype=np.int64)
+    else:
+        files[CHUNKS_FILE] = previous[CHUNKS_FILE]
+        files[OFFSETS_FILE] = previous[OFFSETS_FILE]
+
+    for name, array in arrays.items():
+        files[name] = _versioned(name, version)
+        # np.save会为不以.npy结尾的文件名追加后缀，使用文件对象写入
+        with open(os.path.join(store_path, files[name]), "wb") as f:
+            np.save(f, array)
+
+    compression = COMPRESSION_NONE if VECTORS_FILE in arrays else compression
+    arrays.pop(OFFSETS_FILE, None)
+    report = compression_report(vectors, arrays, compression, metric)
+    meta = {
+        "format": FORMAT_VERSION,
+        "count": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "metric": metric,
+        "normalize_L2": bool(normalize_L2),
+        "distance_strategy": distance_strategy,
+        "compression": compression,
+        "rescore": report["rescore"],
+        "files": files,
+        "report": report,
+    }
+    meta_tmp = os.path.join(store_path, f"{META_FILE}.{version}.tmp")
+    with open(meta_tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, os.path.join(store_path, META_FILE))
+
+    # 删除上一版本的文件；已映射这些文件的进程继续读取旧inode，
+    # 读取了旧store.json但尚未打开文件的进程由load_store重新读取
+    for name in set(previous.values()) - set(files.values()):
+        try:
+            os.remove(os.path.join(store_path, name))
+        except FileNotFoundError:
+            pass
+    if compression != COMPRESSION_NONE:
+        mb = 1024 * 1024
+        approx = f" (without rescore {report['recall_without_rescore']:.3f})" if report["rescore"] else ""
+        print(f"[MmapStore] {compression}{'+fp16' if report['rescore'] else ''}: "
+              f"{report['raw_bytes'] / mb:.2f}MB -> {report['stored_bytes'] / mb:.2f}MB "
+              f"(saved {report['saved_bytes'] / mb:.2f}MB, scan {report['scan_bytes'] / mb:.2f}MB), "
+              f"recall@{report['recall_k']} {report['recall']:.3f}{approx}")
+    return report
+
+def _metric_of(index: Any) -> str:
+    return METRIC_IP if getattr(index, "metric_type", faiss.METRIC_L2) == faiss.METRIC_INNER_PRODUCT else METRIC_L2
+
+def save_store(vector_store: FAISS, store_path: str, compression: str = VECTOR_STORE_COMPRESSION,
+               rescore: bool = VECTOR_STORE_RESCORE) -> Dict[str, Any]:
+    """将langchain FAISS向量存储写为内存映射格式，返回压缩报告"""
+    index = vector_store.index
+    index_to_id = vector_store.index_to_docstore_id
+    documents = (vector_store.docstore.search(index_to_id[i]) for i in range(index.ntotal))
+    return _write_files(
+        store_path,
+        index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32),
+        documents,
+        _metric_of(index),
+        getattr(vector_store, "_normalize_L2", False),
+        getattr(vector_store.distance_strategy, "value", str(vector_store.distance_strategy)),
+        compression,
+        rescore,
+    )
+
+def read_meta(store_path: str) -> Dict[str, Any]:
+    with open(os.path.join(store_path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"[MmapStore] Unsupported store format: {meta.get('format')}")
+    return meta
+
+def load_store(store_path: str, embeddings: Any) -> FAISS:
+    """以内存映射方式打开向量存储，只读取文件头"""
+    for attempt in range(LOAD_ATTEMPTS):
+        try:
+            return _open_store(store_path, embeddings)
+        except FileNotFoundError:
+            # 读取store.json后存储被重写，旧版本文件已删除，按新的store.json重新打开
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+
+def _open_store(store_path: str, embeddings: Any) -> FAISS:
+    meta = read_meta(store_path)
+    compression = meta.get("compression", COMPRESSION_NONE)
+    files = _store_files(meta)
+    names = VECTOR_FILES[compression] + ((RESCORE_FILE,) if meta.get("rescore") else ())
+    arrays = {name: np.load(os.path.join(store_path, files[name]), mmap_mode="r") for name in names}
+    offsets = np.load(os.path.join(store_path, files[OFFSETS_FILE]), mmap_mode="r")
+    if len(arrays[NORMS_FILE]) != meta["count"] or len(offsets) != meta["count"] + 1:
+        raise ValueError(f"[MmapStore] Incomplete store: {store_path}")
+    return MmapFAISS(
+        embeddings,
+        _open_index(arrays, compression, meta["metric"]),
+        MmapDocstore(os.path.join(store_path, files[CHUNKS_FILE]), offsets),
+        PositionIds(meta["count"]),
+        normalize_L2=meta["normalize_L2"],
+        distance_strategy=DistanceStrategy(meta["distance_strategy"]),
+    )
+
+def migrate_store(store_path: str, remove: bool = True, compression: str = VECTOR_STORE_COMPRESSION) -> None:
+    """
+    将旧版 index.faiss/index.pkl 原地转换为内存映射格式
+    直接读取faiss索引与pickle中的docstore，不需要embedding模型
+    """
+    index = faiss.read_index(os.path.join(store_path, LEGACY_INDEX_FILE))
+    with open(os.path.join(store_path, LEGACY_DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_id = pickle.load(f)
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    documents = (docstore.search(index_to_id[i]) for i in range(index.ntotal))
+    # 旧版未保存normalize_L2与距离策略，按索引度量推断
+    metric = _metric_of(index)
+    strategy = DistanceStrategy.MAX_INNER_PRODUCT if metric == METRIC_IP else DistanceStrategy.EUCLIDEAN_DISTANCE
+    _write_files(store_path, vectors, documents, metric, False, strategy.value, compression)
+    if remove:
+        for name in (LEGACY_INDEX_FILE, LEGACY_DOCSTORE_FILE):
+            try:
+                os.remove(os.path.join(store_path, name))
+            except FileNotFoundError:
+                pass
+
+def compress_store(store_path: str, compression: str, rescore: bool = VECTOR_STORE_RESCORE) -> Optional[Dict[str, Any]]:
+    """
+    压缩未压缩的内存映射存储，分块文件保持不变
+    已压缩的存储没有原始float32向量，不再转换，返回None
+    """
+    meta = read_meta(store_path)
+    if meta.get("compression", COMPRESSION_NONE) != COMPRESSION_NONE:
+        return None
+    vectors = np.load(os.path.join(store_path, _store_files(meta)[VECTORS_FILE]))
+    return _write_files(store_path, vectors, None, meta["metric"], meta["normalize_L2"],
+                        meta["distance_strategy"], compression, rescore)
+
+def migrate_all(store_dir: str, remove: bool = True, compression: Optional[str] = None) -> Dict[str, int]:
+    """
+    转换store_dir下全部旧版向量存储，指定compression时同时压缩未压缩的存储
+    返回转换、压缩、跳过与失败的数量
+    """
+    counts = {"migrated": 0, "compressed": 0, "skipped": 0, "failed": 0}
+    for store_name in sorted(os.listdir(store_dir)):
+        store_path = os.path.join(store_dir, store_name)
+        if not os.path.isdir(store_path):
+            continue
+        try:
+            if is_mmap_store(store_path):
+                if compression in (None, COMPRESSION_NONE) or compress_store(store_path, compression) is None:
+                    counts["skipped"] += 1
+                else:
+                    counts["compressed"] += 1
+            elif is_legacy_store(store_path):
+                migrate_store(store_path, remove=remove, compression=compression or VECTOR_STORE_COMPRESSION)
+                counts["migrated"] += 1
+            else:
+                counts["skipped"] += 1
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[MmapStore] Failed to convert {store_name}: {e}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert index.faiss/index.pkl vector stores to the memory-mapped format")
+    parser.add_argument("--dir", default="database/vector_store", help="向量存储目录")
+    parser.add_argument("--keep", action="store_true", help="转换后保留旧版文件")
+    parser.add_argument("--compression", choices=COMPRESSIONS, help="压缩方式，同时压缩已转换但未压缩的存储")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        raise SystemExit(f"{args.dir} not found")
+    counts = migrate_all(args.dir, remove=not args.keep, compression=args.compression)
+    print(f"[MmapStore] migrated={counts['migrated']} compressed={counts['compressed']} "
+          f"skipped={counts['skipped']} failed={counts['failed']}")
+
+if __name__ == "__main__":
+    main()
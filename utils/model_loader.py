@@ -1,99 +1,286 @@
 import os
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, Optional
 import torch
 from langchain_community.llms import HuggingFacePipeline
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline # type: ignore
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer, pipeline # type: ignore
+from utils.model_registry import model_registry
+from utils.generation_scheduler import GenerationScheduler, SchedulerLLM, prompt_prefix
+from utils.embeddings import BatchedEmbeddings, resolve_device, resolve_precision
+
+CHAT_MODEL_PATH = "models/chat"
+CHAT_MODEL_DTYPE = "float16"
+EMBEDDING_MODEL_PATH = "models/embedded"
+EMBEDDING_DEVICE = resolve_device()
+EMBEDDING_PRECISION = resolve_precision(EMBEDDING_DEVICE)
+# 精度参与模型注册表的键与向量存储的缓存键
+EMBEDDING_MODEL_DTYPE = {"fp32": "float32", "fp16": "float16", "int8": "int8"}[EMBEDDING_PRECISION]
+# 可选的cross-encoder重排模型，目录不存在时检索跳过重排
+RERANKER_MODEL_PATH = "models/reranker"
+RERANKER_MODEL_DTYPE = "float32"
+
+# 生成参数，pipeline与流式生成共用
+GENERATION_KWARGS = {
+    "do_sample": True,  # 使用采样
+    "max_new_tokens": 2048,
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 50,
+    "repetition_penalty": 1.1,
+}
+# 流式生成时两个token之间的最长等待时间（秒）
+STREAM_TOKEN_TIMEOUT = 300
+# 是否通过GenerationScheduler对并发请求进行批处理生成
+GENERATION_BATCHING = os.getenv("GENERATION_BATCHING", "1") == "1"
+# 提示模板名称 -> 静态前缀文本，调度器复用这些前缀的KV缓存
+PROMPT_PREFIXES: Dict[str, str] = {}
+
+class _StopOnEvent(StoppingCriteria):
+    """stop_event被设置时结束生成"""
+
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
 
 class ModelLoader:
     def __init__(self):
         self.chat_model = None
         self.embedding_model = None
+        self.reranker_model = None
         self.model = None  # 保存原始模型引用
         self.tokenizer = None  # 保存tokenizer引用
+        self.scheduler = None  # 批处理生成调度器
         
     def cleanup(self):
-        """清理模型资源"""
-        if self.model is not None:
-            try:
-                # 删除模型
-                del self.model
-                self.model = None
-                # 清空CUDA缓存
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            except Exception as e:
-                print(f"Error cleaning up model: {e}")
-                
-        if self.tokenizer is not None:
-            try:
-                del self.tokenizer
-                self.tokenizer = None
-            except Exception as e:
-                print(f"Error cleaning up tokenizer: {e}")
-                
+        """释放模型引用，实际卸载由ModelRegistry按引用计数完成"""
         if self.chat_model is not None:
             try:
-                del self.chat_model
                 self.chat_model = None
+                self.model = None
+                self.tokenizer = None
+                self.scheduler = None
+                model_registry.release(CHAT_MODEL_PATH, CHAT_MODEL_DTYPE)
             except Exception as e:
                 print(f"Error cleaning up chat_model: {e}")
                 
         if self.embedding_model is not None:
             try:
-                del self.embedding_model
                 self.embedding_model = None
+                model_registry.release(EMBEDDING_MODEL_PATH, EMBEDDING_MODEL_DTYPE)
             except Exception as e:
                 print(f"Error cleaning up embedding_model: {e}")
+
+        if self.reranker_model is not None:
+            try:
+                self.reranker_model = None
+                model_registry.release(RERANKER_MODEL_PATH, RERANKER_MODEL_DTYPE)
+            except Exception as e:
+                print(f"Error cleaning up reranker_model: {e}")
+
+    @staticmethod
+    def embedding_model_id() -> str:
+        """embedding模型标识：路径、精度及配置文件摘要，模型替换后标识随之变化"""
+        sha256 = hashlib.sha256()
+        sha256.update(f"{EMBEDDING_MODEL_PATH}|{EMBEDDING_MODEL_DTYPE}".encode("utf-8"))
+        for name in ("config.json", "modules.json", "config_sentence_transformers.json"):
+            config_path = os.path.join(EMBEDDING_MODEL_PATH, name)
+            if os.path.exists(config_path):
+                with open(config_path, "rb") as f:
+                    sha256.update(f.read())
+        return sha256.hexdigest()[:16]
+
+    @staticmethod
+    def chat_model_id() -> str:
+        """chat模型与生成参数的标识，模型或采样参数变化后缓存的回答随之失效"""
+        sha256 = hashlib.sha256()
+        sha256.update(f"{CHAT_MODEL_PATH}|{CHAT_MODEL_DTYPE}|{sorted(GENERATION_KWARGS.items())}".encode("utf-8"))
+        for name in ("config.json", "generation_config.json"):
+            config_path = os.path.join(CHAT_MODEL_PATH, name)
+            if os.path.exists(config_path):
+                with open(config_path, "rb") as f:
+                    sha256.update(f.read())
+        return sha256.hexdigest()[:16]
+
+    @staticmethod
+    def register_prompt_prefix(name: str, template: str) -> None:
+        """登记提示模板第一个变量之前的静态前缀，chat模型已加载时立即注册到调度器"""
+        PROMPT_PREFIXES[name] = prompt_prefix(template)
+        handle = model_registry.peek(CHAT_MODEL_PATH, CHAT_MODEL_DTYPE)
+        if handle and handle.get("scheduler"):
+            handle["scheduler"].register_prefix(name, PROMPT_PREFIXES[name])
+
+    @staticmethod
+    def _build_chat_model():
+        """加载chat模型并创建pipeline"""
+        model_path = CHAT_MODEL_PATH
+        
+        # 加载tokenizer和模型
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            trust_remote_code=True,
+            torch_dtype=getattr(torch, CHAT_MODEL_DTYPE),
+            device_map="auto"
+        )
+        
+        if GENERATION_BATCHING:
+            # 通过调度器合并并发请求进行批量生成
+            scheduler = GenerationScheduler(
+                model,
+                tokenizer,
+                default_params=GENERATION_KWARGS
+            )
+            for name, text in list(PROMPT_PREFIXES.items()):
+                scheduler.register_prefix(name, text)
+            return {
+                "model": model,
+                "tokenizer": tokenizer,
+                "scheduler": scheduler,
+                "chat_model": SchedulerLLM(scheduler=scheduler),
+                "on_unload": scheduler.shutdown,
+            }
+        
+        # 创建pipeline
+        pipe = pipeline(
+            task="text-generation",
+            model=model,
+            tokenizer=tokenizer,
+            return_full_text=False,  # 只返回新生成的文本
+            **GENERATION_KWARGS,
+            pad_token_id=tokenizer.eos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            device_map="auto"
+        )
         
+        # 创建LangChain的LLM
+        chat_model = HuggingFacePipeline(
+            pipeline=pipe,
+            model_kwargs={"temperature": 0.7}
+        )
+        
+        return {
+            "model": model,
+            "tokenizer": tokenizer,
+            "chat_model": chat_model,
+        }
+
+    @staticmethod
+    def _build_embedding_model():
+        """加载embedding模型，设备与精度由EMBEDDING_DEVICE和EMBEDDING_PRECISION决定"""
+        embedding_model = BatchedEmbeddings(
+            EMBEDDING_MODEL_PATH,
+            device=EMBEDDING_DEVICE,
+            precision=EMBEDDING_PRECISION,
+            model_id=ModelLoader.embedding_model_id()
+        )
+        return {
+            "embedding_model": embedding_model,
+            "on_unload": embedding_model.close,
+        }
+        
+    @staticmethod
+    def _build_reranker_model():
+        """加载cross-encoder重排模型，与embedding模型使用相同的设备"""
+        from sentence_transformers import CrossEncoder
+        return {"reranker_model": CrossEncoder(RERANKER_MODEL_PATH, device=EMBEDDING_DEVICE)}
+
     def load_chat_model(self):
-        """加载本地chat模型"""
+        """加载本地chat模型（进程内共享）"""
         if not self.chat_model:
-            model_path = "models/chat"
-            
-            # 加载tokenizer和模型
-            self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                trust_remote_code=True,
-                torch_dtype=torch.float16,
-                device_map="auto"
-            )
-            
-            # 创建pipeline
-            pipe = pipeline(
-                task="text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                return_full_text=False,  # 只返回新生成的文本
-                do_sample=True,  # 使用采样
-                max_new_tokens=2048,
-                temperature=0.3,
-                top_p=0.95,
-                top_k=50,
-                repetition_penalty=1.1,
-                pad_token_id=self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                device_map="auto"
-            )
-            
-            # 创建LangChain的LLM
-            self.chat_model = HuggingFacePipeline(
-                pipeline=pipe,
-                model_kwargs={"temperature": 0.7}
-            )
+            handle = model_registry.acquire(CHAT_MODEL_PATH, CHAT_MODEL_DTYPE, self._build_chat_model)
+            self.model = handle["model"]
+            self.tokenizer = handle["tokenizer"]
+            self.scheduler = handle.get("scheduler")
+            self.chat_model = handle["chat_model"]
             
         return self.chat_model
     
     def load_embedding_model(self):
-        """加载本地embedding模型"""
+        """加载本地embedding模型（进程内共享）"""
         if not self.embedding_model:
-            model_kwargs = {'device': 'cuda'}
-            encode_kwargs = {'normalize_embeddings': True}
-            
-            self.embedding_model = HuggingFaceEmbeddings(
-                model_name="models/embedded",
-                model_kwargs=model_kwargs,
-                encode_kwargs=encode_kwargs
-            )
+            handle = model_registry.acquire(EMBEDDING_MODEL_PATH, EMBEDDING_MODEL_DTYPE, self._build_embedding_model)
+            self.embedding_model = handle["embedding_model"]
             
         return self.embedding_model
+
+    def load_reranker_model(self):
+        """加载本地cross-encoder重排模型（进程内共享），模型目录不存在时返回None"""
+        if not self.reranker_model and os.path.isdir(RERANKER_MODEL_PATH):
+            handle = model_registry.acquire(RERANKER_MODEL_PATH, RERANKER_MODEL_DTYPE, self._build_reranker_model)
+            self.reranker_model = handle["reranker_model"]
+
+        return self.reranker_model
+
+    @staticmethod
+    def generation_stats() -> Optional[Dict[str, Any]]:
+        """批处理生成指标，模型未加载或未启用批处理时返回None"""
+        handle = model_registry.peek(CHAT_MODEL_PATH, CHAT_MODEL_DTYPE)
+        if not handle or not handle.get("scheduler"):
+            return None
+        return handle["scheduler"].stats()
+
+    @staticmethod
+    def embedding_stats() -> Optional[Dict[str, Any]]:
+        """embedding吞吐指标，模型未加载时返回None"""
+        handle = model_registry.peek(EMBEDDING_MODEL_PATH, EMBEDDING_MODEL_DTYPE)
+        if not handle:
+            return None
+        return handle["embedding_model"].stats()
+
+    def stream_generate(self, prompt: str, stop_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """流式生成，逐段返回模型新生成的文本；stop_event被设置后（如客户端断开）提前结束生成"""
+        self.load_chat_model()
+        
+        if self.scheduler is not None:
+            # 调度器只推送新生成的token，无需跳过prompt
+            streamer = TextIteratorStreamer(
+                self.tokenizer,
+                skip_prompt=False,
+                skip_special_tokens=True,
+                timeout=STREAM_TOKEN_TIMEOUT
+            )
+            future = self.scheduler.submit(prompt, streamer=streamer, stop_event=stop_event)
+            for text in streamer:
+                if text:
+                    yield text
+            future.result()
+            return
+        
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            timeout=STREAM_TOKEN_TIMEOUT
+        )
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        generate_kwargs = dict(
+            **inputs,
+            **GENERATION_KWARGS,
+            streamer=streamer,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id
+        )
+        if stop_event is not None:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([_StopOnEvent(stop_event)])
+
+        errors = []
+
+        def _generate():
+            try:
+                self.model.generate(**generate_kwargs)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=_generate, daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+
+        if errors:
+            raise errors[0]
@@ -0,0 +1,122 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import torch
+
+class ModelRegistry:
+    """进程级模型注册表
+
+    以 (模型路径, 精度) 为键共享模型句柄，并按引用计数释放，
+    保证同一进程内每个模型只加载一次。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    @classmethod
+    def get_instance(cls) -> "ModelRegistry":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ModelRegistry()
+        return cls._instance
+
+    def acquire(self, model_path: str, dtype: str, factory: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """获取模型句柄，不存在时调用factory加载，并增加引用计数"""
+        key = (model_path, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                print(f"[ModelRegistry] Loading model: {model_path} ({dtype})")
+                handle = factory()
+                entry = {
+                    "handle": handle,
+                    "refcount": 0,
+                    "resident_bytes": self._estimate_bytes(handle),
+                }
+                self._entries[key] = entry
+            entry["refcount"] += 1
+            print(f"[ModelRegistry] Acquired {model_path} ({dtype}), refcount={entry['refcount']}")
+            return entry["handle"]
+
+    def peek(self, model_path: str, dtype: str) -> Optional[Dict[str, Any]]:
+        """获取已加载的模型句柄，不增加引用计数，未加载时返回None"""
+        with self._lock:
+            entry = self._entries.get((model_path, dtype))
+            return entry["handle"] if entry is not None else None
+
+    def release(self, model_path: str, dtype: str) -> None:
+        """释放一次引用，引用计数归零时卸载模型"""
+        key = (model_path, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["refcount"] -= 1
+            print(f"[ModelRegistry] Released {model_path} ({dtype}), refcount={entry['refcount']}")
+            if entry["refcount"] <= 0:
+                self._unload(key)
+
+    def release_all(self) -> None:
+        """卸载所有模型（进程退出时使用）"""
+        with self._lock:
+            for key in list(self._entries):
+                self._unload(key)
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        """报告每个已加载模型的常驻内存"""
+        with self._lock:
+            return [
+                {
+                    "model_path": model_path,
+                    "dtype": dtype,
+                    "refcount": entry["refcount"],
+                    "resident_bytes": entry["resident_bytes"],
+                    "resident_mb": round(entry["resident_bytes"] / (1024 * 1024), 2),
+                }
+                for (model_path, dtype), entry in self._entries.items()
+            ]
+
+    def _unload(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        on_unload = entry["handle"].get("on_unload")
+        if on_unload is not None:
+            try:
+                on_unload()
+            except Exception as e:
+                print(f"[ModelRegistry] Error running unload hook for {key[0]}: {e}")
+        entry["handle"].clear()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"[ModelRegistry] Unloaded model: {key[0]} ({key[1]})")
+
+    @staticmethod
+    def _estimate_bytes(handle: Dict[str, Any]) -> int:
+        """统计句柄中torch模块的参数与缓冲区字节数"""
+        total = 0
+        seen = set()
+        for value in handle.values():
+            module = ModelRegistry._find_module(value)
+            if module is None or id(module) in seen:
+                continue
+            seen.add(id(module))
+            for tensor in list(module.parameters()) + list(module.buffers()):
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    @staticmethod
+    def _find_module(value: Any) -> Optional[torch.nn.Module]:
+        if isinstance(value, torch.nn.Module):
+            return value
+        # HuggingFaceEmbeddings 将 SentenceTransformer 保存在 client 属性中
+        client = getattr(value, "client", None)
+        if isinstance(client, torch.nn.Module):
+            return client
+        return None
+
+model_registry = ModelRegistry.get_instance()
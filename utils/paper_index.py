@@ -0,0 +1,393 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+import faiss
+
+PAPER_INDEX_DIR = os.getenv("PAPER_INDEX_DIR", "database/paper_index")
+# 包含查询全部关键词的本地论文不少于该值（或同一查询已从CrossRef获取过）时直接使用本地结果，否则请求CrossRef
+PAPER_INDEX_MIN_HITS = int(os.getenv("PAPER_INDEX_MIN_HITS", "5"))
+# HNSW图的邻居数与查询时的候选队列长度
+PAPER_INDEX_HNSW_M = int(os.getenv("PAPER_INDEX_HNSW_M", "32"))
+PAPER_INDEX_EF_SEARCH = int(os.getenv("PAPER_INDEX_EF_SEARCH", "64"))
+# 运行时新增多少篇论文后将向量索引写回磁盘
+PAPER_INDEX_SAVE_EVERY = int(os.getenv("PAPER_INDEX_SAVE_EVERY", "200"))
+PAPER_INDEX_EMBED_BATCH = int(os.getenv("PAPER_INDEX_EMBED_BATCH", "64"))
+
+# 倒数排序融合的平滑常数
+RRF_K = 60
+QUERY_STOPWORDS = {"and", "or", "not", "near"}
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    doi TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    year INTEGER,
+    abstract TEXT,
+    url TEXT,
+    added_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, abstract, content='papers', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+    INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.id, old.title, old.abstract);
+    INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+END;
+CREATE TABLE IF NOT EXISTS fetched_queries (
+    query TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def clean_abstract(abstract: Optional[str]) -> str:
+    """去除CrossRef摘要中的JATS标签"""
+    if not abstract or abstract == "No abstract available":
+        return ""
+    return re.sub(r"\s+", " ", TAG_PATTERN.sub(" ", abstract)).strip()
+
+def query_terms(query: str) -> List[str]:
+    """提取布尔检索式中的关键词（去重并保持顺序）"""
+    terms = []
+    for term in re.findall(r"\w+", query.lower()):
+        if term not in QUERY_STOPWORDS and term not in terms:
+            terms.append(term)
+    return terms
+
+def normalize_query(query: str) -> str:
+    """与关键词顺序、大小写和布尔运算符无关的查询键"""
+    return " ".join(sorted(query_terms(query)))
+
+def to_match_query(query: str, operator: str = "OR") -> str:
+    """
+    将布尔检索式转换为FTS5查询
+    检索排序时以OR连接，由BM25决定排序；判断本地是否命中时以AND连接，只统计包含全部关键词的论文
+    """
+    return f" {operator} ".join(f'"{term}"' for term in query_terms(query))
+
+class PaperIndex:
+    """本地论文索引
+
+    论文元数据与摘要保存在SQLite中，FTS5全文索引提供BM25关键词检索，
+    标题+摘要的embedding保存在FAISS HNSW索引中提供语义检索，两路结果按倒数排序融合。
+    数据来自CrossRef检索结果或批量导入（python -m utils.import_papers）。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, index_dir: str = PAPER_INDEX_DIR, embeddings=None):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self._vector_path = os.path.join(index_dir, "papers.faiss")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(index_dir, "papers.db"), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # 未指定embeddings时使用models/embedded，首次语义检索时加载
+        self._embeddings = embeddings
+        self._custom_embeddings = embeddings is not None
+        self._model_loader = None
+        self._vectors = None
+        # 已在向量索引中（或正在计算embedding）的论文id，避免并发补齐时重复写入
+        self._indexed: set = set()
+        self._unsaved = 0
+        self._stats = {"lookups": 0, "local_hits": 0, "misses": 0, "total_ms": 0.0}
+
+    @classmethod
+    def get_instance(cls) -> "PaperIndex":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = PaperIndex()
+        return cls._instance
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from utils.model_loader import ModelLoader
+            self._model_loader = ModelLoader()
+            self._embeddings = self._model_loader.load_embedding_model()
+        return self._embeddings
+
+    def _embedding_id(self) -> str:
+        if self._custom_embeddings:
+            return type(self._embeddings).__name__
+        from utils.model_loader import ModelLoader
+        return ModelLoader.embedding_model_id()
+
+    def add_papers(self, papers: Iterable[Dict[str, Any]], query: Optional[str] = None) -> int:
+        """
+        写入或更新论文元数据并为新论文建立向量，返回新增的论文数
+        query为获取这些论文的CrossRef查询，记录后相同的查询直接使用本地结果
+        """
+        now = time.time()
+        rows = [
+            (paper["doi"].lower(), paper.get("title") or "", json.dumps(paper.get("authors") or [], ensure_ascii=False),
+             paper.get("year") or None, clean_abstract(paper.get("abstract")), paper.get("url") or "", now)
+            for paper in papers if paper.get("doi") and paper.get("title")
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM papers").fetchone()[0]
+                self._conn.executemany(
+                    """
+                    INSERT INTO papers (doi, title, authors, year, abstract, url, added_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (doi) DO UPDATE SET
+                        title = excluded.title,
+                        authors = excluded.authors,
+                        year = COALESCE(excluded.year, year),
+                        abstract = CASE WHEN excluded.abstract != '' THEN excluded.abstract ELSE abstract END,
+                        url = excluded.url
+                    """,
+                    rows
+                )
+                new_rows = self._conn.execute(
+                    "SELECT id, title, abstract FROM papers WHERE id > ? ORDER BY id", (before,)
+                ).fetchall()
+                if query and normalize_query(query):
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO fetched_queries (query, fetched_at) VALUES (?, ?)",
+                        (normalize_query(query), now)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        # embedding在锁外计算，不阻塞并发的检索
+        self._add_vectors(new_rows)
+        return len(new_rows)
+
+    def lookup(self, query: str, k: int = 10, min_hits: int = PAPER_INDEX_MIN_HITS) -> Optional[List[Dict[str, Any]]]:
+        """
+        本地检索候选论文
+        同一查询已从CrossRef获取过，或包含全部关键词的论文不少于min_hits篇时使用本地结果；
+        否则视为未命中并返回None，由调用方请求CrossRef。只命中部分关键词的论文不算命中
+        """
+        started = time.monotonic()
+        hit = self._is_fetched(query) or self._count_all_terms(query, min(min_hits, k)) >= min(min_hits, k)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if not hit:
+                self._stats["misses"] += 1
+                return None
+            self._stats["local_hits"] += 1
+        papers = self._fuse([self._search_bm25(query, k * 4), self._search_dense(query, k * 4)], k)
+        with self._lock:
+            self._stats["total_ms"] += (time.monotonic() - started) * 1000
+        return papers
+
+    def search(self, query: str, k: int = 10, mode: str = "hybrid") -> List[Dict[str, Any]]:
+        """按 bm25、dense 或 hybrid 模式检索"""
+        if mode == "bm25":
+            return self._load_papers(self._search_bm25(query, k))
+        if mode == "dense":
+            return self._load_papers(self._search_dense(query, k))
+        return self._fuse([self._search_bm25(query, k * 4), self._search_dense(query, k * 4)], k)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["papers"] = self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            stats["vectors"] = self._vectors.ntotal if self._vectors is not None else None
+        total_ms = stats.pop("total_ms")
+        stats["avg_local_ms"] = round(total_ms / stats["local_hits"], 2) if stats["local_hits"] else 0.0
+        return stats
+
+    def save(self) -> None:
+        """将向量索引写回磁盘"""
+        with self._lock:
+            if self._vectors is not None and self._unsaved:
+                faiss.write_index(self._vectors, self._vector_path)
+                self._unsaved = 0
+
+    def cleanup(self):
+        """保存向量索引并释放embedding模型引用"""
+        self.save()
+        with self._lock:
+            self._vectors = None
+        if self._model_loader is not None:
+            self._model_loader.cleanup()
+            self._model_loader = None
+            self._embeddings = None
+
+    def _is_fetched(self, query: str) -> bool:
+        key = normalize_query(query)
+        if not key:
+            return False
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM fetched_queries WHERE query = ?", (key,)).fetchone() is not None
+
+    def _count_all_terms(self, query: str, limit: int) -> int:
+        """包含查询全部关键词的论文数，最多数到limit"""
+        match = to_match_query(query, "AND")
+        if not match:
+            return 0
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM (SELECT rowid FROM papers_fts WHERE papers_fts MATCH ? LIMIT ?)",
+                (match, limit)
+            ).fetchone()[0]
+
+    def _search_bm25(self, query: str, limit: int) -> List[int]:
+        match = to_match_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                # 标题权重高于摘要；bm25()越小越相关
+                "SELECT rowid FROM papers_fts WHERE papers_fts MATCH ? ORDER BY bm25(papers_fts, 2.0, 1.0) LIMIT ?",
+                (match, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _search_dense(self, query: str, limit: int) -> List[int]:
+        try:
+            vector = self._normalize(np.asarray([self.embeddings.embed_query(query)], dtype=np.float32))
+        except Exception as e:
+            # embedding模型不可用时只使用关键词检索
+            print(f"[PaperIndex] Dense search unavailable: {str(e)}")
+            return []
+        index = self._get_vectors()
+        with self._lock:
+            if index.ntotal == 0:
+                return []
+            faiss.downcast_index(index.index).hnsw.efSearch = max(PAPER_INDEX_EF_SEARCH, limit)
+            _, ids = index.search(vector, min(limit, index.ntotal))
+        return [int(i) for i in ids[0] if i >= 0]
+
+    def _fuse(self, ranked_lists: List[List[int]], k: int) -> List[Dict[str, Any]]:
+        scores: Dict[int, float] = {}
+        for ranked in ranked_lists:
+            for rank, paper_id in enumerate(ranked):
+                scores[paper_id] = scores.get(paper_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        ordered = sorted(scores, key=lambda paper_id: scores[paper_id], reverse=True)[:k]
+        return self._load_papers(ordered)
+
+    def _load_papers(self, paper_ids: List[int]) -> List[Dict[str, Any]]:
+        if not paper_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM papers WHERE id IN ({','.join('?' * len(paper_ids))})", paper_ids
+            ).fetchall()
+        by_id = {row["id"]: row for row in rows}
+        return [
+            {
+                "title": by_id[i]["title"],
+                "authors": json.loads(by_id[i]["authors"]),
+                "year": by_id[i]["year"] or 0,
+                "doi": by_id[i]["doi"],
+                "abstract": by_id[i]["abstract"] or "No abstract available",
+                "url": by_id[i]["url"],
+            }
+            for i in paper_ids if i in by_id
+        ]
+
+    def _get_vectors(self):
+        """
+        返回向量索引，首次调用时加载并补齐缺失的向量；embedding模型变化时重建
+        调用方不持有锁：缺失的向量在锁外计算，期间检索使用已有的向量
+        """
+        if self._vectors is not None:
+            return self._vectors
+        embedding_id = self._embedding_id()
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedding_id'").fetchone()
+            rebuild = not os.path.exists(self._vector_path) or row is None or row["value"] != embedding_id
+        # 重建时需要探测向量维度，同样不在锁内调用模型
+        dim = len(self.embeddings.embed_query("dimension probe")) if rebuild else 0
+        with self._lock:
+            if self._vectors is not None:
+                return self._vectors
+            if rebuild:
+                self._vectors = faiss.IndexIDMap(faiss.IndexHNSWFlat(dim, PAPER_INDEX_HNSW_M, faiss.METRIC_INNER_PRODUCT))
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedding_id', ?)", (embedding_id,))
+                self._indexed = set()
+            else:
+                self._vectors = faiss.read_index(self._vector_path)
+                self._indexed = set(faiss.vector_to_array(self._vectors.id_map).tolist())
+            index = self._vectors
+            missing = [
+                row for row in self._conn.execute("SELECT id, title, abstract FROM papers ORDER BY id").fetchall()
+                if row["id"] not in self._indexed
+            ]
+        if missing:
+            print(f"[PaperIndex] Embedding {len(missing)} papers missing from the vector index")
+            self._embed_rows(missing)
+        return index
+
+    def _add_vectors(self, rows: List[sqlite3.Row]) -> None:
+        """为新论文建立向量（调用方不持有锁）"""
+        if not rows:
+            return
+        if self._vectors is None:
+            # 加载索引时会补齐包括本批在内的所有缺失向量
+            self._get_vectors()
+            return
+        self._embed_rows(rows)
+
+    def _embed_rows(self, rows: List[sqlite3.Row]) -> None:
+        """
+        按批计算embedding并写入向量索引（调用方不持有锁）
+        只在领取待处理的id与写入索引时持有锁，模型计算期间不阻塞检索与统计
+        """
+        for start in range(0, len(rows), PAPER_INDEX_EMBED_BATCH):
+            with self._lock:
+                index = self._vectors
+                if index is None:
+                    return
+                # 其他线程已写入或正在处理的论文跳过
+                batch = [row for row in rows[start:start + PAPER_INDEX_EMBED_BATCH] if row["id"] not in self._indexed]
+                ids = [row["id"] for row in batch]
+                self._indexed.update(ids)
+            if not batch:
+                continue
+            try:
+                vectors = self.embeddings.embed_documents([f"{row['title']}. {row['abstract'] or ''}" for row in batch])
+            except Exception:
+                with self._lock:
+                    self._indexed.difference_update(ids)
+                raise
+            with self._lock:
+                # 索引在计算期间被释放或重建时丢弃本批结果
+                if self._vectors is not index:
+                    return
+                index.add_with_ids(
+                    self._normalize(np.asarray(vectors, dtype=np.float32)),
+                    np.asarray(ids, dtype=np.int64)
+                )
+                self._unsaved += len(ids)
+                if self._unsaved >= PAPER_INDEX_SAVE_EVERY:
+                    faiss.write_index(index, self._vector_path)
+                    self._unsaved = 0
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+paper_index = PaperIndex.get_instance()
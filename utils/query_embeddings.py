@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+# 缓存的查询embedding条数，0表示不缓存（仍合并并发查询）
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+# 每批最多合并的查询数
+QUERY_EMBEDDING_BATCH = int(os.getenv("QUERY_EMBEDDING_BATCH", "32"))
+# 批次发起者额外等待后续查询的毫秒数，0表示只合并上一批编码期间到达的查询
+QUERY_EMBEDDING_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBEDDING_BATCH_WAIT_MS", "0"))
+
+# 计算编码耗时分位数时保留的最近批次数
+LATENCY_WINDOW = 1024
+
+def normalize_query(text: str) -> str:
+    """合并空白并去掉首尾空白；不改变大小写，区分大小写的模型对大小写不同的文本给出不同的向量"""
+    return re.sub(r"\s+", " ", text).strip()
+
+class _Batch:
+    """一次合并编码的查询，完成后由发起者设置done"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+class QueryEmbeddingCache:
+    """
+    查询embedding缓存与微批处理
+
+    键为 (embedding模型标识, 规范化后的查询)，按LRU淘汰。未命中的查询加入该模型正在收集的批次：
+    第一个加入的请求作为发起者，等上一批编码完成（及可选的等待时间）后用embed_documents一次编码整批，
+    期间到达的查询只需等待结果。同一查询正在编码时不重复编码。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE, max_batch: int = QUERY_EMBEDDING_BATCH,
+                 batch_wait_ms: float = QUERY_EMBEDDING_BATCH_WAIT_MS):
+        self.max_entries = max_entries
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = batch_wait_ms / 1000
+        self._cond = threading.Condition()
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        # 模型标识 -> 正在收集查询的批次
+        self._open: Dict[str, _Batch] = {}
+        # 收集中或编码中的查询 -> 所在批次
+        self._pending: Dict[Tuple[str, str], _Batch] = {}
+        # 正在编码的模型
+        self._busy: Set[str] = set()
+        self._encode_ms: deque = deque(maxlen=LATENCY_WINDOW)
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "coalesced": 0, "batches": 0,
+                       "batched_queries": 0, "errors": 0, "evictions": 0}
+
+    @classmethod
+    def get_instance(cls) -> "QueryEmbeddingCache":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = QueryEmbeddingCache()
+        return cls._instance
+
+    def embed(self, embeddings: Any, text: str, model_id: str) -> List[float]:
+        """返回查询的embedding，embeddings需提供embed_documents"""
+        text = normalize_query(text)
+        key = (model_id, text)
+        with self._cond:
+            self._stats["lookups"] += 1
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return vector.tolist()
+            self._stats["misses"] += 1
+            leader = False
+            batch = self._pending.get(key)
+            if batch is not None:
+                self._stats["coalesced"] += 1
+            else:
+                batch = self._open.get(model_id)
+                if batch is None:
+                    batch = self._open[model_id] = _Batch()
+                    leader = True
+                batch.texts.append(text)
+                self._pending[key] = batch
+                if len(batch.texts) >= self.max_batch:
+                    # 批次已满，之后的查询进入下一批
+                    del self._open[model_id]
+                    self._cond.notify_all()
+
+        if leader:
+            self._run(embeddings, model_id, batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors[batch.texts.index(text)].tolist()
+
+    def _run(self, embeddings: Any, model_id: str, batch: _Batch) -> None:
+        with self._cond:
+            # 上一批仍在编码时等待，期间到达的查询并入本批
+            self._cond.wait_for(lambda: model_id not in self._busy)
+            if self.batch_wait > 0:
+                self._cond.wait_for(lambda: len(batch.texts) >= self.max_batch, timeout=self.batch_wait)
+            if self._open.get(model_id) is batch:
+                del self._open[model_id]
+            self._busy.add(model_id)
+
+        start = time.perf_counter()
+        try:
+            batch.vectors = np.asarray(embeddings.embed_documents(batch.texts), dtype=np.float32)
+        except Exception as e:
+            print(f"[QueryEmbeddingCache] Error encoding {len(batch.texts)} queries: {str(e)}")
+            batch.error = e
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._cond:
+            self._busy.discard(model_id)
+            for text in batch.texts:
+                self._pending.pop((model_id, text), None)
+            if batch.error is None:
+                self._stats["batches"] += 1
+                self._stats["batched_queries"] += len(batch.texts)
+                self._encode_ms.append(elapsed_ms)
+                if self.max_entries > 0:
+                    for text, vector in zip(batch.texts, batch.vectors):
+                        self._entries[(model_id, text)] = vector
+                        self._entries.move_to_end((model_id, text))
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats["evictions"] += 1
+            else:
+                self._stats["errors"] += 1
+            self._cond.notify_all()
+        batch.done.set()
+
+    def clear(self) -> None:
+        with self._cond:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            latencies = sorted(self._encode_ms)
+        stats["max_entries"] = self.max_entries
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["avg_batch_size"] = round(stats["batched_queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["avg_encode_ms"] = round(sum(latencies) / len(latencies), 2) if latencies else 0.0
+        stats["p95_encode_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else 0.0
+        return stats
+
+query_embedding_cache = QueryEmbeddingCache.get_instance()
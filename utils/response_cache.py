@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# 缓存回答的有效期（秒），0表示不过期
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+# 同一范围内问题embedding的余弦相似度不低于该值时视为同一问题，0表示只做精确匹配；
+# 措辞相近的问题可能含义不同（如"第三章"与"第四章"），默认不启用
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+
+MATCH_EXACT = "exact"
+MATCH_SEMANTIC = "semantic"
+
+def normalize_question(question: str) -> str:
+    """统一大小写与空白，去掉结尾的标点"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?？!！.。 ")
+
+def make_scope(*parts: Any) -> str:
+    """由文档摘要、模式、模型标识等组成缓存范围，只有同一范围内的问题才会互相命中"""
+    return "|".join(str(part) for part in parts)
+
+class ResponseCache:
+    """模型回答缓存
+
+    键为 (范围, 规范化后的问题)，范围包含文档摘要、模式、chat模型标识与采样参数。
+    精确未命中时，在同一范围内比较问题embedding的余弦相似度，不低于阈值即命中。
+    条目按LRU淘汰并按TTL过期。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY,
+                 embed: Optional[Callable[[str], List[float]]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # 未指定embed时使用models/embedded，首次语义匹配时加载
+        self._embed = embed
+        self._model_loader = None
+        self._lock = threading.Lock()
+        # (scope, question) -> {"payload", "vector", "created_at"}，按访问顺序排列
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "bypasses": 0, "stores": 0,
+                       "evictions": 0, "expirations": 0}
+
+    @classmethod
+    def get_instance(cls) -> "ResponseCache":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ResponseCache()
+        return cls._instance
+
+    def _embed_question(self, question: str) -> Optional[np.ndarray]:
+        if self.similarity <= 0:
+            return None
+        try:
+            if self._embed is None:
+                from utils.model_loader import ModelLoader
+                self._model_loader = ModelLoader()
+                self._embed = self._model_loader.load_embedding_model().embed_query
+            vector = np.asarray(self._embed(question), dtype=np.float32)
+        except Exception as e:
+            print(f"[ResponseCache] Semantic lookup unavailable: {str(e)}")
+            return None
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, scope: str, question: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的回答
+        命中时返回 {"payload", "match", "similarity"}，未命中返回None
+        """
+        key = (scope, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return {"payload": entry["payload"], "match": MATCH_EXACT, "similarity": 1.0}
+            has_scope = any(other[0] == scope for other in self._entries)
+        if not has_scope:
+            return None
+
+        vector = self._embed_question(key[1])
+        if vector is None:
+            return None
+        with self._lock:
+            best_key, best_score = None, self.similarity
+            for other, entry in self._entries.items():
+                if other[0] != scope or entry["vector"] is None or self._expired(entry, now):
+                    continue
+                score = float(entry["vector"] @ vector)
+                if score >= best_score:
+                    best_key, best_score = other, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats["semantic_hits"] += 1
+            return {"payload": self._entries[best_key]["payload"], "match": MATCH_SEMANTIC,
+                    "similarity": round(best_score, 4)}
+
+    def put(self, scope: str, question: str, payload: Dict[str, Any]) -> None:
+        """缓存回答，超出条目数时淘汰最久未访问的条目"""
+        key = (scope, normalize_question(question))
+        vector = self._embed_question(key[1])
+        with self._lock:
+            self._entries[key] = {"payload": payload, "vector": vector, "created_at": time.time()}
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypasses"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["enabled"] = RESPONSE_CACHE_ENABLED
+        return stats
+
+    def cleanup(self):
+        """释放embedding模型引用，缓存条目保留"""
+        if self._model_loader is not None:
+            self._model_loader.cleanup()
+            self._model_loader = None
+            self._embed = None
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl > 0 and now - entry["created_at"] > self.ttl
+
+    def _remove(self, key: tuple) -> None:
+        del self._entries[key]
+        self._stats["expirations"] += 1
+
+response_cache = ResponseCache.get_instance()
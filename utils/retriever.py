@@ -0,0 +1,342 @@
+import os
+import re
+import math
+import time
+import threading
+import weakref
+from collections import Counter
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from utils.model_loader import ModelLoader, RERANKER_MODEL_PATH
+from utils.store_cache import vector_store_cache
+
+# 检索模式：hybrid 融合关键词与语义检索，bm25/dense 只使用其中一路
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# 每一路检索与重排的候选分块数
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# 是否使用models/reranker中的cross-encoder重排候选分块（模型目录不存在时跳过）
+RETRIEVAL_RERANK = os.getenv("RETRIEVAL_RERANK", "1") == "1"
+# MMR中相关性的权重，1表示不做多样性选择
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+# 检索上下文的token预算与最多分块数
+RETRIEVAL_CONTEXT_TOKENS = int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "1024"))
+RETRIEVAL_MAX_CHUNKS = int(os.getenv("RETRIEVAL_MAX_CHUNKS", "8"))
+
+MODE_HYBRID = "hybrid"
+MODE_BM25 = "bm25"
+MODE_DENSE = "dense"
+
+# 倒数排序融合的平滑常数
+RRF_K = 60
+# 英文词与数字（保留 ResNet-50、F1.5 这类带连字符或小数点的术语），以及中文字符
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*|[一-鿿]+")
+STAGES = ("bm25", "dense", "fuse", "rerank", "mmr", "pack")
+
+def estimate_tokens(text: str) -> int:
+    """未提供tokenizer时按字符数粗略估算token数"""
+    return max(1, len(text) // 2)
+
+def tokenize(text: str) -> List[str]:
+    """BM25分词：英文按词切分，中文按单字与相邻二字切分"""
+    tokens = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if "一" <= word[0] <= "鿿":
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+class StoreChunks(Sequence):
+    """按索引位置从向量存储的docstore中读取分块，不在内存中另存一份"""
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def __len__(self) -> int:
+        return self.vector_store.index.ntotal
+
+    def __getitem__(self, position: int) -> Any:
+        return self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[position])
+
+class BM25Index:
+    """单个文档分块上的Okapi BM25倒排索引"""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((position, count))
+        avg_length = float(lengths.mean()) if self.size else 0.0
+        self._norms = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1e-6))
+        # term -> (分块位置, 词频, idf)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        # 估算的内存占用：倒排数组、词项字符串及每个词项约200字节的字典与元组开销
+        self.nbytes = self._norms.nbytes
+        for term, entries in postings.items():
+            positions = np.fromiter((entry[0] for entry in entries), dtype=np.int64, count=len(entries))
+            freqs = np.fromiter((entry[1] for entry in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            self._postings[term] = (positions, freqs, idf)
+            self.nbytes += positions.nbytes + freqs.nbytes + len(term) + 200
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """返回得分最高的 (分块位置, 得分)，不含得分为0的分块"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            positions, freqs, idf = posting
+            scores[positions] += idf * freqs * (self.k1 + 1) / (freqs + self._norms[positions])
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        ordered = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(position), float(scores[position])) for position in ordered]
+
+class HybridRetriever:
+    """文档内检索
+
+    对同一个FAISS向量存储同时进行BM25关键词检索与向量检索，按倒数排序融合（RRF）合并，
+    可选使用cross-encoder重排，再按MMR兼顾相关性与多样性，最后在token预算内装填上下文。
+    分块以其在FAISS索引中的位置标识，BM25索引随向量存储对象缓存，向量存储被释放后一并回收。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, mode: str = RETRIEVAL_MODE,
+                 candidates: int = RETRIEVAL_CANDIDATES,
+                 rerank: bool = RETRIEVAL_RERANK,
+                 mmr_lambda: float = RETRIEVAL_MMR_LAMBDA,
+                 context_tokens: int = RETRIEVAL_CONTEXT_TOKENS,
+                 max_chunks: int = RETRIEVAL_MAX_CHUNKS):
+        self.mode = mode
+        self.candidates = candidates
+        self.rerank = rerank
+        self.mmr_lambda = mmr_lambda
+        self.context_tokens = context_tokens
+        self.max_chunks = max_chunks
+        # 首次重排时加载models/reranker
+        self._model_loader = None
+        self._lock = threading.Lock()
+        # 向量存储 -> {"bm25", "documents", "size"}
+        self._indexes: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+        self._requests = 0
+        self._chunks = 0
+        self._tokens = 0
+        self._stage_seconds = {stage: 0.0 for stage in STAGES}
+        self._stage_calls = {stage: 0 for stage in STAGES}
+
+    @classmethod
+    def get_instance(cls) -> "HybridRetriever":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = HybridRetriever()
+        return cls._instance
+
+    def retrieve(self, vector_store, query: str,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 budget: Optional[int] = None) -> List[Any]:
+        """
+        检索与查询相关的分块，在token预算内按原文顺序返回Document列表
+        count_tokens 为空时按字符数估算token数
+        """
+        timings: Dict[str, float] = {}
+        ranked = self.rank(vector_store, query, timings)
+        started = time.perf_counter()
+        documents = self._documents(vector_store)
+        selected, tokens = self.pack(
+            [documents[position] for position, _ in ranked],
+            count_tokens or estimate_tokens,
+            self.context_tokens if budget is None else budget
+        )
+        timings["pack"] = time.perf_counter() - started
+        self._record(timings, len(selected), tokens)
+        return selected
+
+    def rank(self, vector_store, query: str, timings: Optional[Dict[str, float]] = None) -> List[Tuple[int, float]]:
+        """返回排序后的 (分块位置, 得分)，timings记录各阶段耗时（秒）"""
+        timings = {} if timings is None else timings
+        ranked_lists: List[List[int]] = []
+
+        if self.mode in (MODE_HYBRID, MODE_BM25):
+            started = time.perf_counter()
+            ranked_lists.append([position for position, _ in self._bm25(vector_store).search(query, self.candidates)])
+            timings["bm25"] = time.perf_counter() - started
+        if self.mode in (MODE_HYBRID, MODE_DENSE):
+            started = time.perf_counter()
+            ranked_lists.append(self._search_dense(vector_store, query))
+            timings["dense"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ranked = self._fuse(ranked_lists)[:self.candidates]
+        timings["fuse"] = time.perf_counter() - started
+
+        if self.rerank and len(ranked) > 1:
+            reranker = self._reranker()
+            if reranker is not None:
+                started = time.perf_counter()
+                documents = self._documents(vector_store)
+                scores = reranker.predict([(query, documents[position].page_content) for position, _ in ranked])
+                ranked = sorted(
+                    ((position, float(score)) for (position, _), score in zip(ranked, scores)),
+                    key=lambda item: item[1], reverse=True
+                )
+                timings["rerank"] = time.perf_counter() - started
+
+        if self.mmr_lambda < 1 and len(ranked) > 1:
+            started = time.perf_counter()
+            ranked = self._mmr(vector_store, ranked)
+            timings["mmr"] = time.perf_counter() - started
+        return ranked
+
+    def pack(self, documents: List[Any], count_tokens: Callable[[str], int], budget: int) -> Tuple[List[Any], int]:
+        """
+        按排序依次装入不超过预算的分块，放不下的分块跳过以尝试更短的分块
+        预算内一个分块都放不下时保留排名第一的分块；返回按文档与原文位置排序的分块与token数
+        """
+        selected = []
+        used = 0
+        for document in documents:
+            if len(selected) >= self.max_chunks or budget - used <= 0:
+                break
+            tokens = count_tokens(document.page_content)
+            if used + tokens <= budget:
+                selected.append(document)
+                used += tokens
+        if not selected and documents:
+            selected.append(documents[0])
+            used = count_tokens(documents[0].page_content)
+        selected.sort(key=lambda document: (
+            document.metadata.get("source", ""), document.metadata.get("page", 0), document.metadata.get("start", 0)
+        ))
+        return selected, used
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "rerank": self.rerank and os.path.isdir(RERANKER_MODEL_PATH),
+                "mmr_lambda": self.mmr_lambda,
+                "context_tokens": self.context_tokens,
+                "requests": self._requests,
+                "indexed_stores": len(self._indexes),
+                "avg_chunks": round(self._chunks / self._requests, 2) if self._requests else 0.0,
+                "avg_context_tokens": round(self._tokens / self._requests, 1) if self._requests else 0.0,
+                "avg_stage_ms": {
+                    stage: round(self._stage_seconds[stage] / self._stage_calls[stage] * 1000, 2)
+                    for stage in STAGES if self._stage_calls[stage]
+                },
+            }
+
+    def cleanup(self):
+        """释放重排模型引用，BM25索引随向量存储回收"""
+        if self._model_loader is not None:
+            self._model_loader.cleanup()
+            self._model_loader = None
+
+    def _documents(self, vector_store) -> List[Any]:
+        return self._get_index(vector_store)["documents"]
+
+    def _bm25(self, vector_store) -> BM25Index:
+        return self._get_index(vector_store)["bm25"]
+
+    def _get_index(self, vector_store) -> Dict[str, Any]:
+        """
+        建立BM25索引，向量存储新增分块后重建
+        分块按需从docstore读取（内存映射的存储直接读映射文件），BM25索引的内存计入向量存储缓存
+        """
+        with self._lock:
+            entry = self._indexes.get(vector_store)
+        if entry is not None and entry["size"] == vector_store.index.ntotal:
+            return entry
+        documents = StoreChunks(vector_store)
+        size = len(documents)
+        bm25 = BM25Index([documents[i].page_content for i in range(size)])
+        entry = {"documents": documents, "bm25": bm25, "size": size}
+        with self._lock:
+            previous = self._indexes.get(vector_store)
+            self._indexes[vector_store] = entry
+        vector_store_cache.account(vector_store, bm25.nbytes - (previous["bm25"].nbytes if previous else 0))
+        return entry
+
+    def _search_dense(self, vector_store, query: str) -> List[int]:
+        vector = np.asarray([vector_store._embed_query(query)], dtype=np.float32)
+        if getattr(vector_store, "_normalize_L2", False):
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        _, positions = vector_store.index.search(vector, min(self.candidates, vector_store.index.ntotal))
+        return [int(position) for position in positions[0] if position >= 0]
+
+    @staticmethod
+    def _fuse(ranked_lists: List[List[int]]) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for ranked in ranked_lists:
+            for rank, position in enumerate(ranked):
+                scores[position] = scores.get(position, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def _mmr(self, vector_store, ranked: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        """
+        最大边际相关性排序
+        相关性取融合（或重排）得分归一化后的值，冗余度为分块向量间的余弦相似度
+        """
+        vectors = self._chunk_vectors(vector_store, [position for position, _ in ranked])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = np.asarray([score for _, score in ranked], dtype=np.float32)
+        relevance = (scores - scores.min()) / max(float(scores.max() - scores.min()), 1e-12)
+        similarity = vectors @ vectors.T
+
+        order: List[int] = []
+        remaining = list(range(len(ranked)))
+        redundancy = np.zeros(len(ranked), dtype=np.float32)
+        while remaining:
+            candidates = np.asarray(remaining)
+            values = self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * redundancy[candidates]
+            best = int(candidates[int(np.argmax(values))])
+            order.append(best)
+            remaining.remove(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [ranked[i] for i in order]
+
+    def _chunk_vectors(self, vector_store, positions: List[int]) -> np.ndarray:
+        """从索引中还原分块向量，索引不支持还原时重新计算"""
+        try:
+            return np.stack([vector_store.index.reconstruct(position) for position in positions]).astype(np.float32)
+        except Exception:
+            documents = self._documents(vector_store)
+            return np.asarray(
+                vector_store.embedding_function.embed_documents([documents[p].page_content for p in positions]),
+                dtype=np.float32
+            )
+
+    def _reranker(self):
+        if not os.path.isdir(RERANKER_MODEL_PATH):
+            return None
+        try:
+            if self._model_loader is None:
+                self._model_loader = ModelLoader()
+            return self._model_loader.load_reranker_model()
+        except Exception as e:
+            print(f"[HybridRetriever] Rerank unavailable: {str(e)}")
+            return None
+
+    def _record(self, timings: Dict[str, float], chunks: int, tokens: int) -> None:
+        with self._lock:
+            self._requests += 1
+            self._chunks += chunks
+            self._tokens += tokens
+            for stage, seconds in timings.items():
+                self._stage_seconds[stage] += seconds
+                self._stage_calls[stage] += 1
+
+retriever = HybridRetriever.get_instance()
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# 内存中向量存储的总字节预算
+VECTOR_STORE_CACHE_MB = float(os.getenv("VECTOR_STORE_CACHE_MB", "1024"))
+# 超过该时间（秒）未被访问的向量存储被移出内存，0表示不按时间淘汰
+VECTOR_STORE_CACHE_TTL = float(os.getenv("VECTOR_STORE_CACHE_TTL", "3600"))
+
+class VectorStoreCache:
+    """进程级向量存储缓存
+
+    以store_name为键在内存中保存已加载的FAISS索引，按字节预算LRU淘汰、
+    按空闲时间TTL过期。淘汰只释放内存，磁盘上的索引保留，再次访问时重新加载。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, budget_bytes: int, ttl: float):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # store_name -> {"store", "bytes", "last_access"}，按访问顺序排列
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @classmethod
+    def get_instance(cls) -> "VectorStoreCache":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = VectorStoreCache(
+                        int(VECTOR_STORE_CACHE_MB * 1024 * 1024),
+                        VECTOR_STORE_CACHE_TTL
+                    )
+        return cls._instance
+
+    def get(self, store_name: str) -> Optional[Any]:
+        """获取向量存储，未缓存或已过期时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(store_name)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            entry["last_access"] = now
+            self._entries.move_to_end(store_name)
+            return entry["store"]
+
+    def put(self, store_name: str, store: Any) -> None:
+        """缓存向量存储，超出预算时淘汰最久未访问的条目"""
+        size = self.estimate_bytes(store)
+        with self._lock:
+            old = self._entries.pop(store_name, None)
+            if old is not None:
+                self._bytes -= old["bytes"]
+            self._entries[store_name] = {"store": store, "bytes": size, "last_access": time.monotonic()}
+            self._bytes += size
+            self._evict()
+
+    def account(self, store: Any, extra_bytes: int) -> None:
+        """
+        为已缓存的向量存储计入随其一同释放的派生数据（如检索器的BM25索引）的内存占用
+        向量存储未被缓存时忽略
+        """
+        with self._lock:
+            for name, entry in self._entries.items():
+                if entry["store"] is store:
+                    entry["bytes"] += extra_bytes
+                    self._bytes += extra_bytes
+                    self._entries.move_to_end(name)
+                    self._evict()
+                    return
+
+    def pop(self, store_name: str) -> None:
+        """移除指定条目"""
+        with self._lock:
+            entry = self._entries.pop(store_name, None)
+            if entry is not None:
+                self._bytes -= entry["bytes"]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存指标"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "resident_bytes": self._bytes,
+                "resident_mb": round(self._bytes / (1024 * 1024), 2),
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 2),
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    def _evict(self) -> None:
+        # 最近访问的条目即使单独超出预算也保留
+        while self._bytes > self.budget_bytes and len(self._entries) > 1:
+            name, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["bytes"]
+            self._evictions += 1
+            print(f"[VectorStoreCache] Evicted {name} ({entry['bytes'] / (1024 * 1024):.1f}MB)")
+
+    def _expire(self, now: float) -> None:
+        if self.ttl <= 0:
+            return
+        # 条目按访问顺序排列，从最久未访问的开始检查
+        while self._entries:
+            name, entry = next(iter(self._entries.items()))
+            if now - entry["last_access"] <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= entry["bytes"]
+            self._expirations += 1
+            print(f"[VectorStoreCache] Expired {name}")
+
+    @staticmethod
+    def estimate_bytes(store: Any) -> int:
+        """
+        估算向量存储的内存占用：向量数×维度×4字节，加上docstore中的文本与元数据；
+        内存映射的存储只计入进程堆上的部分（heap_bytes），映射页面由各进程共享。
+        检索器为其建立的BM25索引在建立时通过account计入
+        """
+        index = getattr(store, "index", None)
+        total = getattr(index, "heap_bytes", index.ntotal * index.d * 4) if index is not None else 0
+        docs = getattr(getattr(store, "docstore", None), "_dict", {})
+        for doc in docs.values():
+            total += len(getattr(doc, "page_content", "").encode("utf-8"))
+            metadata = getattr(doc, "metadata", None)
+            if metadata:
+                total += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        return total
+
+vector_store_cache = VectorStoreCache.get_instance()
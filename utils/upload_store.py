@@ -0,0 +1,332 @@
+import os
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+UPLOAD_DIR = "database/blobs"
+# 写入中的临时文件与分片不能放在对外提供下载的UPLOAD_DIR下
+UPLOAD_TMP_DIR = "database/uploads_tmp"
+LEGACY_UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
+UPLOAD_DB_PATH = os.getenv("UPLOAD_DB_PATH", "database/uploads.db")
+# 单个文件的最大字节数
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "200"))
+# 流式写入与分片上传的块大小
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+# 未完成的分片上传会话保留时间（秒）
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    filename TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    size INTEGER NOT NULL,
+    received INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+class UploadTooLargeError(Exception):
+    """上传文件超出大小限制"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the upload limit of {limit / (1024 * 1024):.0f}MB")
+        self.limit = limit
+
+class UploadOffsetError(Exception):
+    """分片偏移与服务器已接收的字节数不一致"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Unexpected chunk offset, expected {expected}")
+        self.expected = expected
+
+class BlobWriter:
+    """将上传内容按块写入临时文件，同时计算SHA-256并检查大小限制"""
+
+    def __init__(self, store: "UploadStore", filename: Optional[str]):
+        self.store = store
+        self.filename = filename
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        store.ensure_dirs()
+        self._tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.part")
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.store.max_bytes:
+            self.abort()
+            raise UploadTooLargeError(self.store.max_bytes)
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def commit(self) -> Dict[str, Any]:
+        """完成写入并按内容摘要去重保存"""
+        self._file.close()
+        return self.store.commit_blob(self._tmp_path, self._sha256.hexdigest(), self.size, self.filename)
+
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+class UploadStore:
+    """按内容寻址的上传文件存储
+
+    内容相同的文件只保存一份blob（database/blobs/<sha256><ext>），
+    每次上传记录一个别名并增加blob的引用计数，别名全部删除后删除blob。
+    大文件可通过分片上传会话断点续传。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path: str = UPLOAD_DB_PATH, max_bytes: int = int(UPLOAD_MAX_MB * 1024 * 1024)):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 目录与数据库在首次使用时才创建，导入模块不会产生文件
+        self._connect_lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._dirs_lock = threading.Lock()
+        self._dirs_ready = False
+        # 分片上传会话的增量摘要，服务重启后在完成时重新计算
+        self._session_hashes: Dict[str, Any] = {}
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            with self._connect_lock:
+                if self._connection is None:
+                    self.ensure_dirs()
+                    os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                    self._connection = conn
+        return self._connection
+
+    def ensure_dirs(self) -> None:
+        """创建blob与临时目录，并将旧版本放在UPLOAD_DIR/tmp下的未完成分片移出可下载的目录"""
+        if self._dirs_ready:
+            return
+        with self._dirs_lock:
+            if self._dirs_ready:
+                return
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+            if os.path.isdir(LEGACY_UPLOAD_TMP_DIR):
+                for name in os.listdir(LEGACY_UPLOAD_TMP_DIR):
+                    os.replace(os.path.join(LEGACY_UPLOAD_TMP_DIR, name), os.path.join(UPLOAD_TMP_DIR, name))
+                os.rmdir(LEGACY_UPLOAD_TMP_DIR)
+                print(f"[UploadStore] Moved partial uploads from {LEGACY_UPLOAD_TMP_DIR} to {UPLOAD_TMP_DIR}")
+            self._dirs_ready = True
+
+    @classmethod
+    def get_instance(cls) -> "UploadStore":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = UploadStore()
+        return cls._instance
+
+    def open_writer(self, filename: Optional[str]) -> BlobWriter:
+        return BlobWriter(self, filename)
+
+    def commit_blob(self, tmp_path: str, digest: str, size: int, filename: Optional[str]) -> Dict[str, Any]:
+        """将临时文件登记为blob，内容已存在时删除临时文件并复用已有blob"""
+        ext = os.path.splitext(filename or "")[1].lower()
+        upload_id = str(uuid.uuid4())
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                deduplicated = row is not None and os.path.exists(self._blob_path(digest, row["ext"]))
+                if deduplicated:
+                    ext = row["ext"]
+                    os.remove(tmp_path)
+                    self._conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,))
+                else:
+                    os.replace(tmp_path, self._blob_path(digest, ext))
+                    self._conn.execute(
+                        """
+                        INSERT INTO blobs (digest, ext, size, refcount, created_at) VALUES (?, ?, ?, 1, ?)
+                        ON CONFLICT (digest) DO UPDATE SET ext = excluded.ext, refcount = refcount + 1
+                        """,
+                        (digest, ext, size, now)
+                    )
+                self._conn.execute(
+                    "INSERT INTO uploads (id, digest, filename, created_at) VALUES (?, ?, ?, ?)",
+                    (upload_id, digest, filename, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if deduplicated:
+            print(f"[UploadStore] Deduplicated {filename} -> {digest[:12]}")
+        return {
+            "upload_id": upload_id,
+            "filename": filename,
+            "digest": digest,
+            "size": size,
+            "file_url": "/" + self._blob_path(digest, ext).replace(os.sep, "/"),
+            "deduplicated": deduplicated,
+        }
+
+    def release(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        删除上传别名，blob的引用计数归零时删除文件
+        返回 {"digest", "blob_deleted"}，上传不存在时返回None
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT b.digest, b.ext, b.refcount FROM uploads u JOIN blobs b ON b.digest = u.digest WHERE u.id = ?",
+                    (upload_id,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                self._conn.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+                if row["refcount"] <= 1:
+                    self._conn.execute("DELETE FROM blobs WHERE digest = ?", (row["digest"],))
+                    blob_path = self._blob_path(row["digest"], row["ext"])
+                    if os.path.exists(blob_path):
+                        os.remove(blob_path)
+                else:
+                    self._conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (row["digest"],))
+                self._conn.execute("COMMIT")
+                return {"digest": row["digest"], "blob_deleted": row["refcount"] <= 1}
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def create_session(self, filename: Optional[str], size: int) -> Dict[str, Any]:
+        """创建分片上传会话"""
+        if size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        self._expire_sessions()
+        session_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO upload_sessions (id, filename, size, received, updated_at) VALUES (?, ?, ?, 0, ?)",
+                (session_id, filename, size, time.time())
+            )
+            self._session_hashes[session_id] = (0, hashlib.sha256())
+        open(self._session_path(session_id), "wb").close()
+        return {"upload_id": session_id, "offset": 0, "size": size, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+    def session_status(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {"upload_id": session_id, "offset": row["received"], "size": row["size"], "chunk_size": UPLOAD_CHUNK_SIZE}
+
+    def append_chunk(self, session_id: str, offset: int, data: bytes) -> int:
+        """
+        在指定偏移处追加分片，返回已接收的字节数
+        偏移小于已接收字节数时（客户端重传）截断后重写，大于时抛出UploadOffsetError
+        """
+        status = self.session_status(session_id)
+        if status is None:
+            raise KeyError(session_id)
+        if offset > status["offset"]:
+            raise UploadOffsetError(status["offset"])
+        received = offset + len(data)
+        if received > status["size"] or received > self.max_bytes:
+            raise UploadTooLargeError(min(status["size"], self.max_bytes))
+
+        with open(self._session_path(session_id), "r+b") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+
+        with self._lock:
+            self._conn.execute(
+                "UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ?",
+                (received, time.time(), session_id)
+            )
+            hashed = self._session_hashes.get(session_id)
+            if hashed is not None and hashed[0] == offset:
+                hashed[1].update(data)
+                self._session_hashes[session_id] = (received, hashed[1])
+            else:
+                # 重传或服务重启导致增量摘要失效，完成时重新计算
+                self._session_hashes.pop(session_id, None)
+        return received
+
+    def complete_session(self, session_id: str) -> Dict[str, Any]:
+        """所有分片接收完成后登记为blob"""
+        status = self.session_status(session_id)
+        if status is None:
+            raise KeyError(session_id)
+        if status["offset"] != status["size"]:
+            raise UploadOffsetError(status["offset"])
+
+        with self._lock:
+            row = self._conn.execute("SELECT filename FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+            hashed = self._session_hashes.pop(session_id, None)
+        part_path = self._session_path(session_id)
+        if hashed is not None and hashed[0] == status["size"]:
+            digest = hashed[1].hexdigest()
+        else:
+            sha256 = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                    sha256.update(block)
+            digest = sha256.hexdigest()
+
+        result = self.commit_blob(part_path, digest, status["size"], row["filename"])
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+        return result
+
+    def _expire_sessions(self) -> None:
+        """清理超时未完成的分片上传会话"""
+        deadline = time.time() - UPLOAD_SESSION_TTL
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM upload_sessions WHERE updated_at < ?", (deadline,)).fetchall()
+            for row in rows:
+                self._conn.execute("DELETE FROM upload_sessions WHERE id = ?", (row["id"],))
+                self._session_hashes.pop(row["id"], None)
+                part_path = self._session_path(row["id"])
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @staticmethod
+    def _blob_path(digest: str, ext: str) -> str:
+        return os.path.join(UPLOAD_DIR, f"{digest}{ext}")
+
+    @staticmethod
+    def _session_path(session_id: str) -> str:
+        return os.path.join(UPLOAD_TMP_DIR, f"session_{session_id}.part")
+
+upload_store = UploadStore.get_instance()
@@ -1,20 +1,56 @@
 import os
 import time
 import shutil
-from typing import List, Optional, Dict
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 from datetime import datetime, timedelta
+import hashlib
 from langchain_community.vectorstores import FAISS
-from utils.model_loader import ModelLoader
+from transformers import AutoTokenizer # type: ignore
+from utils.model_loader import ModelLoader, EMBEDDING_MODEL_PATH
 from utils.file_processor import FileProcessor
+from utils.chunker import TokenChunker, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from utils.store_cache import vector_store_cache
+from utils.corpus_index import corpus_index
+from utils.mmap_store import save_store, load_store, migrate_store, is_mmap_store, is_legacy_store
+
+VECTOR_STORE_DIR = "database/vector_store"
+# 增量向量化时每批写入索引的分块数
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
 
 class Vectorizer:
     """向量化处理工具类"""
+
+    # 所有Vectorizer实例（即所有处理链）共享的在途解析任务，解析结果保存在vector_store_cache中
+    _inflight: Dict[str, Future] = {}
+    _inflight_lock = threading.Lock()
     
     def __init__(self):
         self.model_loader = ModelLoader()
         self.file_processor = FileProcessor()
         self.embedding_model = self.model_loader.load_embedding_model()
-        self._vector_stores: Dict[str, FAISS] = {}  # 内存缓存，添加类型注解
+        self.chunker = self._create_chunker()
+
+    def _create_chunker(self) -> TokenChunker:
+        """使用embedding模型自身的tokenizer计数，分块长度不超过模型的最大输入长度"""
+        client = getattr(self.embedding_model, "client", None)
+        tokenizer = getattr(client, "tokenizer", None)
+        if tokenizer is None:
+            tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_PATH)
+        max_seq_length = getattr(client, "max_seq_length", None) or CHUNK_TOKENS + 2
+        # 预留[CLS]/[SEP]等特殊token的位置
+        chunk_tokens = min(CHUNK_TOKENS, max_seq_length - 2)
+        return TokenChunker.from_tokenizer(
+            tokenizer,
+            chunk_tokens=chunk_tokens,
+            overlap_tokens=min(CHUNK_OVERLAP_TOKENS, chunk_tokens // 2)
+        )
+
+    def cleanup(self):
+        """释放模型引用，向量存储缓存为进程级共享，不在此清理"""
+        self.model_loader.cleanup()
+        self.embedding_model = None
         
     def cleanup_expired_stores(self):
         """清理过期的向量存储"""
@@ -41,28 +77,26 @@ class Vectorizer:
                     
         # 清理内存缓存中的过期项
         expired_keys = []
-        for file_path in self._vector_stores:
-            store_name = f"summary_{hash(file_path)}"
+        for store_name in vector_store_cache.keys():
             store_path = os.path.join(vector_store_dir, store_name)
             if not os.path.exists(store_path):
-                expired_keys.append(file_path)
+                expired_keys.append(store_name)
                 
         for key in expired_keys:
-            del self._vector_stores[key]
+            vector_store_cache.pop(key)
             print(f"[Vectorizer] Removed expired store from memory: {key}")
 
     def clear_file_cache(self, file_path: str) -> None:
         """清理指定文件的缓存"""
         print(f"[Vectorizer] Clearing cache for: {file_path}")
+        store_name = self.get_store_name(file_path)
         
         # 清理内存缓存
-        if file_path in self._vector_stores:
-            del self._vector_stores[file_path]
-            print("[Vectorizer] Cleared memory cache")
+        vector_store_cache.pop(store_name)
+        print("[Vectorizer] Cleared memory cache")
             
         # 清理磁盘缓存
-        store_name = f"summary_{hash(file_path)}"
-        store_path = os.path.join("database/vector_store", store_name)
+        store_path = os.path.join(VECTOR_STORE_DIR, store_name)
         if os.path.exists(store_path):
             try:
                 shutil.rmtree(store_path)
@@ -70,12 +104,23 @@ class Vectorizer:
             except Exception as e:
                 print(f"[Vectorizer] Error clearing disk cache: {e}")
     
+    def get_store_name(self, file_path: str) -> str:
+        """
+        获取向量存储名称
+        由文件内容摘要、embedding模型标识和分块参数共同决定，
+        内容相同的文件共享同一个索引，配置变化后旧索引自动失效
+        """
+        content_digest = self.file_processor.file_digest(file_path)
+        config = f"{ModelLoader.embedding_model_id()}|{self.chunker.config_id}"
+        config_digest = hashlib.sha256(config.encode("utf-8")).hexdigest()[:12]
+        return f"doc_{content_digest}_{config_digest}"
+
     def get_store_path(self, file_path: str) -> str:
         """获取向量存储路径"""
-        store_name = f"summary_{hash(file_path)}"
-        return os.path.join("database/vector_store", store_name)
+        return os.path.join(VECTOR_STORE_DIR, self.get_store_name(file_path))
         
-    def create_vector_store(self, texts: List[str], store_name: str) -> FAISS:
+    def create_vector_store(self, texts: List[str], store_name: str,
+                            metadatas: Optional[List[Dict[str, Any]]] = None) -> FAISS:
         """创建向量存储"""
         print(f"\n[Vectorizer] Creating vector store: {store_name}")
         
@@ -86,16 +131,17 @@ class Vectorizer:
             # 创建向量存储
             print("[Vectorizer] Converting texts to vectors...")
             start_time = time.time()
-            vector_store = FAISS.from_texts(texts, self.embedding_model)
+            vector_store = FAISS.from_texts(texts, self.embedding_model, metadatas=metadatas)
             print(f"[Vectorizer] Conversion completed in {time.time() - start_time:.2f}s")
             
             # 保存到磁盘
-            store_path = os.path.join("database/vector_store", store_name)
+            store_path = os.path.join(VECTOR_STORE_DIR, store_name)
             print(f"[Vectorizer] Saving to: {store_path}")
-            os.makedirs("database/vector_store", exist_ok=True)
-            vector_store.save_local(store_path)
+            os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+            save_store(vector_store, store_path)
             
-            return vector_store
+            # 换用内存映射的副本，释放构建时的堆内存
+            return load_store(store_path, self.embedding_model)
             
         except Exception as e:
             print(f"[Vectorizer] Error creating vector store: {str(e)}")
@@ -103,58 +149,135 @@ class Vectorizer:
     
     def load_vector_store(self, store_name: str) -> Optional[FAISS]:
         """加载向量存储"""
-        store_path = os.path.join("database/vector_store", store_name)
+        store_path = os.path.join(VECTOR_STORE_DIR, store_name)
         
         if not os.path.exists(store_path):
             return None
             
         try:
+            if not is_mmap_store(store_path):
+                if not is_legacy_store(store_path):
+                    return None
+                # 旧版 index.faiss/index.pkl 原地转换为内存映射格式
+                print(f"[Vectorizer] Migrating legacy store: {store_path}")
+                migrate_store(store_path)
             print(f"[Vectorizer] Loading from: {store_path}")
-            vector_store = FAISS.load_local(store_path, self.embedding_model)
-            return vector_store
+            return load_store(store_path, self.embedding_model)
             
         except Exception as e:
             print(f"[Vectorizer] Error loading vector store: {str(e)}")
             return None
     
-    def process_file(self, file_path: str, store_name: str) -> FAISS:
-        """处理文件并创建向量存储"""
-        try:
-            print(f"\n[Vectorizer] Processing file: {file_path}")
-            
-            # 检查内存缓存
-            if file_path in self._vector_stores:
+    def build_vector_store(self, pages: Iterable[str], store_name: str,
+                           progress: Optional[Callable[[str, int], None]] = None) -> FAISS:
+        """
+        从页面流增量创建向量存储
+        分块按批向量化并写入索引，不需要先收集全部页面或分块；
+        progress(stage, count) 报告已解析的页数（"pages"）和已向量化的分块数（"chunks"）
+        """
+        print(f"\n[Vectorizer] Building vector store: {store_name}")
+        start_time = time.time()
+        vector_store: Optional[FAISS] = None
+        texts: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        total = 0
+
+        def _flush():
+            nonlocal vector_store, total
+            if vector_store is None:
+                vector_store = FAISS.from_texts(texts, self.embedding_model, metadatas=metadatas)
+            else:
+                vector_store.add_texts(texts, metadatas=metadatas)
+            total += len(texts)
+            texts.clear()
+            metadatas.clear()
+            if progress is not None:
+                progress("chunks", total)
+
+        def _count_pages(pages: Iterable[str]) -> Iterator[str]:
+            for count, page in enumerate(pages, start=1):
+                yield page
+                if progress is not None:
+                    progress("pages", count)
+
+        # 按段落、句子和章节边界分块，元数据记录页码与字符偏移
+        for chunk in self.chunker.iter_chunks(_count_pages(pages)):
+            texts.append(chunk["text"])
+            metadatas.append(chunk["metadata"])
+            if len(texts) >= INGEST_EMBED_BATCH:
+                _flush()
+        if texts:
+            _flush()
+
+        if vector_store is None:
+            raise ValueError("[Vectorizer] No texts provided for vectorization")
+        print(f"[Vectorizer] Embedded {total} chunks in {time.time() - start_time:.2f}s")
+
+        store_path = os.path.join(VECTOR_STORE_DIR, store_name)
+        print(f"[Vectorizer] Saving to: {store_path}")
+        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+        save_store(vector_store, store_path)
+        return load_store(store_path, self.embedding_model)
+
+    def process_file(self, file_path: str, store_name: str,
+                     progress: Optional[Callable[[str, int], None]] = None) -> FAISS:
+        """
+        处理文件并创建向量存储
+        同一文档同时只解析一次，并发请求等待同一个解析任务的结果
+        """
+        print(f"\n[Vectorizer] Processing file: {file_path}")
+        with self._inflight_lock:
+            # 检查内存缓存，被淘汰的索引从磁盘重新加载
+            vector_store = vector_store_cache.get(store_name)
+            if vector_store is not None:
                 print("[Vectorizer] Using memory cached store")
-                return self._vector_stores[file_path]
-                
-            # 检查磁盘缓存
-            store_path = os.path.join("database/vector_store", store_name)
-            if os.path.exists(store_path):
-                print("[Vectorizer] Loading from disk cache")
-                vector_store = self.load_vector_store(store_name)
-                if vector_store:
-                    self._vector_stores[file_path] = vector_store
-                    return vector_store
-            
-            # 加载文档并处理
-            print("[Vectorizer] Loading document...")
-            texts = self.file_processor.load_document(file_path)
-            
-            # 分块
-            print("[Vectorizer] Splitting text...")
-            chunks = []
-            for text in texts:
-                chunks.extend(self.file_processor.split_text(text))
-            print(f"[Vectorizer] Created {len(chunks)} chunks")
-            
-            # 创建向量存储
-            vector_store = self.create_vector_store(chunks, store_name)
-            
-            # 缓存到内存
-            self._vector_stores[file_path] = vector_store
-            
+                return vector_store
+            future = self._inflight.get(store_name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[store_name] = future
+
+        if not owner:
+            print("[Vectorizer] Waiting for in-flight ingestion")
+            return future.result()
+
+        try:
+            vector_store = self._load_or_build(file_path, store_name, progress)
+            vector_store_cache.put(store_name, vector_store)
+            self._add_to_corpus(file_path, vector_store)
+            future.set_result(vector_store)
             return vector_store
-            
         except Exception as e:
             print(f"[Vectorizer] Error processing file: {str(e)}")
-            raise Exception(f"Error processing file: {str(e)}")
+            error = Exception(f"Error processing file: {str(e)}")
+            future.set_exception(error)
+            raise error
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(store_name, None)
+
+    def _add_to_corpus(self, file_path: str, vector_store: FAISS) -> None:
+        """将文档的分块与向量加入全文库索引，失败不影响单文档问答"""
+        try:
+            corpus_index.add_document(
+                self.file_processor.file_digest(file_path),
+                vector_store,
+                os.path.relpath(file_path).replace(os.sep, "/")
+            )
+        except Exception as e:
+            print(f"[Vectorizer] Error adding document to corpus index: {str(e)}")
+
+    def _load_or_build(self, file_path: str, store_name: str,
+                       progress: Optional[Callable[[str, int], None]] = None) -> FAISS:
+        # 检查磁盘缓存
+        store_path = os.path.join(VECTOR_STORE_DIR, store_name)
+        if os.path.exists(store_path):
+            print("[Vectorizer] Loading from disk cache")
+            vector_store = self.load_vector_store(store_name)
+            if vector_store:
+                return vector_store
+
+        # 逐页解析文档并增量向量化
+        print("[Vectorizer] Loading document...")
+        return self.build_vector_store(self.file_processor.iter_pages(file_path), store_name, progress)
@@ -0,0 +1,252 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# 搜索后端：duckduckgo 或 fake（本地假数据，用于测试与基准测试）
+WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "duckduckgo")
+# 单个查询请求的超时与整次搜索的截止时间（秒），截止时仍未完成的查询结果被丢弃
+WEB_SEARCH_QUERY_TIMEOUT = float(os.getenv("WEB_SEARCH_QUERY_TIMEOUT", "6"))
+WEB_SEARCH_DEADLINE = float(os.getenv("WEB_SEARCH_DEADLINE", "8"))
+WEB_SEARCH_RESULTS_PER_QUERY = int(os.getenv("WEB_SEARCH_RESULTS_PER_QUERY", "4"))
+# 去重排序后写入提示的最大结果数
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "8"))
+WEB_SEARCH_WORKERS = int(os.getenv("WEB_SEARCH_WORKERS", "8"))
+# 查询结果缓存的有效期（秒）与条目数，TTL为0时不缓存
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "512"))
+
+# 倒数排序融合的平滑常数
+RRF_K = 60
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+def _result_key(result: Dict[str, str]) -> str:
+    """去重键：忽略协议、www前缀、末尾斜杠与锚点的URL，没有URL时使用摘要文本"""
+    url = result.get("url", "")
+    if url:
+        parts = urlsplit(url.lower())
+        host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+        return host + parts.path.rstrip("/") + ("?" + parts.query if parts.query else "")
+    return normalize_query(result.get("snippet", ""))
+
+class SearchBackend:
+    """搜索后端接口，search返回包含title、snippet、url的结果列表，timeout为单次请求的超时（秒）"""
+
+    name = "base"
+
+    def search(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+class DuckDuckGoBackend(SearchBackend):
+    name = "duckduckgo"
+
+    def search(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        # 首次搜索时才导入，未安装duckduckgo-search时不影响服务启动；
+        # 直接使用DDGS以便为每个查询的HTTP请求设置超时
+        from duckduckgo_search import DDGS
+        with DDGS(timeout=timeout or WEB_SEARCH_QUERY_TIMEOUT) as ddgs:
+            items = ddgs.text(query, region="wt-wt", safesearch="moderate", timelimit="y",
+                              max_results=max_results) or []
+        return [
+            {"title": item.get("title", ""), "snippet": item.get("body", ""), "url": item.get("href", "")}
+            for item in items
+        ]
+
+class FakeSearchBackend(SearchBackend):
+    """确定性的本地假搜索，可模拟网络延迟，不访问网络"""
+
+    name = "fake"
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, pool_size: int = 20):
+        self.delay = delay
+        self.jitter = jitter
+        self.pool_size = pool_size
+
+    def search(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        if self.delay or self.jitter:
+            delay = self.delay + random.random() * self.jitter
+            # 模拟请求超时：等待timeout后放弃
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"query timed out after {timeout}s")
+            time.sleep(delay)
+        words = normalize_query(query).split() or [""]
+        results = []
+        for i in range(max_results):
+            # 不同查询中相同的词映射到相同的页面，便于产生重复结果
+            word = words[i % len(words)]
+            page = int(hashlib.md5(f"{word}{i // len(words)}".encode("utf-8")).hexdigest(), 16) % self.pool_size
+            results.append({
+                "title": f"{word.title()} page {page}",
+                "snippet": f"An overview of {word} and related work (page {page}).",
+                "url": f"https://example.org/{word}/{page}",
+            })
+        return results
+
+SEARCH_BACKENDS = {
+    DuckDuckGoBackend.name: DuckDuckGoBackend,
+    FakeSearchBackend.name: FakeSearchBackend,
+}
+
+class WebSearcher:
+    """并发网络搜索
+
+    多个查询同时发出，每个查询的请求受query_timeout约束，超时或出错不影响其他查询，
+    整次搜索只等待到deadline为止。
+    结果按倒数排序融合（多个查询都返回的页面排名更高）并按URL去重，
+    每个查询的结果按规范化后的查询字符串缓存。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, backend: SearchBackend, query_timeout: float = WEB_SEARCH_QUERY_TIMEOUT,
+                 deadline: float = WEB_SEARCH_DEADLINE, cache_ttl: float = WEB_SEARCH_CACHE_TTL,
+                 cache_size: int = WEB_SEARCH_CACHE_SIZE, workers: int = WEB_SEARCH_WORKERS):
+        self.backend = backend
+        self.query_timeout = query_timeout
+        self.deadline = deadline
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="web-search")
+        self._lock = threading.Lock()
+        # 规范化查询 -> (写入时间, 结果)
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._stats = {"searches": 0, "queries": 0, "cache_hits": 0, "timeouts": 0, "errors": 0, "total_ms": 0.0}
+
+    @classmethod
+    def get_instance(cls) -> "WebSearcher":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    if WEB_SEARCH_BACKEND not in SEARCH_BACKENDS:
+                        raise ValueError(f"Unknown WEB_SEARCH_BACKEND: {WEB_SEARCH_BACKEND}")
+                    cls._instance = WebSearcher(SEARCH_BACKENDS[WEB_SEARCH_BACKEND]())
+        return cls._instance
+
+    def search(self, queries: List[str], results_per_query: int = WEB_SEARCH_RESULTS_PER_QUERY,
+               max_results: int = WEB_SEARCH_MAX_RESULTS) -> List[Dict[str, str]]:
+        """并发执行查询，返回去重并排序后的结果"""
+        started = time.monotonic()
+        per_query: Dict[int, List[Dict[str, str]]] = {}
+        futures = {}
+        for i, query in enumerate(queries):
+            cached = self._get_cached(query)
+            if cached is not None:
+                per_query[i] = cached
+            else:
+                futures[self._pool.submit(self.backend.search, query, results_per_query, self.query_timeout)] = i
+
+        if futures:
+            # 单个请求的超时由后端处理，这里只按整次搜索的截止时间等待
+            remaining = max(0.0, self.deadline - (time.monotonic() - started))
+            done, not_done = wait(futures, timeout=remaining)
+            for future in done:
+                i = futures[future]
+                try:
+                    per_query[i] = future.result()
+                    self._put_cached(queries[i], per_query[i])
+                except Exception as e:
+                    if isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower():
+                        self._count("timeouts")
+                        print(f"[WebSearcher] Search request timed out for query '{queries[i]}'")
+                    else:
+                        self._count("errors")
+                        print(f"[WebSearcher] Search error for query '{queries[i]}': {str(e)}")
+            for future in not_done:
+                # 已在运行的查询无法中断，本次丢弃其结果，完成后写入缓存供后续搜索使用
+                if not future.cancel():
+                    future.add_done_callback(self._cache_late_result(queries[futures[future]]))
+                self._count("timeouts")
+                print(f"[WebSearcher] Search deadline exceeded for query '{queries[futures[future]]}'")
+
+        results = self.rank([per_query[i] for i in sorted(per_query)], max_results)
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["queries"] += len(queries)
+            self._stats["total_ms"] += (time.monotonic() - started) * 1000
+        return results
+
+    @staticmethod
+    def rank(result_lists: List[List[Dict[str, str]]], max_results: int) -> List[Dict[str, str]]:
+        """倒数排序融合：结果得分为各查询中 1/(RRF_K+名次) 之和，按URL去重"""
+        scores: Dict[str, float] = {}
+        merged: Dict[str, Dict[str, str]] = {}
+        for results in result_lists:
+            for rank, result in enumerate(results):
+                key = _result_key(result)
+                if not key:
+                    continue
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                # 保留摘要最长的版本
+                if key not in merged or len(result.get("snippet", "")) > len(merged[key].get("snippet", "")):
+                    merged[key] = result
+        ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+        return [merged[key] for key in ordered[:max_results]]
+
+    @staticmethod
+    def format_results(results: List[Dict[str, str]]) -> str:
+        return "\n\n".join(
+            f"[{i}] {result.get('title', '')}\n{result.get('snippet', '')}\n{result.get('url', '')}".strip()
+            for i, result in enumerate(results, 1)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["backend"] = self.backend.name
+            stats["cached_queries"] = len(self._cache)
+        total_ms = stats.pop("total_ms")
+        stats["avg_ms"] = round(total_ms / stats["searches"], 2) if stats["searches"] else 0.0
+        lookups = stats["queries"]
+        stats["cache_hit_rate"] = round(stats["cache_hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _get_cached(self, query: str) -> Optional[List[Dict[str, str]]]:
+        if self.cache_ttl <= 0:
+            return None
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.cache_ttl:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return entry[1]
+
+    def _put_cached(self, query: str, results: List[Dict[str, str]]) -> None:
+        if self.cache_ttl <= 0:
+            return
+        key = normalize_query(query)
+        with self._lock:
+            self._cache[key] = (time.monotonic(), results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_late_result(self, query: str):
+        def _callback(future):
+            if not future.cancelled() and future.exception() is None:
+                self._put_cached(query, future.result())
+        return _callback
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+web_searcher = WebSearcher.get_instance()